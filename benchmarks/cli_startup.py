@@ -0,0 +1,77 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""
+Compare the time taken to parse lava command lines with the full argument
+parser tree and with the tree built for just the command's resource, and
+measure the wall time of starting the lava command.
+
+Usage: PYTHONPATH=. python benchmarks/cli_startup.py
+"""
+
+from __future__ import print_function
+
+import os
+import subprocess
+import sys
+import time
+import timeit
+
+from lavaclient import cli
+
+
+COMMANDS = (
+    ['flavors', 'list'],
+    ['clusters', 'list'],
+    ['clusters', 'create', 'name', 'stack'],
+    ['stacks', 'list'],
+)
+
+NUMBER = 50
+STARTUPS = 5
+
+
+def parse_time(argv, full):
+    def parse():
+        cli.parse_argv(argv, parser=cli.create_parser() if full else None)
+
+    return min(timeit.repeat(parse, number=NUMBER, repeat=3)) / NUMBER
+
+
+def startup_time():
+    """Best wall time of `lava --help`"""
+    environ = dict(os.environ, LAVA_NO_DAEMON='1')
+    times = []
+    with open(os.devnull, 'w') as devnull:
+        for _ in range(STARTUPS):
+            start = time.time()
+            subprocess.call([sys.executable, '-c',
+                             'from lavaclient.cli import main; main()',
+                             '--help'],
+                            stdout=devnull, env=environ)
+            times.append(time.time() - start)
+
+    return min(times)
+
+
+def main():
+    print('{0:<32}  {1:>10}  {2:>10}'.format('Command', 'Full', 'Lazy'))
+    for argv in COMMANDS:
+        print('{0:<32}  {1:>8.2f}ms  {2:>8.2f}ms'.format(
+            ' '.join(argv), 1000 * parse_time(argv, True),
+            1000 * parse_time(argv, False)))
+
+    print('\nlava --help: {0:.0f}ms'.format(1000 * startup_time()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,278 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""
+Benchmarks of the client's hot paths: response parsing, client injection,
+request marshaling, table rendering, argument parsing, and listing clusters
+over HTTP from a local fake API (see :mod:`lavaclient.fakeapi`) with each
+transport (see :mod:`lavaclient.transport`).
+
+Results are printed and, with --output, written as JSON; pass an earlier
+results file as --compare to show the change of each benchmark, e.g.
+
+    PYTHONPATH=. python benchmarks/suite.py --output before.json
+    git checkout my-branch
+    PYTHONPATH=. python benchmarks/suite.py --compare before.json
+
+Usage: PYTHONPATH=. python benchmarks/suite.py [--output FILE]
+           [--compare FILE] [--quick] [NAME ...]
+"""
+
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import timeit
+from copy import deepcopy
+
+from lavaclient import cli, util
+from lavaclient.client import Lava
+from lavaclient.api.clusters import ClustersResponse, ClusterCreateRequest
+from lavaclient.api.nodes import NodesResponse
+from lavaclient.api.response import Cluster, Node
+from lavaclient.fakeapi import FakeApi, FakeServer
+
+
+# Number of clusters, and of nodes per cluster, in generated payloads
+CLUSTERS = 1000
+NODES = 1000
+
+REPEAT = 5
+QUICK_REPEAT = 2
+
+# Regressions larger than this fraction are marked in comparisons
+THRESHOLD = 0.1
+
+BENCHMARKS = []
+
+
+def benchmark(number):
+    """Register a benchmark. The decorated function does any setup and
+    returns the function to time, which is called `number` times per
+    repetition, or a tuple of it and a function to clean up afterwards."""
+    def decorator(func):
+        BENCHMARKS.append((func.__name__, number, func))
+        return func
+    return decorator
+
+
+def _client():
+    return Lava('username', endpoint='http://localhost/v2/12345',
+                token='token')
+
+
+def _payload(path, clusters=1, nodes=1):
+    """JSON response of the fake API to a GET request; `{cluster_id}` in
+    the path is replaced by the ID of the first cluster"""
+    api = FakeApi(clusters=clusters, nodes=nodes, node_quota=10 ** 7)
+    path = path.format(cluster_id=api.cluster_ids[0] if clusters else None)
+    status, data = api.handle('GET', '/v2/12345/' + path,
+                              {'X-Auth-Token': api.issue_token()})
+    return data
+
+
+def _parsed(path, response_class, wrapper, **kwargs):
+    return _client().clusters._parse_response(
+        _payload(path, **kwargs), response_class, wrapper=wrapper)
+
+
+def _node_rows():
+    nodes = _parsed('clusters/{cluster_id}/nodes', NodesResponse, 'nodes',
+                    nodes=NODES - 1)
+    data, header = util.table_data(nodes, Node)
+    return [list(row) for row in data], header
+
+
+@benchmark(number=1)
+def parse_clusters():
+    client = _client()
+    data = _payload('clusters', clusters=CLUSTERS)
+    return lambda: client.clusters._parse_response(
+        deepcopy(data), ClustersResponse, wrapper='clusters')
+
+
+@benchmark(number=1)
+def parse_nodes():
+    client = _client()
+    data = _payload('clusters/{cluster_id}/nodes', nodes=NODES - 1)
+    return lambda: client.nodes._parse_response(
+        deepcopy(data), NodesResponse, wrapper='nodes')
+
+
+@benchmark(number=1)
+def inject_client():
+    client = _client()
+    response = ClustersResponse(_payload('clusters', clusters=CLUSTERS))
+    return lambda: util.inject_client(client, response)
+
+
+@benchmark(number=100)
+def marshal_cluster_create():
+    client = _client()
+    data = dict(name='cluster', username='username', ssh_keys=['mykey'],
+                stack_id='stack-0001',
+                node_groups=[dict(id='slave', count=10,
+                                  flavor_id='hadoop1-7')],
+                scripts=[dict(id='script-0001')],
+                credentials=[dict(type='cloud_files',
+                                  credential=dict(name='username'))])
+    return lambda: client.clusters._marshal_request(
+        data, ClusterCreateRequest, wrapper='cluster')
+
+
+@benchmark(number=1)
+def table_data_clusters():
+    clusters = _parsed('clusters', ClustersResponse, 'clusters',
+                       clusters=CLUSTERS)
+    return lambda: [list(row) for row in
+                    util.table_data(clusters, Cluster)[0]]
+
+
+@benchmark(number=1)
+def create_table_nodes():
+    rows, header = _node_rows()
+    return lambda: util.create_table(rows, header).get_string()
+
+
+@benchmark(number=1)
+def render_table_nodes():
+    rows, header = _node_rows()
+    return lambda: list(util.render_table(rows, header))
+
+
+@benchmark(number=20)
+def create_parser():
+    return cli.create_parser
+
+
+@benchmark(number=20)
+def parse_argv():
+    return lambda: cli.parse_argv(['clusters', 'list'])
+
+
+def _clusters_list_http(transport):
+    server = FakeServer(clusters=100).start()
+    client = server.client(token=server.api.issue_token(),
+                           transport=transport)
+    client.clusters.list()
+
+    def cleanup():
+        client.close()
+        server.stop()
+
+    return client.clusters.list, cleanup
+
+
+@benchmark(number=10)
+def clusters_list_http():
+    return _clusters_list_http('requests')
+
+
+@benchmark(number=10)
+def clusters_list_http_urllib3():
+    return _clusters_list_http('urllib3')
+
+
+@benchmark(number=10)
+def clusters_list_http_asyncio():
+    return _clusters_list_http('asyncio')
+
+
+def run(number, setup, repeat):
+    func, cleanup = setup(), None
+    if isinstance(func, tuple):
+        func, cleanup = func
+
+    try:
+        times = timeit.repeat(func, number=number, repeat=repeat)
+    finally:
+        if cleanup is not None:
+            cleanup()
+
+    per_call = [elapsed / number for elapsed in times]
+    return dict(min=min(per_call), mean=sum(per_call) / len(per_call),
+                number=number, repeat=repeat)
+
+
+def git_commit():
+    try:
+        with open(os.devnull, 'w') as devnull:
+            return subprocess.check_output(
+                ['git', 'rev-parse', 'HEAD'],
+                stderr=devnull).decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _format_time(seconds):
+    return '{0:>10.3f}ms'.format(1000 * seconds)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Run the lavaclient benchmark suite')
+    parser.add_argument('names', nargs='*', metavar='NAME',
+                        help='Run only benchmarks containing NAME')
+    parser.add_argument('--output', '-o', metavar='FILE',
+                        help='Write results as JSON to FILE')
+    parser.add_argument('--compare', '-c', metavar='FILE',
+                        help='Compare with results previously written to '
+                             'FILE')
+    parser.add_argument('--quick', action='store_true',
+                        help='Repeat each benchmark fewer times')
+    args = parser.parse_args(argv)
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['benchmarks']
+
+    repeat = QUICK_REPEAT if args.quick else REPEAT
+    results = {}
+
+    print('{0:<24}  {1:>12}  {2:>12}{3}'.format(
+        'Benchmark', 'Min', 'Mean', '  {0:>12}  {1:>7}'.format(
+            'Baseline', 'Change') if baseline else ''))
+    for name, number, setup in BENCHMARKS:
+        if args.names and not any(part in name for part in args.names):
+            continue
+
+        result = results[name] = run(number, setup, repeat)
+        line = '{0:<24}  {1}  {2}'.format(
+            name, _format_time(result['min']), _format_time(result['mean']))
+
+        if name in baseline:
+            old = baseline[name]['min']
+            change = result['min'] / old - 1
+            line += '  {0}  {1:>+6.0%}{2}'.format(
+                _format_time(old), change,
+                ' !' if change > THRESHOLD else '')
+        print(line)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(dict(commit=git_commit(),
+                           timestamp=time.time(),
+                           python=platform.python_version(),
+                           platform=platform.platform(),
+                           benchmarks=results),
+                      f, indent=2, sort_keys=True)
+            f.write('\n')
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,72 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""
+Compare the time taken to print large tables with PrettyTable (the old
+`print_titled(create_table(...))` path) and with `util.render_table`.
+
+Usage: PYTHONPATH=. python benchmarks/table_render.py [ROWS ...]
+"""
+
+from __future__ import print_function
+
+import os
+import sys
+import timeit
+from mock import patch
+
+from lavaclient import util
+
+
+DEFAULT_ROWS = (100, 1000, 10000)
+REPEAT = 3
+
+
+def make_rows(count):
+    return [['node-{0}'.format(index), index, index * 1.5,
+             'ACTIVE' if index % 3 else 'BUILDING']
+            for index in range(count)]
+
+
+HEADER = ('Name', 'ID', 'Size', 'Status')
+
+
+def prettytable_path(rows):
+    util.print_titled(util.create_table(rows, HEADER), title='Nodes')
+
+
+def streaming_path(rows):
+    util.print_table(rows, HEADER, title='Nodes')
+
+
+def best_time(func, rows, devnull):
+    with patch('sys.stdout', devnull):
+        return min(timeit.repeat(lambda: func(rows), number=1,
+                                 repeat=REPEAT))
+
+
+def main(argv=None):
+    counts = [int(arg) for arg in (argv or sys.argv[1:])] or DEFAULT_ROWS
+
+    print('{0:>8}  {1:>12}  {2:>12}  {3:>7}'.format(
+        'Rows', 'PrettyTable', 'Streaming', 'Speedup'))
+    with open(os.devnull, 'w') as devnull:
+        for count in counts:
+            rows = make_rows(count)
+            old = best_time(prettytable_path, rows, devnull)
+            new = best_time(streaming_path, rows, devnull)
+            print('{0:>8}  {1:>11.4f}s  {2:>11.4f}s  {3:>6.1f}x'.format(
+                count, old, new, old / new))
+
+
+if __name__ == '__main__':
+    main()
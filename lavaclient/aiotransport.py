@@ -0,0 +1,301 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""
+Transport that sends requests from an asyncio event loop running in a
+background thread, over kept-alive HTTP/1.1 connections. Requests from any
+number of threads share the loop, so many requests can be in flight without
+a connection or thread each. Requires Python 3.
+
+Written with protocol callbacks rather than coroutines, so that this module
+can be byte-compiled by Python 2 along with the rest of the package.
+"""
+
+import asyncio
+import concurrent.futures
+import logging
+import ssl
+import threading
+from six.moves.urllib.parse import urlsplit
+
+from lavaclient.log import NullHandler
+from lavaclient.transport import (Transport, TransportError,
+                                  TransportTimeout, Response, ca_bundle,
+                                  DEFAULT_POOL_SIZE)
+
+
+LOG = logging.getLogger(__name__)
+LOG.addHandler(NullHandler())
+
+
+class _HttpProtocol(asyncio.Protocol):
+
+    """One HTTP/1.1 connection, sending one request at a time"""
+
+    def __init__(self, transport, key):
+        self._transport = transport
+        self.key = key
+        self.connection = None
+        self.closed = False
+        self._future = None
+        self._method = None
+        self._buffer = b''
+
+    def connection_made(self, connection):
+        self.connection = connection
+
+    def request(self, method, target, host, headers, body, future):
+        self._method = method
+        self._future = future
+        self._buffer = b''
+
+        lines = ['{0} {1} HTTP/1.1'.format(method, target),
+                 'Host: {0}'.format(host),
+                 'Content-Length: {0}'.format(len(body or b'')),
+                 'Accept-Encoding: identity']
+        lines.extend('{0}: {1}'.format(name, value)
+                     for name, value in (headers or {}).items())
+        data = '\r\n'.join(lines).encode('latin-1') + b'\r\n\r\n'
+        self.connection.write(data + (body or b''))
+
+    def data_received(self, data):
+        self._buffer += data
+        self._parse(eof=False)
+
+    def eof_received(self):
+        self._parse(eof=True)
+
+    def connection_lost(self, exc):
+        self.closed = True
+        self._transport._discard(self)
+        if self._future is not None:
+            self._parse(eof=True)
+        if self._future is not None:
+            self._finish(exception=TransportError(
+                'Connection closed before a response was received', exc))
+
+    def _finish(self, response=None, exception=None, keep_alive=False):
+        future, self._future = self._future, None
+        if keep_alive:
+            self._transport._release(self)
+        elif self.connection is not None:
+            self.connection.close()
+
+        if future.done():
+            return
+        if exception is not None:
+            future.set_exception(exception)
+        else:
+            future.set_result(response)
+
+    def _parse(self, eof):
+        if self._future is None:
+            return
+
+        head, separator, rest = self._buffer.partition(b'\r\n\r\n')
+        if not separator:
+            return
+
+        lines = head.decode('latin-1').split('\r\n')
+        try:
+            version, status = lines[0].split(' ', 2)[:2]
+            status = int(status)
+        except ValueError:
+            self._finish(exception=TransportError(
+                'Invalid HTTP status line: {0!r}'.format(lines[0])))
+            return
+
+        headers = {}
+        for line in lines[1:]:
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        keep_alive = headers.get('connection', '').lower() != 'close' and \
+            version == 'HTTP/1.1'
+
+        if self._method == 'HEAD' or status in (204, 304) or \
+                100 <= status < 200:
+            body = b''
+        elif headers.get('transfer-encoding', '').lower() == 'chunked':
+            body = self._chunked(rest)
+            if body is None:
+                return
+        elif 'content-length' in headers:
+            length = int(headers['content-length'])
+            if len(rest) < length:
+                return
+            body = rest[:length]
+        elif eof:
+            body, keep_alive = rest, False
+        else:
+            return
+
+        self._finish(Response(status, headers, body), keep_alive=keep_alive)
+
+    @staticmethod
+    def _chunked(data):
+        """Decoded chunked body, or `None` if it is incomplete"""
+        body = []
+        while True:
+            line, separator, data = data.partition(b'\r\n')
+            if not separator:
+                return None
+
+            size = int(line.split(b';')[0], 16)
+            if size == 0:
+                return b''.join(body)
+            if len(data) < size + 2:
+                return None
+
+            body.append(data[:size])
+            data = data[size + 2:]
+
+
+class AsyncioTransport(Transport):
+
+    """
+    Transport sending requests from an asyncio event loop in a background
+    thread. :meth:`send` blocks the calling thread until the response
+    arrives; :meth:`submit` returns a `concurrent.futures.Future` instead.
+    The connect and read parts of a timeout are added up and limit the whole
+    request.
+
+    :param pool_size: Idle connections kept open to each host
+    """
+
+    def __init__(self, pool_size=DEFAULT_POOL_SIZE):
+        self.pool_size = pool_size
+        self._idle = {}
+        self._contexts = {}
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def submit(self, method, url, headers=None, body=None, verify=None,
+               timeout=None):
+        """Start sending a request from any thread
+
+        :returns: `concurrent.futures.Future` of the :class:`Response`
+        """
+        future = concurrent.futures.Future()
+        self._loop.call_soon_threadsafe(self._start, method, url, headers,
+                                        body, verify, timeout, future)
+        return future
+
+    def send(self, method, url, headers=None, body=None, verify=None,
+             timeout=None):
+        return self.submit(method, url, headers=headers, body=body,
+                           verify=verify, timeout=timeout).result()
+
+    def close(self):
+        if self._loop.is_closed():
+            return
+
+        self._loop.call_soon_threadsafe(self._close_idle)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+    # The methods below run in the event loop's thread
+
+    def _ssl_context(self, verify):
+        key = verify if isinstance(verify, str) else verify is not False
+        context = self._contexts.get(key)
+        if context is None:
+            context = ssl.create_default_context(
+                cafile=key if isinstance(key, str) else ca_bundle())
+            if key is False:
+                context.check_hostname = False
+                context.verify_mode = ssl.CERT_NONE
+            self._contexts[key] = context
+
+        return context
+
+    def _start(self, method, url, headers, body, verify, timeout, future):
+        if not future.set_running_or_notify_cancel():
+            return
+
+        # The protocol sending the request, once connected
+        sending = []
+
+        def expire():
+            if future.done():
+                return
+
+            future.set_exception(TransportTimeout(
+                'Request timed out after {0} seconds'.format(limit)))
+            if sending and sending[0]._future is future:
+                sending[0]._future = None
+                sending[0].connection.close()
+
+        if timeout is not None:
+            limit = sum(part for part in timeout if part is not None)
+            if limit:
+                self._loop.call_later(limit, expire)
+
+        parts = urlsplit(url)
+        secure = parts.scheme == 'https'
+        port = parts.port or (443 if secure else 80)
+        target = (parts.path or '/') + ('?' + parts.query if parts.query
+                                        else '')
+        key = (parts.scheme, parts.hostname, port,
+               verify if secure else None)
+
+        def send(protocol):
+            if future.done():
+                # Timed out while connecting
+                self._release(protocol)
+                return
+
+            sending.append(protocol)
+            protocol.request(method, target, parts.netloc, headers, body,
+                             future)
+
+        idle = self._idle.get(key)
+        while idle:
+            protocol = idle.pop()
+            if not protocol.closed:
+                send(protocol)
+                return
+
+        def connected(task):
+            try:
+                _, protocol = task.result()
+            except Exception as exc:
+                if not future.done():
+                    future.set_exception(TransportError(str(exc), exc))
+            else:
+                send(protocol)
+
+        connect = self._loop.create_task(self._loop.create_connection(
+            lambda: _HttpProtocol(self, key), parts.hostname, port,
+            ssl=self._ssl_context(verify) if secure else None))
+        connect.add_done_callback(connected)
+
+    def _release(self, protocol):
+        idle = self._idle.setdefault(protocol.key, [])
+        if len(idle) < self.pool_size:
+            idle.append(protocol)
+        else:
+            protocol.connection.close()
+
+    def _discard(self, protocol):
+        idle = self._idle.get(protocol.key)
+        if idle and protocol in idle:
+            idle.remove(protocol)
+
+    def _close_idle(self):
+        idle, self._idle = self._idle, {}
+        for protocols in idle.values():
+            for protocol in protocols:
+                protocol.connection.close()
@@ -23,18 +23,25 @@ import time
 import sys
 import socket
 import os.path
+from copy import deepcopy
+from collections import namedtuple
 from getpass import getuser
-from datetime import datetime, timedelta
+from datetime import datetime
 from figgis import Config, ListField, Field, PropertyError, ValidationError
 
 from lavaclient.api import resource
-from lavaclient.api.response import Cluster, ClusterDetail, Node, ReprMixin
+from lavaclient.api.response import (Cluster, ClusterDetail, Node, ReprMixin,
+                                     CommandResult, TransferResult)
 from lavaclient import error
+from lavaclient import fleet
+from lavaclient import timeouts
 from lavaclient.validators import Length, Range, List
 from lavaclient.util import (CommandLine, argument, command, display_table,
                              coroutine, create_socks_proxy, expand, confirm,
                              display, create_ssh_tunnel, display_result,
-                             deprecation)
+                             deprecation, parallel_map, read_json,
+                             run_on_host, write_stream, scp_to_host,
+                             file_checksum, SCP_OPTIONS)
 from lavaclient.log import NullHandler
 
 
@@ -44,16 +51,97 @@ LOG.addHandler(NullHandler())
 
 WAIT_INTERVAL = 30
 MIN_INTERVAL = 10
+SSH_CONCURRENCY = 10
 
 IN_PROGRESS_STATES = frozenset([
     'BUILDING', 'BUILD', 'CONFIGURING', 'CONFIGURED', 'UPDATING', 'REBOOTING',
     'RESIZING', 'WAITING'])
 FINAL_STATES = frozenset(['ACTIVE', 'ERROR'])
 INVALID_USERNAMES = frozenset(['root'])
+DELETED_STATES = frozenset(['DELETED'])
 
 DEFAULT_SSH_KEY = '{0}@{1}'.format(getuser(), socket.gethostname())
 DEFAULT_SSH_PUBKEY = os.path.join('$HOME', '.ssh', 'id_rsa.pub')
 
+RECONCILE_EPILOG = """\
+FLEET
+
+The desired fleet must be a JSON string (or path to a file containing JSON
+data) with a list of clusters, each in the following format:
+
+    {"name": "my_cluster", "stack_id": "HADOOP_HDP2_2",
+     "node_groups": [{"id": "slave", "count": 3}],
+     "ssh_keys": ["mykey"], "username": "me"}
+
+Clusters are matched to existing clusters by name. Missing clusters are
+created, and node groups whose count differs are resized. Clusters whose stack
+or flavors differ are only recreated with --replace, and clusters that are not
+in the fleet are only deleted with --prune.
+"""
+
+
+BulkCreateResult = namedtuple('BulkCreateResult', ['spec', 'cluster', 'error'])
+
+
+class Footprint(namedtuple('Footprint', ['node_count', 'ram', 'vcpus',
+                                         'disk'])):
+    """Quota resources consumed by a cluster; see
+    :class:`~lavaclient.api.response.AbsoluteLimits`"""
+
+    def plus(self, other):
+        return Footprint(*(mine + theirs for mine, theirs in zip(self, other)))
+
+    def minus(self, other):
+        return Footprint(*(mine - theirs for mine, theirs in zip(self, other)))
+
+    def fits(self, available):
+        return all(needed <= have for needed, have in zip(self, available))
+
+    @classmethod
+    def from_limits(cls, limits, attr='remaining'):
+        """Footprint representing the remaining (or total) quota"""
+        return cls(*(getattr(getattr(limits, field), attr)
+                     for field in cls._fields))
+
+
+EMPTY_FOOTPRINT = Footprint(0, 0, 0, 0)
+
+
+class Topology(object):
+
+    """
+    Snapshot of a cluster's nodes, indexed by node name and by installed
+    component, used by the SSH, tunnel, and proxy methods
+
+    :param cluster: :class:`~lavaclient.api.response.ClusterDetail`
+    :param nodes: List of :class:`~lavaclient.api.response.Node`
+    """
+
+    def __init__(self, cluster, nodes):
+        self.cluster = cluster
+        self.nodes = nodes
+        self._by_name = dict((node.name.lower(), node) for node in nodes)
+
+        # The first node containing a component is the one used for it
+        self._by_component = {}
+        for node in nodes:
+            for component in node.components:
+                self._by_component.setdefault(component['name'].lower(),
+                                              node)
+
+    @property
+    def username(self):
+        return self.cluster.username
+
+    def node(self, node_name):
+        """Node with the given name (case insensitive), or `None`"""
+        return self._by_name.get(node_name.lower())
+
+    def component_node(self, component):
+        """First node containing the component (case insensitive), or
+        `None`"""
+        return self._by_component.get(component.lower())
+
 
 def natural_number(value):
     """Argparse type to force a non-negative integer value"""
@@ -256,34 +344,10 @@ class Resource(resource.Resource):
         else:
             return node_groups
 
-    def create(self, name, stack_id, username=None, ssh_keys=None,
-               user_scripts=None, node_groups=None, connectors=None,
-               wait=False, credentials=None):
-        """
-        Create a cluster
-
-        :param name: Cluster name
-        :param stack_id: Valid stack identifier
-        :param username: User to create on the cluster; defaults to local user
-        :param ssh_keys: List of SSH keys; if none is specified, it will use
-                         the key `user@hostname`, creating the key from
-                         `$HOME/.ssh/id_rsa.pub` if it doesn't exist.
-        :param node_groups: `dict` of `(node_group_id, attrs)` pairs, in which
-                            `attrs` is a `dict` of node group attributes.
-                            Instead of a `dict`, you may give a `list` of
-                            `dicts`, each containing the `id` key. Currently
-                            supported attributes are `flavor_id` and `count`
-        :param user_scripts: List of user script ID's; See
-                             :meth:`lavaclient.api.scripts.Resource.create`
-        :param credentials: List of credentials to use. Each item must be a
-                            dictionary of `(type, name)` pairs
-        :param connectors: List of connector credentials to use. Each item
-                           must be a dictionary of `(type, name)` pairs.
-                           Deprecated in favor of `credentials`
-        :param wait: If `True`, wait for the cluster to become active before
-                     returning
-        :returns: :class:`~lavaclient.api.response.ClusterDetail`
-        """
+    def _create_data(self, name, stack_id, username=None, ssh_keys=None,
+                     user_scripts=None, node_groups=None, connectors=None,
+                     credentials=None):
+        """Build the (marshaled) POST data for :meth:`create`"""
         if ssh_keys is None:
             ssh_keys = [DEFAULT_SSH_KEY]
         if username is None:
@@ -316,9 +380,134 @@ class Resource(resource.Resource):
                 cdata.append({'type': ctype, 'credential': {'name': name}})
             data.update(credentials=cdata)
 
-        request_data = self._marshal_request(
+        return self._marshal_request(
             data, ClusterCreateRequest, wrapper='cluster')
 
+    def _preflight_errors(self, data):
+        """Return a list of reasons why the cluster create request data would
+        be rejected, according to the client's cached catalog"""
+        catalog = self._client.catalog
+        problems = []
+
+        stack = catalog.stack(data['stack_id'])
+        if stack is None:
+            problems.append('Invalid stack: {0}'.format(data['stack_id']))
+        else:
+            flavors = catalog.flavors()
+            stack_groups = dict((group.id, group)
+                                for group in stack.node_groups)
+
+            for group in data.get('node_groups', []):
+                stack_group = stack_groups.get(group['id'])
+                if stack_group is None:
+                    problems.append('Invalid node group for stack {0}: '
+                                    '{1}'.format(stack.id, group['id']))
+                    continue
+
+                limits = stack_group.resource_limits
+                count = int(group.get('count', stack_group.count))
+                if not limits.min_count <= count <= limits.max_count:
+                    problems.append(
+                        'Node group {0} count must be between {1} and '
+                        '{2}'.format(group['id'], limits.min_count,
+                                     limits.max_count))
+
+                flavor_id = group.get('flavor_id', stack_group.flavor_id)
+                flavor = flavors.get(flavor_id)
+                if flavor is None:
+                    problems.append('Invalid flavor: {0}'.format(flavor_id))
+                elif flavor.ram < limits.min_ram:
+                    problems.append(
+                        'Flavor {0} does not have enough RAM for node group '
+                        '{1}'.format(flavor_id, group['id']))
+
+        if data.get('scripts'):
+            scripts = catalog.scripts()
+            problems.extend('Invalid user script: {0}'.format(script['id'])
+                            for script in data['scripts']
+                            if script['id'] not in scripts)
+
+        credentials = catalog.credentials()
+        ssh_keys = set(key.id for key in credentials.ssh_keys)
+        problems.extend('Invalid SSH key: {0}'.format(key)
+                        for key in data['ssh_keys'] if key not in ssh_keys)
+
+        for cred in data.get('credentials', []):
+            existing = getattr(credentials, cred['type'], None)
+            name = cred['credential']['name']
+            if existing is None:
+                problems.append('Invalid credential type: {0}'.format(
+                    cred['type']))
+            elif name not in set(item.id for item in existing):
+                problems.append('Invalid {0} credential: {1}'.format(
+                    cred['type'], name))
+
+        return problems
+
+    def validate(self, name, stack_id, username=None, ssh_keys=None,
+                 user_scripts=None, node_groups=None, connectors=None,
+                 credentials=None):
+        """
+        Check the arguments to :meth:`create` without sending the create
+        request. The stack, node groups, flavors, user scripts, SSH keys, and
+        credentials are checked against data cached in
+        :attr:`~lavaclient.Lava.catalog`, so validating many clusters only
+        costs a handful of API requests.
+
+        :raises: :class:`~lavaclient.error.InvalidError` describing every
+                 problem found
+        """
+        data = self._create_data(name, stack_id, username=username,
+                                 ssh_keys=ssh_keys, user_scripts=user_scripts,
+                                 node_groups=node_groups,
+                                 connectors=connectors,
+                                 credentials=credentials)
+        problems = self._preflight_errors(data['cluster'])
+        if problems:
+            raise error.InvalidError('Invalid cluster {0}: {1}'.format(
+                name, '; '.join(problems)))
+
+    def create(self, name, stack_id, username=None, ssh_keys=None,
+               user_scripts=None, node_groups=None, connectors=None,
+               wait=False, credentials=None, validate=False):
+        """
+        Create a cluster
+
+        :param name: Cluster name
+        :param stack_id: Valid stack identifier
+        :param username: User to create on the cluster; defaults to local user
+        :param ssh_keys: List of SSH keys; if none is specified, it will use
+                         the key `user@hostname`, creating the key from
+                         `$HOME/.ssh/id_rsa.pub` if it doesn't exist.
+        :param node_groups: `dict` of `(node_group_id, attrs)` pairs, in which
+                            `attrs` is a `dict` of node group attributes.
+                            Instead of a `dict`, you may give a `list` of
+                            `dicts`, each containing the `id` key. Currently
+                            supported attributes are `flavor_id` and `count`
+        :param user_scripts: List of user script ID's; See
+                             :meth:`lavaclient.api.scripts.Resource.create`
+        :param credentials: List of credentials to use. Each item must be a
+                            dictionary of `(type, name)` pairs
+        :param connectors: List of connector credentials to use. Each item
+                           must be a dictionary of `(type, name)` pairs.
+                           Deprecated in favor of `credentials`
+        :param wait: If `True`, wait for the cluster to become active before
+                     returning
+        :param validate: If `True`, check the request against cached catalog
+                         data before sending it; see :meth:`validate`
+        :returns: :class:`~lavaclient.api.response.ClusterDetail`
+        """
+        request_data = self._create_data(
+            name, stack_id, username=username, ssh_keys=ssh_keys,
+            user_scripts=user_scripts, node_groups=node_groups,
+            connectors=connectors, credentials=credentials)
+
+        if validate:
+            problems = self._preflight_errors(request_data['cluster'])
+            if problems:
+                raise error.InvalidError('Invalid cluster {0}: {1}'.format(
+                    name, '; '.join(problems)))
+
         cluster = self._parse_response(
             self._client._post('clusters', json=request_data),
             ClusterResponse,
@@ -329,6 +518,214 @@ class Resource(resource.Resource):
 
         return cluster
 
+    def _footprint(self, spec):
+        """Compute the quota footprint of a `create` call, filling in node
+        group counts and flavors from the stack defaults"""
+        catalog = self._client.catalog
+        stack = catalog.stack(spec['stack_id'])
+        if stack is None:
+            raise error.InvalidError(
+                'Invalid stack: {0}'.format(spec['stack_id']))
+
+        overrides = dict(
+            (group['id'], group) for group in
+            self._gather_node_groups(deepcopy(spec.get('node_groups')) or []))
+
+        unknown = set(overrides) - set(group.id for group in
+                                       stack.node_groups)
+        if unknown:
+            raise error.InvalidError(
+                'Invalid node groups for stack {0}: {1}'.format(
+                    stack.id, ', '.join(sorted(unknown))))
+
+        flavors = catalog.flavors()
+        total = EMPTY_FOOTPRINT
+        for group in stack.node_groups:
+            override = overrides.get(group.id, {})
+            count = int(override.get('count', group.count))
+            flavor_id = override.get('flavor_id', group.flavor_id)
+
+            try:
+                flavor = flavors[flavor_id]
+            except KeyError:
+                raise error.InvalidError(
+                    'Invalid flavor: {0}'.format(flavor_id))
+
+            total = total.plus(Footprint(count, count * flavor.ram,
+                                         count * flavor.vcpus,
+                                         count * flavor.disk))
+
+        return total
+
+    def create_many(self, specs, concurrency=None, interval=None,
+                    timeout=None, validate=True):
+        """
+        Create multiple clusters, only submitting as many creations as the
+        tenant's remaining quota (see
+        :meth:`~lavaclient.api.limits.Resource.get`) allows. Specs that do not
+        fit are queued until clusters created here become ACTIVE (or fail, or
+        are deleted), after which the quota is re-read. Specs whose footprint
+        can never fit fail without being sent to the API.
+
+        :param specs: List of `dicts`, each containing keyword arguments to
+                      :meth:`create`, e.g. `name`, `stack_id`, and
+                      `node_groups`. `wait` is not allowed.
+        :param concurrency: Maximum number of clusters being built at once
+                            (default: limited only by quota)
+        :param interval: Poll interval (in seconds) while waiting for
+                         clusters to finish building
+        :param timeout: Overall timeout in minutes (default: no timeout)
+        :param validate: If `True`, check each spec with :meth:`validate`
+                         before queueing it
+        :returns: List of :class:`BulkCreateResult` `(spec, cluster, error)`
+                  tuples in the same order as `specs`; `cluster` is the last
+                  known :class:`~lavaclient.api.response.ClusterDetail` and
+                  `error` is the :class:`~lavaclient.error.LavaError`
+                  encountered, if any
+        """
+        if any('wait' in spec for spec in specs):
+            raise error.InvalidError('wait is not allowed in create_many')
+
+        interval = max(MIN_INTERVAL, WAIT_INTERVAL if interval is None
+                       else interval)
+
+        # Each request is limited to the time left, too
+        with timeouts.deadline(timeout * 60 if timeout else None) as limit:
+            return self._create_many(specs, concurrency, interval, limit,
+                                     validate)
+
+    def _create_many(self, specs, concurrency, interval, limit, validate):
+        """Implementation of :meth:`create_many`, finishing before the
+        deadline `limit` is near"""
+
+        clusters = [None] * len(specs)
+        errors = [None] * len(specs)
+
+        footprints = [None] * len(specs)
+        for index, spec in enumerate(specs):
+            try:
+                if validate:
+                    self.validate(**spec)
+                footprints[index] = self._footprint(spec)
+            except error.LavaError as exc:
+                errors[index] = exc
+            except (TypeError, KeyError) as exc:
+                # Missing or unknown keyword arguments to create
+                errors[index] = error.InvalidError(
+                    'Invalid cluster spec {0}: {1}'.format(
+                        spec.get('name', '#{0}'.format(index + 1)), exc))
+
+        def submit(index):
+            try:
+                return self.create(**specs[index])
+            except TypeError as exc:
+                six.raise_from(error.InvalidError(
+                    'Invalid cluster spec {0}: {1}'.format(
+                        specs[index].get('name'), exc)), exc)
+
+        queue = [index for index, footprint in enumerate(footprints)
+                 if footprint is not None]
+        in_flight = {}
+
+        def expire():
+            for index in queue:
+                errors[index] = error.TimeoutError(
+                    'Cluster {0} was not submitted before timeout: '
+                    'insufficient quota'.format(specs[index].get('name')))
+            for index in in_flight.values():
+                errors[index] = error.TimeoutError(
+                    'Cluster did not become active before timeout')
+
+        limits = None
+
+        while queue or in_flight:
+            if queue:
+                if limits is None:
+                    limits = self._client.limits.get()
+
+                total = Footprint.from_limits(limits, 'limit')
+                for index in list(queue):
+                    if not footprints[index].fits(total):
+                        queue.remove(index)
+                        errors[index] = error.InvalidError(
+                            'Cluster {0} exceeds quota: {1}'.format(
+                                specs[index].get('name'), footprints[index]))
+
+                admitted = []
+                available = Footprint.from_limits(limits)
+                for index in queue:
+                    if concurrency and \
+                            len(in_flight) + len(admitted) >= concurrency:
+                        break
+
+                    if footprints[index].fits(available):
+                        admitted.append(index)
+                        available = available.minus(footprints[index])
+
+                if admitted:
+                    LOG.debug('Admitting clusters: %s', ', '.join(
+                        specs[index].get('name', '') for index in admitted))
+                    results = parallel_map(submit, admitted,
+                                           concurrency=concurrency)
+
+                    for index, (cluster, exc) in zip(admitted, results):
+                        queue.remove(index)
+                        if exc is not None:
+                            errors[index] = exc
+                        else:
+                            clusters[index] = cluster
+                            in_flight[cluster.id] = index
+
+                    # Server-side usage has changed
+                    limits = None
+                elif not in_flight:
+                    for index in queue:
+                        errors[index] = error.FailedError(
+                            'Insufficient quota for cluster {0}'.format(
+                                specs[index].get('name')))
+                    break
+
+            if not in_flight:
+                continue
+
+            if limit is not None and limit.remaining() <= interval:
+                expire()
+                break
+
+            time.sleep(interval)
+
+            try:
+                statuses = dict((cluster.id, cluster)
+                                for cluster in self.list())
+                for cluster_id, index in list(in_flight.items()):
+                    cluster = statuses.get(cluster_id)
+                    if cluster is None:
+                        errors[index] = error.FailedError(
+                            'Cluster {0} was deleted'.format(cluster_id))
+                    elif cluster.status in IN_PROGRESS_STATES:
+                        continue
+                    else:
+                        clusters[index] = self.get(cluster_id)
+                        if cluster.status != 'ACTIVE':
+                            errors[index] = error.FailedError(
+                                'Cluster status is {0}'.format(
+                                    cluster.status))
+
+                    del in_flight[cluster_id]
+                    limits = None
+            except error.TimeoutError as exc:
+                # A request that timed out before the deadline is an error of
+                # its own, not the end of the wait
+                if limit is None or not limit.expired:
+                    raise
+
+                LOG.debug('Polling timed out', exc_info=exc)
+                expire()
+                break
+
+        return [BulkCreateResult(spec, cluster, exc)
+                for spec, cluster, exc in zip(specs, clusters, errors)]
+
     @command(
         parser_options=dict(
             description='Resize an existing Lava cluster',
@@ -381,6 +778,7 @@ class Resource(resource.Resource):
                               json=request_data),
             ClusterResponse,
             wrapper='cluster')
+        self._client.catalog.invalidate_topology(cluster_id)
 
         if wait:
             return self.wait(cluster.id)
@@ -407,6 +805,7 @@ class Resource(resource.Resource):
         return DEFAULT_SSH_KEY
 
     @command(
+        interactive=True,
         parser_options=dict(
             description='Create a new Lava cluster',
         ),
@@ -449,17 +848,30 @@ class Resource(resource.Resource):
             action='store_true',
             help='Wait for the cluster to become active'
         ),
+        validate=argument(
+            action='store_true',
+            help='Check the stack, node groups, flavors, scripts, SSH keys, '
+                 'and credentials before sending the create request'
+        ),
     )
     @display_table(ClusterDetail)
     def _create(self, name, stack_id, username=None, ssh_keys=None,
                 user_scripts=None, node_groups=None, connectors=None,
-                wait=False, credentials=None):
+                wait=False, credentials=None, validate=False):
         """
         CLI-only; cluster create command
         """
         if ssh_keys is None:
             ssh_keys = [DEFAULT_SSH_KEY]
 
+        if validate and not self._args.headless and \
+                ssh_keys == [DEFAULT_SSH_KEY]:
+            catalog = self._client.catalog
+            if DEFAULT_SSH_KEY not in set(
+                    key.id for key in catalog.credentials().ssh_keys):
+                self._create_default_ssh_credential()
+                catalog.invalidate('credentials')
+
         try:
             return self.create(name,
                                stack_id,
@@ -469,7 +881,8 @@ class Resource(resource.Resource):
                                node_groups=node_groups,
                                connectors=connectors,
                                wait=wait,
-                               credentials=credentials)
+                               credentials=credentials,
+                               validate=validate)
         except error.RequestError as exc:
             if self._args.headless or not (
                     ssh_keys == [DEFAULT_SSH_KEY] and (
@@ -493,6 +906,7 @@ class Resource(resource.Resource):
                            credentials=credentials)
 
     @command(
+        interactive=True,
         parser_options=dict(
             description='Delete a cluster',
         ),
@@ -513,6 +927,8 @@ class Resource(resource.Resource):
         :returns: :class:`~lavaclient.api.response.ClusterDetail`
         """
         self._client._delete('clusters/' + six.text_type(cluster_id))
+        self._client.catalog.invalidate_topology(cluster_id)
+        self._client.tunnels.close_cluster(cluster_id)
 
     @coroutine
     def _cli_wait_printer(self, start):
@@ -563,30 +979,164 @@ class Resource(resource.Resource):
 
         interval = max(MIN_INTERVAL, interval)
 
-        delta = timedelta(minutes=timeout) if timeout else timedelta(days=365)
+        printer = self._cli_wait_printer(datetime.now())
+
+        # Each request is limited to the time left, too
+        with timeouts.deadline(timeout * 60 if timeout else None) as limit:
+            while limit is None or not limit.expired:
+                cluster = self.get(cluster_id)
+                printer.send(cluster)
+
+                if cluster.status == 'ACTIVE':
+                    return cluster
+                elif cluster.status not in IN_PROGRESS_STATES:
+                    raise error.FailedError(
+                        'Cluster status is {0}'.format(cluster.status))
+
+                if limit is not None and limit.remaining() <= interval:
+                    break
 
-        start = datetime.now()
-        timeout_date = start + delta
+                time.sleep(interval)
 
-        printer = self._cli_wait_printer(start)
+        raise error.TimeoutError(
+            'Cluster did not become active before timeout')
 
-        while datetime.now() < timeout_date:
-            cluster = self.get(cluster_id)
-            printer.send(cluster)
+    def wait_many(self, cluster_ids, timeout=None, interval=None,
+                  deleted=False):
+        """
+        Wait (blocking) for several clusters at once. Each poll makes a single
+        :meth:`list` request, regardless of the number of clusters.
 
-            if cluster.status == 'ACTIVE':
-                return cluster
-            elif cluster.status not in IN_PROGRESS_STATES:
-                raise error.FailedError(
-                    'Cluster status is {0}'.format(cluster.status))
+        :param cluster_ids: List of cluster IDs
+        :param timeout: Wait timeout in minutes (default: no timeout)
+        :param interval: Poll interval in seconds
+        :param deleted: Wait for the clusters to be deleted, rather than
+                        active
+        :returns: List of `(cluster, error)` pairs in the same order as
+                  `cluster_ids`. `cluster` is the final
+                  :class:`~lavaclient.api.response.ClusterDetail` (`None`
+                  when waiting for deletion), and `error` is the
+                  :class:`~lavaclient.error.LavaError` for clusters that
+                  failed or timed out.
+        :raises TimeoutError: if a request times out before the deadline
+        """
+        interval = max(MIN_INTERVAL, WAIT_INTERVAL if interval is None
+                       else interval)
+        pending = set(cluster_ids)
+        results = {}
+
+        # Each request is limited to the time left, too
+        with timeouts.deadline(timeout * 60 if timeout else None) as limit:
+            try:
+                self._poll_many(pending, results, interval, deleted, limit)
+            except error.TimeoutError as exc:
+                # A request that timed out before the deadline is an error of
+                # its own, not the end of the wait
+                if limit is None or not limit.expired:
+                    raise
+
+                LOG.debug('Polling timed out', exc_info=exc)
+
+        for cluster_id in pending:
+            results[cluster_id] = (None, error.TimeoutError(
+                'Cluster did not finish before timeout'))
+
+        return [results[cluster_id] for cluster_id in cluster_ids]
+
+    def _poll_many(self, pending, results, interval, deleted, limit):
+        """Poll the status of the clusters in `pending` until they finish or
+        the deadline `limit` is near, moving them to `results`"""
+        while pending:
+            statuses = dict((cluster.id, cluster) for cluster in self.list())
+
+            for cluster_id in list(pending):
+                cluster = statuses.get(cluster_id)
+                if deleted:
+                    if cluster is None or cluster.status in DELETED_STATES:
+                        results[cluster_id] = (None, None)
+                    elif cluster.status == 'ERROR':
+                        results[cluster_id] = (None, error.FailedError(
+                            'Cluster status is {0}'.format(cluster.status)))
+                    else:
+                        continue
+                elif cluster is None:
+                    results[cluster_id] = (None, error.FailedError(
+                        'Cluster {0} was deleted'.format(cluster_id)))
+                elif cluster.status in IN_PROGRESS_STATES:
+                    continue
+                elif cluster.status == 'ACTIVE':
+                    results[cluster_id] = (self.get(cluster_id), None)
+                else:
+                    results[cluster_id] = (
+                        self.get(cluster_id),
+                        error.FailedError('Cluster status is {0}'.format(
+                            cluster.status)))
+
+                pending.discard(cluster_id)
+
+            if not pending:
+                break
 
-            if datetime.now() + timedelta(seconds=interval) >= timeout_date:
+            if limit is not None and limit.remaining() <= interval:
                 break
 
             time.sleep(interval)
 
-        raise error.TimeoutError(
-            'Cluster did not become active before timeout')
+    def plan(self, desired, prune=False, replace=False, concurrency=None):
+        """
+        Compute the creates, resizes, and deletes needed to make the existing
+        clusters match a declarative description of the fleet, without
+        changing anything. See :func:`lavaclient.fleet.plan`.
+
+        :returns: :class:`lavaclient.fleet.Plan`
+        """
+        return fleet.plan(self, desired, prune=prune, replace=replace,
+                          concurrency=concurrency)
+
+    @command(
+        parser_options=dict(
+            description='Create, resize, and delete clusters to match a '
+                        'description of the desired fleet',
+            epilog=RECONCILE_EPILOG,
+        ),
+        desired=argument(type=read_json,
+                         help='JSON data string or path to file containing '
+                              'JSON data; see FLEET'),
+        prune=argument(action='store_true',
+                       help='Delete clusters that are not in the fleet'),
+        replace=argument(action='store_true',
+                         help='Recreate clusters whose stack or flavors '
+                              'differ'),
+        dry_run=argument(action='store_true',
+                         help='Only show the actions that would be taken'),
+        concurrency=argument(type=natural_number,
+                             help='Maximum number of concurrent operations'),
+        timeout=argument(type=natural_number,
+                         help='Overall timeout (in minutes)'),
+    )
+    @display(fleet.Report.display)
+    def reconcile(self, desired, prune=False, replace=False, dry_run=False,
+                  concurrency=None, timeout=None):
+        """
+        Create, resize, and delete clusters so that they match a declarative
+        description of the fleet. Independent operations run in parallel;
+        deletes and shrinking resizes finish before creates and growing
+        resizes start. See :func:`lavaclient.fleet.reconcile`.
+
+        :param desired: List of `dicts` of keyword arguments to
+                        :meth:`create`, or a `dict` of cluster name to
+                        keyword arguments
+        :param prune: Delete existing clusters that are not in `desired`
+        :param replace: Delete and recreate clusters whose stack or flavors
+                        differ
+        :param dry_run: Only compute the plan
+        :param concurrency: Maximum number of concurrent operations
+        :param timeout: Overall timeout in minutes
+        :returns: :class:`lavaclient.fleet.Report`
+        """
+        return fleet.reconcile(self, desired, prune=prune, replace=replace,
+                               dry_run=dry_run, concurrency=concurrency,
+                               timeout=timeout)
 
     @command(parser_options=dict(
         description='List all nodes in the cluster'
@@ -601,36 +1151,32 @@ class Resource(resource.Resource):
         """
         return self._client.nodes.list(cluster_id)
 
-    def _get_named_node(self, nodes, node_name=None, wait=False):
+    def _get_named_node(self, topology, node_name=None):
         if node_name is None:
-            return nodes[0]
+            return topology.nodes[0]
 
-        try:
-            return six.next(node for node in nodes
-                            if node.name.lower() == node_name.lower())
-        except StopIteration:
+        node = topology.node(node_name)
+        if node is None:
             raise error.InvalidError(
                 'Invalid node: {0}; available nodes are {1}'.format(
-                    node_name, ', '.join(node.name for node in nodes)))
+                    node_name, ', '.join(node.name
+                                         for node in topology.nodes)))
 
-    def _get_component_node(self, nodes, component, wait=False):
-        components_by_node = (
-            (node, (comp['name'].lower() for comp in node.components))
-            for node in nodes)
+        return node
 
-        try:
-            return six.next(node for node, components in components_by_node
-                            if component.lower() in components)
-        except StopIteration:
+    def _get_component_node(self, topology, component):
+        node = topology.component_node(component)
+        if node is None:
             raise error.InvalidError(
                 'Component {0} not found in cluster'.format(component))
 
-    def _cluster_nodes(self, cluster_id, wait=False):
+        return node
+
+    def _load_topology(self, cluster_id, wait=False):
         """
-        Return `(cluster, nodes)`, where `nodes` is a list of all non-Ambari
-        nodes in the cluster. If the cluster is not ACTIVE/ERROR and wait is
-        `True`, the function will block until it becomes active; otherwise, an
-        exception is thrown.
+        Return the :class:`Topology` of all non-Ambari nodes in the cluster.
+        If the cluster is not ACTIVE/ERROR and wait is `True`, the function
+        will block until it becomes active; otherwise, an exception is thrown.
         """
         cluster = self.get(cluster_id)
         status = cluster.status.upper()
@@ -643,13 +1189,26 @@ class Resource(resource.Resource):
             elif not wait:
                 raise error.InvalidError('Cluster is not yet active')
 
-            self.wait(cluster_id)
+            cluster = self.wait(cluster_id)
 
         nodes = [node for node in self.nodes(cluster_id)
                  if node.name.lower() != 'ambari']
-        return cluster, nodes
+        return Topology(cluster, nodes)
+
+    def _cluster_topology(self, cluster_id, wait=False):
+        """Return the cached :class:`Topology` of the cluster"""
+        return self._client.catalog.topology(cluster_id, wait=wait)
+
+    def _cluster_nodes(self, cluster_id, wait=False):
+        """
+        Return `(cluster, nodes)`, where `nodes` is a list of all non-Ambari
+        nodes in the cluster. See :meth:`_load_topology`.
+        """
+        topology = self._cluster_topology(cluster_id, wait=wait)
+        return topology.cluster, topology.nodes
 
     @command(
+        interactive=True,
         parser_options=dict(
             description='Create a SOCKS5 proxy over SSH to a node in the '
                         'cluster'
@@ -683,15 +1242,8 @@ class Resource(resource.Resource):
         if port is None:
             port = 12345
 
-        cluster, nodes = self._cluster_nodes(cluster_id, wait=wait)
-        ssh_node = self._get_named_node(nodes, node_name=node_name)
-
-        # Get a URL to test the proxy against
-        all_urls = itertools.chain.from_iterable(
-            [component['uri'] for component in node.components
-             if 'uri' in component and component['uri'].startswith('http')]
-            for node in nodes)
-        test_url = six.next(all_urls, None)
+        cluster, ssh_node, test_url = self._proxy_target(
+            cluster_id, node_name=node_name, wait=wait)
 
         printer = self._cli_printer(LOG)
         printer('Starting SOCKS proxy via node {0} ({1})'.format(
@@ -714,6 +1266,7 @@ class Resource(resource.Resource):
             printer('SOCKS proxy closed')
 
     @command(
+        interactive=True,
         parser_options=dict(
             description='SSH to a node in the cluster and optionally execute '
                         'a command'
@@ -732,22 +1285,26 @@ class Resource(resource.Resource):
         """
         Command-line only. SSH to the desired cluster node.
         """
-        output = self._execute_ssh(cluster_id, node_name=node_name,
-                                   ssh_command=ssh_command, wait=wait,
-                                   command=command)
         if command:
-            six.print_(output)
+            self.ssh_execute(cluster_id, node_name, command,
+                             ssh_command=ssh_command, wait=wait,
+                             output=sys.stdout)
+        else:
+            self._execute_ssh(cluster_id, node_name=node_name,
+                              ssh_command=ssh_command, wait=wait)
 
     def _execute_ssh(self, cluster_id, node_name=None, ssh_command=None,
                      wait=False, command=None):
-        cluster, nodes = self._cluster_nodes(cluster_id, wait=wait)
-        node = self._get_named_node(nodes, node_name=node_name)
+        topology = self._cluster_topology(cluster_id, wait=wait)
+        cluster = topology.cluster
+        node = self._get_named_node(topology, node_name=node_name)
 
         return node._ssh(cluster.username, command=command,
-                         ssh_command=ssh_command)
+                         ssh_command=ssh_command,
+                         multiplexer=self._client.ssh_multiplexer)
 
     def ssh_execute(self, cluster_id, node_name, command, ssh_command=None,
-                    wait=False):
+                    wait=False, output=None):
         """
         Execute a command over SSH to the specified node in the cluster.
 
@@ -759,13 +1316,388 @@ class Resource(resource.Resource):
                             (default: `'ssh'`)
         :param wait: If `True`, wait for the cluster to become active before
                      creating the proxy
-        :returns: The output of running the command
+        :param output: File object to which output is written as it arrives,
+                       instead of being collected in memory and returned
+        :returns: The output of running the command, or `None` if `output`
+                  was given
         """
+        if output is not None:
+            write_stream(self.ssh_stream(cluster_id, node_name, command,
+                                         ssh_command=ssh_command, wait=wait),
+                         output)
+            return None
+
         return self._execute_ssh(cluster_id, node_name=node_name,
                                  ssh_command=ssh_command, command=command,
                                  wait=wait)
 
+    def ssh_stream(self, cluster_id, node_name, command, ssh_command=None,
+                   wait=False, lines=True):
+        """
+        Execute a command over SSH to the specified node in the cluster,
+        yielding output as it arrives. Use this instead of
+        :meth:`ssh_execute` for commands with large output, e.g. `hdfs dfs
+        -cat`; a non-zero exit status raises
+        :class:`~lavaclient.error.FailedError` after the last of the output.
+
+        :param cluster_id: Cluster ID
+        :param node_name: Name of node on which to make the SSH connection. By
+                          default, use first available node.
+        :param command: Shell command to execute remotely
+        :param ssh_command: SSH shell command to execute locally
+                            (default: `'ssh'`)
+        :param wait: If `True`, wait for the cluster to become active first
+        :param lines: Yield lines if `True`, otherwise yield chunks of output
+                      as soon as they are available
+        :returns: Generator of `bytes`
+        """
+        topology = self._cluster_topology(cluster_id, wait=wait)
+        cluster = topology.cluster
+        node = self._get_named_node(topology, node_name=node_name)
+
+        return node.stream(cluster.username, command, ssh_command=ssh_command,
+                           multiplexer=self._client.ssh_multiplexer,
+                           lines=lines)
+
+    def _filter_nodes(self, nodes, node_group=None, component=None,
+                      node_filter=None):
+        if node_group is not None:
+            nodes = [node for node in nodes
+                     if node.node_group.lower() == node_group.lower()]
+        if component is not None:
+            nodes = [node for node in nodes
+                     if component.lower() in set(
+                         comp['name'].lower() for comp in node.components)]
+        if node_filter is not None:
+            nodes = [node for node in nodes if node_filter(node)]
+
+        return nodes
+
+    def ssh_execute_all(self, cluster_id, command, node_group=None,
+                        component=None, node_filter=None, concurrency=None,
+                        timeout=None, ssh_command=None, wait=False):
+        """
+        Execute a command over SSH on every node in the cluster (or a subset
+        of them) in parallel. A failure on one node does not stop the command
+        from running on the others.
+
+        :param cluster_id: Cluster ID
+        :param command: Shell command to execute remotely
+        :param node_group: Only run on nodes in this node group, e.g. `slave`
+        :param component: Only run on nodes with this component installed,
+                          e.g. `DataNode`
+        :param node_filter: Function that takes a
+                            :class:`~lavaclient.api.response.Node` and returns
+                            `True` if the command should run on it
+        :param concurrency: Maximum number of simultaneous SSH sessions
+                            (default: 10)
+        :param timeout: Per-node timeout in seconds, after which the ssh
+                        process is killed
+        :param ssh_command: SSH shell command to execute locally
+                            (default: `'ssh'`)
+        :param wait: If `True`, wait for the cluster to become active first
+        :returns: List of :class:`~lavaclient.api.response.CommandResult`
+                  objects, ordered by node name
+        """
+        cluster, nodes = self._cluster_nodes(cluster_id, wait=wait)
+        nodes = sorted(self._filter_nodes(nodes, node_group=node_group,
+                                          component=component,
+                                          node_filter=node_filter),
+                       key=lambda node: node.name)
+
+        multiplexer = self._client.ssh_multiplexer
+
+        def execute(node):
+            node_ssh_command = ssh_command
+            if multiplexer is not None:
+                node_ssh_command = multiplexer.command(
+                    cluster.username, node.public_ip, ssh_command)
+
+            return run_on_host(cluster.username, node.public_ip, command,
+                               ssh_command=node_ssh_command, timeout=timeout)
+
+        results = []
+        for node, (result, exc) in zip(nodes, parallel_map(
+                execute, nodes, concurrency=concurrency or SSH_CONCURRENCY)):
+            if exc is not None:
+                data = dict(node=node.name, returncode=None,
+                            output=six.text_type(exc))
+            else:
+                output = result.output
+                if isinstance(output, six.binary_type):
+                    output = output.decode('utf8', 'replace')
+                data = dict(node=node.name, returncode=result.returncode,
+                            output=output, timed_out=result.timed_out)
+
+            results.append(CommandResult(data))
+
+        return results
+
     @command(
+        parser_options=dict(
+            description='Execute a command over SSH on all nodes in the '
+                        'cluster in parallel'
+        ),
+        command=argument(help='Command to execute over SSH'),
+        node_group=argument(help='Only run on nodes in this node group'),
+        component=argument(help='Only run on nodes containing this '
+                                'component, e.g. DataNode'),
+        concurrency=argument(type=natural_number,
+                             help='Maximum number of simultaneous SSH '
+                                  'sessions'),
+        timeout=argument(type=natural_number,
+                         help='Per-node timeout (in seconds)'),
+        ssh_command=argument(help="SSH command (default: 'ssh')"),
+        wait=argument(action='store_true',
+                      help="Wait for cluster to become active (if it isn't "
+                           "already)"),
+    )
+    @display_table(CommandResult)
+    def _ssh_execute_all(self, cluster_id, command, node_group=None,
+                         component=None, concurrency=None, timeout=None,
+                         ssh_command=None, wait=False):
+        """
+        Command-line only. Execute a command on all nodes.
+        """
+        return self.ssh_execute_all(cluster_id, command,
+                                    node_group=node_group,
+                                    component=component,
+                                    concurrency=concurrency, timeout=timeout,
+                                    ssh_command=ssh_command, wait=wait)
+
+    def _remote_checksums(self, username, nodes, remote_path, ssh_command,
+                          concurrency, timeout):
+        """Return the SHA-256 checksum of `remote_path` on each node, or
+        `None` where it could not be read"""
+        multiplexer = self._client.ssh_multiplexer
+        command = 'sha256sum -- {0} 2>/dev/null'.format(
+            six.moves.shlex_quote(remote_path))
+
+        def checksum(node):
+            node_ssh_command = ssh_command
+            if multiplexer is not None:
+                node_ssh_command = multiplexer.command(
+                    username, node.public_ip, ssh_command)
+
+            result = run_on_host(username, node.public_ip, command,
+                                 ssh_command=node_ssh_command,
+                                 timeout=timeout)
+            if result.returncode != 0 or not result.output:
+                return None
+            return result.output.split()[0].decode('ascii', 'replace')
+
+        return [result for result, _ in parallel_map(
+            checksum, nodes, concurrency=concurrency)]
+
+    def distribute(self, cluster_id, local_path, remote_path,
+                   node_group=None, component=None, node_filter=None,
+                   relay=None, concurrency=None, timeout=None,
+                   ssh_command=None, scp_command=None, wait=False):
+        """
+        Copy a local file to the same path on many nodes in the cluster in
+        parallel. Nodes on which the file already exists with the same
+        SHA-256 checksum are skipped.
+
+        With `relay`, the file is uploaded once to the named node (e.g.
+        `gateway-1`), which then copies it to the other nodes over the
+        cluster's private network. This requires the cluster user on the
+        relay node to be able to SSH to the other nodes, whose host keys must
+        be known to it.
+
+        :param cluster_id: Cluster ID
+        :param local_path: Path of the local file
+        :param remote_path: Destination path on each node
+        :param node_group: Only copy to nodes in this node group
+        :param component: Only copy to nodes with this component installed
+        :param node_filter: Function that takes a
+                            :class:`~lavaclient.api.response.Node` and returns
+                            `True` if the file should be copied to it
+        :param relay: Name of the node through which to relay the file
+        :param concurrency: Maximum number of simultaneous copies
+                            (default: 10)
+        :param timeout: Per-node timeout in seconds
+        :param ssh_command: SSH shell command to execute locally
+                            (default: `'ssh'`)
+        :param scp_command: scp command to execute locally (default: `'scp'`)
+        :param wait: If `True`, wait for the cluster to become active first
+        :returns: List of :class:`~lavaclient.api.response.TransferResult`
+                  objects, ordered by node name
+        """
+        topology = self._cluster_topology(cluster_id, wait=wait)
+        username = topology.username
+        nodes = sorted(self._filter_nodes(topology.nodes,
+                                          node_group=node_group,
+                                          component=component,
+                                          node_filter=node_filter),
+                       key=lambda node: node.name)
+        gateway = None
+        if relay is not None:
+            gateway = self._get_named_node(topology, node_name=relay)
+
+        concurrency = concurrency or SSH_CONCURRENCY
+        multiplexer = self._client.ssh_multiplexer
+        local_checksum = file_checksum(local_path)
+
+        # The relay needs an up-to-date copy even if it isn't a target
+        names = set(node.name for node in nodes)
+        checked = nodes
+        if gateway is not None and gateway.name not in names:
+            checked = nodes + [gateway]
+
+        checksums = dict(
+            (node.name, checksum) for node, checksum in zip(
+                checked, self._remote_checksums(username, checked,
+                                                remote_path, ssh_command,
+                                                concurrency, timeout)))
+        outcomes = {}
+        for node in nodes:
+            if checksums[node.name] == local_checksum:
+                outcomes[node.name] = ('skipped', None)
+
+        def failure(result, exc):
+            if exc is not None:
+                return ('failed', six.text_type(exc))
+            elif result.timed_out:
+                return ('failed', u'Timed out')
+            elif result.returncode != 0:
+                output = result.output
+                if isinstance(output, six.binary_type):
+                    output = output.decode('utf8', 'replace')
+                return ('failed', output)
+            return None
+
+        def upload(node):
+            options = None
+            if multiplexer is not None:
+                options = multiplexer.options(username, node.public_ip,
+                                              ssh_command)
+            return scp_to_host(username, node.public_ip, local_path,
+                               remote_path, scp_command=scp_command,
+                               options=options, timeout=timeout)
+
+        targets = [node for node in nodes if node.name not in outcomes]
+
+        if gateway is not None and targets:
+            if checksums[gateway.name] != local_checksum:
+                LOG.debug('Uploading %s to relay node %s', local_path,
+                          gateway.name)
+                try:
+                    failed = failure(upload(gateway), None)
+                except OSError as exc:
+                    failed = failure(None, exc)
+
+                if failed is not None:
+                    # Nodes that were already up to date are still skipped
+                    for node in targets:
+                        outcomes[node.name] = failed
+                    targets = []
+
+            if gateway.name in names and gateway.name not in outcomes:
+                outcomes[gateway.name] = ('copied', None)
+            targets = [node for node in targets if node.name not in outcomes]
+
+            relay_ssh_command = ssh_command
+            if multiplexer is not None:
+                relay_ssh_command = multiplexer.command(
+                    username, gateway.public_ip, ssh_command)
+
+            def copy(node):
+                command = 'scp {0} -- {1} {2}'.format(
+                    ' '.join(SCP_OPTIONS),
+                    six.moves.shlex_quote(remote_path),
+                    six.moves.shlex_quote('{0}@{1}:{2}'.format(
+                        username, node.private_ip, remote_path)))
+                return run_on_host(username, gateway.public_ip, command,
+                                   ssh_command=relay_ssh_command,
+                                   timeout=timeout)
+        else:
+            copy = upload
+
+        for node, (result, exc) in zip(targets, parallel_map(
+                copy, targets, concurrency=concurrency)):
+            outcomes[node.name] = failure(result, exc) or ('copied', None)
+
+        return [TransferResult(node=node.name, status=outcomes[node.name][0],
+                               output=outcomes[node.name][1])
+                for node in nodes]
+
+    @command(
+        parser_options=dict(
+            description='Copy a local file to all nodes in the cluster in '
+                        'parallel'
+        ),
+        local_path=argument(help='Local file to copy'),
+        remote_path=argument(help='Destination path on each node'),
+        node_group=argument(help='Only copy to nodes in this node group'),
+        component=argument(help='Only copy to nodes containing this '
+                                'component, e.g. DataNode'),
+        relay=argument(help='Upload the file once to this node, e.g. '
+                            'gateway-1, and copy it to the other nodes from '
+                            'there'),
+        concurrency=argument(type=natural_number,
+                             help='Maximum number of simultaneous copies'),
+        timeout=argument(type=natural_number,
+                         help='Per-node timeout (in seconds)'),
+        ssh_command=argument(help="SSH command (default: 'ssh')"),
+        scp_command=argument(help="scp command (default: 'scp')"),
+        wait=argument(action='store_true',
+                      help="Wait for cluster to become active (if it isn't "
+                           "already)"),
+    )
+    @display_table(TransferResult)
+    def _distribute(self, cluster_id, local_path, remote_path,
+                    node_group=None, component=None, relay=None,
+                    concurrency=None, timeout=None, ssh_command=None,
+                    scp_command=None, wait=False):
+        """
+        Command-line only. Copy a file to all nodes.
+        """
+        return self.distribute(cluster_id, local_path, remote_path,
+                               node_group=node_group, component=component,
+                               relay=relay, concurrency=concurrency,
+                               timeout=timeout, ssh_command=ssh_command,
+                               scp_command=scp_command, wait=wait)
+
+    def _proxy_target(self, cluster_id, node_name=None, wait=False):
+        """Return the cluster, the node through which to create a SOCKS
+        proxy, and a URL with which to test the proxy"""
+        topology = self._cluster_topology(cluster_id, wait=wait)
+        cluster, nodes = topology.cluster, topology.nodes
+        ssh_node = self._get_named_node(topology, node_name=node_name)
+
+        # Get a URL to test the proxy against
+        all_urls = itertools.chain.from_iterable(
+            [component['uri'] for component in node.components
+             if 'uri' in component and component['uri'].startswith('http')]
+            for node in nodes)
+
+        return cluster, ssh_node, six.next(all_urls, None)
+
+    @staticmethod
+    def _check_tunnel_target(node_name, component):
+        if node_name and component:
+            raise error.InvalidError(
+                'node_name and component are mutually exclusive')
+        elif not (node_name or component):
+            raise error.InvalidError(
+                'One of node_name or component is required')
+
+    def _tunnel_target(self, cluster_id, node_name=None, component=None,
+                       wait=False):
+        """Return the cluster and the node to which to create a tunnel"""
+        self._check_tunnel_target(node_name, component)
+
+        topology = self._cluster_topology(cluster_id, wait=wait)
+
+        if component:
+            return topology.cluster, self._get_component_node(topology,
+                                                              component)
+
+        return topology.cluster, self._get_named_node(topology,
+                                                      node_name=node_name)
+
+    @command(
+        interactive=True,
         parser_options=dict(description='Create SSH tunnel'),
         local_port=argument(type=int,
                             help='Port to which to bind on localhost'),
@@ -804,19 +1736,8 @@ class Resource(resource.Resource):
         :returns: :py:class:`~subprocess.Popen` object representing the SSH
                   connection.
         """
-        if node_name and component:
-            raise error.InvalidError(
-                'node_name and component are mutually exclusive')
-        elif not (node_name or component):
-            raise error.InvalidError(
-                'One of node_name or component is required')
-
-        cluster, nodes = self._cluster_nodes(cluster_id, wait=wait)
-
-        if component:
-            ssh_node = self._get_component_node(nodes, component)
-        else:
-            ssh_node = self._get_named_node(nodes, node_name=node_name)
+        cluster, ssh_node = self._tunnel_target(
+            cluster_id, node_name=node_name, component=component, wait=wait)
 
         printer = self._cli_printer(LOG)
         printer('Starting SSH tunnel from localhost:{0} to {1}:{2} '
@@ -278,6 +278,7 @@ class Resource(resource.Resource):
         return resp.s3
 
     @command(
+        interactive=True,
         parser_options=dict(
             description='Add credentials for Ambari'
         ),
@@ -405,6 +406,7 @@ class Resource(resource.Resource):
         return resp.s3
 
     @command(
+        interactive=True,
         parser_options=dict(
             description='Update credentials for Ambari'
         ),
@@ -441,6 +443,7 @@ class Resource(resource.Resource):
         return resp.ambari
 
     @command(
+        interactive=True,
         parser_options=dict(description='Delete an SSH key'),
         name=argument(help='SSH key name')
     )
@@ -459,6 +462,7 @@ class Resource(resource.Resource):
         self._client._delete('credentials/ssh_keys/{0}'.format(name))
 
     @command(
+        interactive=True,
         parser_options=dict(description='Delete a Cloud Files credential'),
         username=argument(help='Cloud Files username')
     )
@@ -477,6 +481,7 @@ class Resource(resource.Resource):
         self._client._delete('credentials/cloud_files/{0}'.format(username))
 
     @command(
+        interactive=True,
         parser_options=dict(description='Delete Amazon S3 credential'),
         access_key_id=argument(help='Amazon S3 access key id')
     )
@@ -495,6 +500,7 @@ class Resource(resource.Resource):
         self._client._delete('credentials/s3/{0}'.format(access_key_id))
 
     @command(
+        interactive=True,
         parser_options=dict(description='Delete Ambari credential'),
         username=argument(help='Ambari username')
     )
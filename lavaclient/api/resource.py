@@ -14,7 +14,7 @@ import logging
 import figgis
 import six
 
-from lavaclient import error
+from lavaclient import error, metrics
 from lavaclient.log import NullHandler
 from lavaclient.util import inject_client
 
@@ -66,7 +66,8 @@ class Resource(object):
                 response_class.__name__, wrapper))
 
         try:
-            response = inject_client(self._client, response_class(data))
+            with metrics.phase('parse'):
+                response = inject_client(self._client, response_class(data))
             return response if wrapper is None else response.get(wrapper)
         except (figgis.PropertyError, figgis.ValidationError) as exc:
             msg = 'Invalid response: {0}'.format(exc)
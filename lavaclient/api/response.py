@@ -21,7 +21,8 @@ from datetime import datetime
 
 from lavaclient.validators import Length, Range
 from lavaclient.util import (display_result, prettify, _prettify, ssh_to_host,
-                             print_table, no_nulls)
+                             print_table, no_nulls, stream_from_host,
+                             write_stream)
 from lavaclient.log import NullHandler
 from lavaclient import error
 
@@ -146,7 +147,8 @@ class Node(Config, ReprMixin):
         except IndexError:
             return None
 
-    def _ssh(self, username, command=None, ssh_command=None):
+    def _ssh(self, username, command=None, ssh_command=None,
+             multiplexer=None):
         """
         SSH to this node, optionally running a command and returning the
         output.
@@ -155,18 +157,25 @@ class Node(Config, ReprMixin):
         :param command: Command to execute remotely
         :param ssh_command: ssh command string or `list`, e.g.
                             `ssh -F configfile`
+        :param multiplexer: :class:`~lavaclient.ssh.Multiplexer` through which
+                            to reuse an existing connection to this node
         :returns: Output from running command, if a command was specified
         """
+        if multiplexer is not None:
+            ssh_command = multiplexer.command(username, self.public_ip,
+                                              ssh_command)
+
         try:
             return ssh_to_host(username, self.public_ip, command=command,
                                ssh_command=ssh_command)
         except subprocess.CalledProcessError as exc:
-            msg = 'Command failed with code %d', exc.returncode
+            msg = 'Command failed with code {0}'.format(exc.returncode)
             LOG.error(msg)
             LOG.debug('Command output:\n%s', exc.output)
             raise error.FailedError(msg)
 
-    def execute(self, username, command, ssh_command=None):
+    def execute(self, username, command, ssh_command=None, multiplexer=None,
+                output=None):
         """
         Execute a command remotely on this node, returning the output.
 
@@ -174,9 +183,78 @@ class Node(Config, ReprMixin):
         :param command: Command to execute remotely
         :param ssh_command: ssh command string or `list`, e.g.
                             `ssh -F configfile`
-        :returns: Output from running command
+        :param multiplexer: :class:`~lavaclient.ssh.Multiplexer` through which
+                            to reuse an existing connection to this node, e.g.
+                            `client.ssh_multiplexer`
+        :param output: File object to which output is written as it arrives,
+                       instead of being returned
+        :returns: Output from running command, or `None` if `output` was
+                  given
+        """
+        if output is not None:
+            write_stream(self.stream(username, command,
+                                     ssh_command=ssh_command,
+                                     multiplexer=multiplexer), output)
+            return None
+
+        return self._ssh(username, command=command, ssh_command=ssh_command,
+                         multiplexer=multiplexer)
+
+    def stream(self, username, command, ssh_command=None, multiplexer=None,
+               lines=True):
+        """
+        Execute a command remotely on this node, yielding output as it
+        arrives. Memory use does not depend on the size of the output.
+
+        :param username: Login user
+        :param command: Command to execute remotely
+        :param ssh_command: ssh command string or `list`, e.g.
+                            `ssh -F configfile`
+        :param multiplexer: :class:`~lavaclient.ssh.Multiplexer` through which
+                            to reuse an existing connection to this node
+        :param lines: Yield lines if `True`, otherwise yield chunks of output
+                      as soon as they are available
+        :returns: Generator of `bytes`
         """
-        return self._ssh(username, command=command, ssh_command=ssh_command)
+        if multiplexer is not None:
+            ssh_command = multiplexer.command(username, self.public_ip,
+                                              ssh_command)
+
+        return stream_from_host(username, self.public_ip, command,
+                                ssh_command=ssh_command, lines=lines)
+
+
+class CommandResult(Config, ReprMixin):
+    """Result of running a command on a single node"""
+
+    table_columns = ('node', 'returncode', 'timed_out', 'output')
+    table_header = ('Node', 'Exit Code', 'Timed Out', 'Output')
+
+    node = Field(six.text_type, required=True, help='Node name')
+    returncode = Field(int, help='Exit code; `None` if ssh could not be run')
+    output = Field(six.text_type, help='Combined stdout and stderr')
+    timed_out = Field(bool, default=False)
+
+    @property
+    def succeeded(self):
+        return self.returncode == 0 and not self.timed_out
+
+
+class TransferResult(Config, ReprMixin):
+    """Result of copying a file to a single node"""
+
+    table_columns = ('node', 'status', 'output')
+    table_header = ('Node', 'Status', 'Output')
+
+    node = Field(six.text_type, required=True, help='Node name')
+    status = Field(six.text_type, required=True,
+                   help='`copied`, `skipped` (the file was already '
+                        'up to date), or `failed`')
+    output = Field(six.text_type, help='Error output, if the copy failed')
+
+    @property
+    def succeeded(self):
+        return self.status != 'failed'
 
 
 @prettify('components')
@@ -159,7 +159,7 @@ class Resource(resource.Resource):
             ScriptResponse,
             wrapper='script')
 
-    @command(parser_options=dict(
+    @command(interactive=True, parser_options=dict(
         description='Delete a cluster script',
     ))
     def _delete(self, script_id):
@@ -232,6 +232,7 @@ class Resource(resource.Resource):
             wrapper='stack')
 
     @command(
+        interactive=True,
         parser_options=dict(description='Delete a custom stack'),
         force=argument(action='store_true',
                        help='Do not show confirmation dialog'),
@@ -0,0 +1,417 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""
+Load generator that runs a weighted mix of API operations through one shared
+:class:`~lavaclient.Lava` client from many threads, and reports the
+throughput and latency percentiles of each operation.
+
+Run `lava-bench` or `python -m lavaclient.bench`; with `--fake`, the load is
+sent to an in-process :mod:`lavaclient.fakeapi` server instead of the real
+API.
+"""
+
+import argparse
+import json
+import logging
+import random
+import sys
+import threading
+import time
+import six
+from collections import deque
+
+from lavaclient import metrics
+from lavaclient.hedging import Hedging
+from lavaclient.log import NullHandler
+from lavaclient.timeouts import DEFAULT_TIMEOUT
+from lavaclient.transport import TRANSPORTS
+
+
+LOG = logging.getLogger(__name__)
+LOG.addHandler(NullHandler())
+
+
+DEFAULT_THREADS = 8
+DEFAULT_DURATION = 10
+
+# Read-only, so that it is safe to run against a real tenant
+DEFAULT_MIX = 'clusters.list=2,clusters.get=4,nodes.list=3,credentials.list=1'
+
+
+class _Skipped(Exception):
+    """Raised by an operation that has nothing to act on"""
+
+
+def _cluster_id(generator, rng):
+    if not generator.cluster_ids:
+        raise _Skipped()
+    return rng.choice(generator.cluster_ids)
+
+
+def _create_cluster(client, generator, rng):
+    if not generator.stack_id:
+        raise _Skipped()
+
+    cluster = client.clusters.create(
+        'lava-bench-{0}'.format(rng.randint(0, 10 ** 6)), generator.stack_id,
+        username='username', ssh_keys=generator.ssh_keys)
+    generator.created.append(cluster.id)
+
+
+def _delete_cluster(client, generator, rng):
+    try:
+        cluster_id = generator.created.popleft()
+    except IndexError:
+        raise _Skipped()
+    client.clusters.delete(cluster_id)
+
+
+OPERATIONS = {
+    'clusters.list': lambda client, generator, rng: client.clusters.list(),
+    'clusters.get': lambda client, generator, rng: client.clusters.get(
+        _cluster_id(generator, rng)),
+    'nodes.list': lambda client, generator, rng: client.nodes.list(
+        _cluster_id(generator, rng)),
+    'credentials.list':
+        lambda client, generator, rng: client.credentials.list(),
+    'clusters.create': _create_cluster,
+    'clusters.delete': _delete_cluster,
+}
+
+
+def parse_mix(value):
+    """
+    Parse an operation mix, e.g. `clusters.list=1,clusters.get=3`
+
+    :returns: `list` of (operation name, weight)
+    """
+    mix = []
+    for item in value.split(','):
+        name, _, weight = item.strip().partition('=')
+        if name not in OPERATIONS:
+            raise ValueError('Unknown operation {0}; choose from {1}'.format(
+                name, ', '.join(sorted(OPERATIONS))))
+
+        try:
+            mix.append((name, float(weight or 1)))
+        except ValueError:
+            raise ValueError('Invalid weight for {0}: {1}'.format(name,
+                                                                  weight))
+
+    if not any(weight > 0 for _, weight in mix):
+        raise ValueError('At least one operation needs a positive weight')
+
+    return mix
+
+
+class LoadGenerator(object):
+
+    """
+    Runs operations, chosen at random from a weighted mix, through one client
+    from several threads
+
+    :param client: :class:`~lavaclient.Lava` client shared by all threads
+    :param mix: `list` of (operation name, weight); see :func:`parse_mix`
+    :param threads: Number of threads
+    :param duration: Seconds to run for, if `operations` is not given
+    :param operations: Total number of operations to run
+    :param stack_id: Stack of clusters created by `clusters.create`
+    :param ssh_keys: SSH key names of clusters created by `clusters.create`
+    :param seed: Seed of the operation choices
+    """
+
+    def __init__(self, client, mix, threads=DEFAULT_THREADS,
+                 duration=DEFAULT_DURATION, operations=None, stack_id=None,
+                 ssh_keys=None, seed=0):
+        self.client = client
+        self.mix = mix
+        self.threads = threads
+        self.duration = duration
+        self.operations = operations
+        self.stack_id = stack_id
+        self.ssh_keys = ssh_keys or ['lava-bench']
+        self.seed = seed
+
+        self.cluster_ids = []
+        self.created = deque()
+        self._remaining = operations
+        self._lock = threading.Lock()
+
+    def _next(self, deadline):
+        """Whether a worker should run another operation"""
+        if self._remaining is None:
+            return time.time() < deadline
+
+        with self._lock:
+            self._remaining -= 1
+            return self._remaining >= 0
+
+    def _worker(self, index, deadline, samples):
+        rng = random.Random(self.seed + index)
+        names = [name for name, _ in self.mix]
+        total = sum(weight for _, weight in self.mix)
+
+        while self._next(deadline):
+            point = rng.uniform(0, total)
+            for name, weight in self.mix:
+                point -= weight
+                if point <= 0:
+                    break
+            else:
+                name = names[-1]
+
+            start = time.time()
+            try:
+                OPERATIONS[name](self.client, self, rng)
+            except _Skipped:
+                samples.append((name, None, None))
+                continue
+            except Exception as exc:
+                LOG.debug('%s failed', name, exc_info=exc)
+                samples.append((name, time.time() - start, exc))
+                continue
+
+            samples.append((name, time.time() - start, None))
+
+    def run(self):
+        """
+        Run the load
+
+        :returns: `dict` of results; see :meth:`summarize`
+        """
+        self.cluster_ids = [cluster.id for cluster in
+                            self.client.clusters.list()]
+
+        deadline = time.time() + self.duration
+        samples = [[] for _ in six.moves.range(self.threads)]
+        workers = [threading.Thread(target=self._worker,
+                                    args=(index, deadline, samples[index]))
+                   for index in six.moves.range(self.threads)]
+
+        start = time.time()
+        for worker in workers:
+            worker.daemon = True
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.time() - start
+
+        # Don't leave clusters created by the benchmark behind
+        while self.created:
+            cluster_id = self.created.popleft()
+            try:
+                self.client.clusters.delete(cluster_id)
+            except Exception as exc:
+                LOG.warning('Unable to delete cluster %s: %s', cluster_id,
+                            exc)
+
+        return self.summarize([sample for thread_samples in samples
+                               for sample in thread_samples], elapsed)
+
+    def summarize(self, samples, elapsed):
+        """
+        Summarize samples of (operation name, seconds, exception)
+
+        :returns: `dict` with the total `elapsed` seconds, `threads`, and, for
+                  each operation in `operations`, its `count`, `errors`,
+                  `skipped`, `throughput` in operations per second, and
+                  latency percentiles `p50`, `p95`, and `p99` in seconds
+        """
+        operations = {}
+        for name, _ in self.mix:
+            latencies = [seconds for sample_name, seconds, exc in samples
+                         if sample_name == name and seconds is not None]
+            errors = [exc for sample_name, _, exc in samples
+                      if sample_name == name and exc is not None]
+            operations[name] = dict(
+                count=len(latencies),
+                errors=len(errors),
+                first_error=str(errors[0]) if errors else None,
+                skipped=sum(1 for sample_name, seconds, _ in samples
+                            if sample_name == name and seconds is None),
+                throughput=len(latencies) / elapsed if elapsed else 0.0,
+                p50=metrics.percentile(latencies, 50),
+                p95=metrics.percentile(latencies, 95),
+                p99=metrics.percentile(latencies, 99))
+
+        count = sum(operation['count'] for operation in operations.values())
+        return dict(elapsed=elapsed,
+                    threads=self.threads,
+                    throughput=count / elapsed if elapsed else 0.0,
+                    requests=self.client.metrics.to_dict(),
+                    operations=operations)
+
+
+def _milliseconds(seconds):
+    return '-' if seconds is None else '{0:.1f}'.format(1000 * seconds)
+
+
+def print_results(results, file=None):
+    from lavaclient.util import render_table
+
+    operations = results['operations']
+    rows = [[name, operations[name]['count'], operations[name]['errors'],
+             '{0:.1f}'.format(operations[name]['throughput']),
+             _milliseconds(operations[name]['p50']),
+             _milliseconds(operations[name]['p95']),
+             _milliseconds(operations[name]['p99'])]
+            for name in sorted(operations)]
+
+    title = '{0} threads, {1:.1f}s, {2:.1f} operations/s'.format(
+        results['threads'], results['elapsed'], results['throughput'])
+    for line in render_table(rows, ['Operation', 'Count', 'Errors', 'Ops/s',
+                                    'p50 (ms)', 'p95 (ms)', 'p99 (ms)'],
+                             title=title):
+        six.print_(line, file=file)
+
+    for name in sorted(operations):
+        if operations[name]['first_error']:
+            six.print_('{0}: {1}'.format(name,
+                                         operations[name]['first_error']),
+                       file=sys.stderr)
+
+
+def create_parser():
+    parser = argparse.ArgumentParser(
+        prog='lava-bench',
+        description='Run a mix of API operations through one shared client '
+                    'from many threads, and report the throughput and '
+                    'latency percentiles of each operation')
+
+    load = parser.add_argument_group('Load')
+    load.add_argument('--mix', default=DEFAULT_MIX,
+                      help='Comma-separated operation=weight pairs; '
+                           'operations are {0} (default: {1})'.format(
+                               ', '.join(sorted(OPERATIONS)), DEFAULT_MIX))
+    load.add_argument('--threads', '-t', type=int, default=DEFAULT_THREADS,
+                      help='Number of threads (default: %(default)s)')
+    load.add_argument('--duration', type=float, default=DEFAULT_DURATION,
+                      help='Seconds to run for (default: %(default)s)')
+    load.add_argument('--operations', '-n', type=int,
+                      help='Run this many operations instead of running for '
+                           '--duration')
+    load.add_argument('--stack-id',
+                      help='Stack of clusters created by clusters.create')
+    load.add_argument('--ssh-key', action='append', dest='ssh_keys',
+                      help='SSH key of clusters created by clusters.create')
+    load.add_argument('--seed', type=int, default=0,
+                      help='Seed of the random operation choices')
+    load.add_argument('--transport', choices=sorted(TRANSPORTS),
+                      help='HTTP library used to send API requests; '
+                           'defaults to requests')
+    load.add_argument('--request-timeout', type=float, metavar='SECONDS',
+                      help='Timeout of each API request')
+    load.add_argument('--hedge', action='store_true',
+                      help='Send a duplicate of slow GET requests')
+    load.add_argument('--hedge-delay', type=float, metavar='SECONDS',
+                      help='Seconds before a GET request is hedged; '
+                           'defaults to the p95 of recent GET latencies')
+    load.add_argument('--json', action='store_true',
+                      help='Print results as JSON')
+
+    fake = parser.add_argument_group('Fake API')
+    fake.add_argument('--fake', action='store_true',
+                      help='Send the load to an in-process fake API instead '
+                           'of the real one')
+    fake.add_argument('--fake-clusters', type=int, default=100,
+                      help='Number of clusters of the fake API')
+    fake.add_argument('--fake-latency', type=float, default=0.0,
+                      help='Seconds added to each fake API response')
+    fake.add_argument('--fake-error-rate', type=float, default=0.0,
+                      help='Fraction of fake API requests that fail')
+
+    api = parser.add_argument_group('API')
+    api.add_argument('--endpoint', help='API endpoint URL')
+    api.add_argument('--token', help='Keystone auth token')
+    api.add_argument('--api-key', dest='lava_api_key',
+                     help='Keystone API key')
+    api.add_argument('--password', help='Keystone password')
+    api.add_argument('--user', help='Keystone username')
+    api.add_argument('--region', help='API region')
+    api.add_argument('--tenant', help='Tenant ID')
+    api.add_argument('--auth-url', help='Keystone endpoint URL')
+    api.add_argument('--insecure', '-k', action='store_false',
+                     dest='verify_ssl', default=None,
+                     help='Turn off SSL cert validation')
+
+    return parser
+
+
+def hedge_policy(args):
+    """Hedging policy of the client, or `None` unless --hedge is given"""
+    if not (args.hedge or args.hedge_delay):
+        return None
+
+    return Hedging(delay=args.hedge_delay)
+
+
+def main(argv=None):
+    """Entry point of `lava-bench`; returns the exit status"""
+    args = create_parser().parse_args(argv)
+
+    try:
+        mix = parse_mix(args.mix)
+    except ValueError as exc:
+        six.print_('ERROR: {0}'.format(exc), file=sys.stderr)
+        return 2
+
+    server = None
+    if args.fake:
+        from lavaclient.fakeapi import FakeServer
+
+        server = FakeServer(clusters=args.fake_clusters,
+                            latency=args.fake_latency,
+                            error_rate=args.fake_error_rate).start()
+        client = server.client(transport=args.transport,
+                               timeout=args.request_timeout or
+                               DEFAULT_TIMEOUT,
+                               hedge=hedge_policy(args))
+        stack_id = args.stack_id or server.api.stack_ids[0]
+    else:
+        from lavaclient.cli import client_options, has_credentials
+        from lavaclient.client import Lava
+
+        options = client_options(args)
+        if not has_credentials(options):
+            six.print_('ERROR: An API key, password, or token is required, '
+                       'or use --fake', file=sys.stderr)
+            return 2
+        if not args.stack_id and any(name == 'clusters.create' and weight
+                                     for name, weight in mix):
+            six.print_('ERROR: --stack-id is required for clusters.create',
+                       file=sys.stderr)
+            return 2
+
+        client = Lava(hedge=hedge_policy(args), **options)
+        stack_id = args.stack_id
+
+    try:
+        results = LoadGenerator(
+            client, mix, threads=args.threads, duration=args.duration,
+            operations=args.operations, stack_id=stack_id,
+            ssh_keys=args.ssh_keys, seed=args.seed).run()
+    finally:
+        client.close()
+        if server is not None:
+            server.stop()
+
+    if args.json:
+        six.print_(json.dumps(results, indent=2, sort_keys=True))
+    else:
+        print_results(results)
+
+    return 0
+
+
+if __name__ == '__main__':  # pragma: nocover
+    sys.exit(main())
@@ -0,0 +1,200 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""
+Transports that record API requests and responses to a cassette file, and
+replay them later without touching the API, e.g. to profile parsing and
+rendering of production-sized responses offline::
+
+    lava = Lava(..., transport=RecordingTransport('clusters.jsonl.gz'))
+    lava.clusters.list()
+
+    lava = Lava('username', token='token', endpoint='http://replay/v2/x',
+                transport=ReplayTransport('clusters.jsonl.gz'))
+    lava.clusters.list()
+
+Cassettes have one JSON object per line, and are gzip-compressed if their
+name ends with `.gz`. Authentication tokens are never recorded, and the
+values of secret fields, such as passwords, API keys, and S3 secret keys, are
+replaced with `REDACTED`. Paths are recorded relative to the tenant's
+endpoint, so a cassette may be replayed with any endpoint.
+"""
+
+import gzip
+import json
+import logging
+import re
+import threading
+import time
+import six
+from collections import defaultdict, deque
+from contextlib import closing
+from six.moves.urllib.parse import urlsplit
+
+from lavaclient import error
+from lavaclient.log import NullHandler
+from lavaclient.transport import Transport, Response, get_transport
+
+
+LOG = logging.getLogger(__name__)
+LOG.addHandler(NullHandler())
+
+
+# Fields of request and response bodies whose values are not recorded
+SECRET_FIELDS = frozenset([
+    'api_key',
+    'apiKey',
+    'password',
+    'access_secret_key',
+    'token',
+])
+
+REDACTED = 'REDACTED'
+
+
+def scrub(data):
+    """Copy of JSON data with the values of secret fields redacted"""
+    if isinstance(data, dict):
+        return dict((key, REDACTED if key in SECRET_FIELDS else scrub(value))
+                    for key, value in data.items())
+    elif isinstance(data, list):
+        return [scrub(item) for item in data]
+
+    return data
+
+
+def _relative_path(url):
+    """Path of a request URL relative to the tenant endpoint, i.e. without
+    `/v2/<tenant_id>/`, including any query string"""
+    parts = urlsplit(url)
+    match = re.match(r'/v2/[^/]+/(.*)$', parts.path)
+    path = match.group(1) if match else parts.path.lstrip('/')
+    return path + ('?' + parts.query if parts.query else '')
+
+
+def _open(path, mode):
+    if path.endswith('.gz'):
+        return gzip.open(path, mode)
+    return open(path, mode)
+
+
+def load(path):
+    """`list` of the interactions recorded in a cassette"""
+    with closing(_open(path, 'rb')) as f:
+        return [json.loads(line.decode('utf8')) for line in f
+                if line.strip()]
+
+
+class RecordingTransport(Transport):
+
+    """
+    Transport that sends requests with another transport and appends each
+    request and response to a cassette
+
+    :param path: Cassette file; created if needed, otherwise appended to
+    :param transport: Transport sending the requests, or its name; see
+                      :func:`lavaclient.transport.get_transport`
+    """
+
+    def __init__(self, path, transport=None):
+        self.path = path
+        self.transport = get_transport(transport)
+        self._lock = threading.Lock()
+
+    def send(self, method, url, headers=None, body=None, verify=None,
+             timeout=None):
+        start = time.time()
+        resp = self.transport.send(method, url, headers=headers, body=body,
+                                   verify=verify, timeout=timeout)
+        elapsed = time.time() - start
+
+        interaction = dict(method=method.upper(), path=_relative_path(url),
+                           status=resp.status,
+                           elapsed=round(elapsed, 6),
+                           content_type=resp.headers.get('content-type'))
+
+        if body is not None:
+            text = body.decode('utf8', 'replace') \
+                if isinstance(body, six.binary_type) else body
+            try:
+                interaction['request'] = scrub(json.loads(text))
+            except ValueError:
+                interaction['request'] = text
+
+        try:
+            interaction['json'] = scrub(resp.json())
+        except ValueError:
+            interaction['text'] = resp.text
+
+        line = json.dumps(interaction, separators=(',', ':'),
+                          sort_keys=True) + '\n'
+        with self._lock:
+            # Each append to a gzipped cassette adds a gzip member, so the
+            # file is complete after every request
+            with closing(_open(self.path, 'ab')) as f:
+                f.write(line.encode('utf8'))
+
+        return resp
+
+    def close(self):
+        self.transport.close()
+
+
+class ReplayTransport(Transport):
+
+    """
+    Transport that answers requests with the responses recorded in a
+    cassette, matched by method and path in the order they were recorded.
+    Once all responses to a request have been replayed, the last one is
+    repeated, so that polling ends in the final recorded state.
+
+    :param path: Cassette file
+    :param timing: Take as long as the original request to respond
+    """
+
+    def __init__(self, path, timing=False):
+        self.path = path
+        self.timing = timing
+        self._responses = defaultdict(deque)
+        self._lock = threading.Lock()
+
+        for interaction in load(path):
+            key = (interaction['method'], interaction['path'])
+            self._responses[key].append(interaction)
+
+    def _next(self, method, path):
+        with self._lock:
+            responses = self._responses.get((method.upper(), path))
+            if not responses:
+                raise error.RequestError(
+                    '{0} /{1}: No recorded response in {2}'.format(
+                        method.upper(), path, self.path))
+
+            return responses.popleft() if len(responses) > 1 \
+                else responses[0]
+
+    def send(self, method, url, headers=None, body=None, verify=None,
+             timeout=None):
+        interaction = self._next(method, _relative_path(url))
+        if self.timing:
+            time.sleep(interaction.get('elapsed') or 0)
+
+        headers = {}
+        if interaction.get('content_type'):
+            headers['content-type'] = interaction['content_type']
+
+        if 'json' in interaction:
+            content = json.dumps(interaction['json']).encode('utf8')
+        else:
+            content = interaction.get('text', '').encode('utf8')
+
+        return Response(interaction['status'], headers, content)
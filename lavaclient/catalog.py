@@ -0,0 +1,204 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""
+Cache of slowly-changing API data (flavors, stacks, scripts, credentials,
+cluster topology), and of responses prefetched when a client is created
+"""
+
+import logging
+import time
+from threading import Event, Lock, Thread
+
+from lavaclient import timeouts
+from lavaclient import util
+from lavaclient.log import NullHandler
+
+
+LOG = logging.getLogger(__name__)
+LOG.addHandler(NullHandler())
+
+
+DEFAULT_TTL = 300
+
+# Prefix of cluster topology cache keys; modifying requests to `clusters/...`
+# invalidate them through invalidate_path
+TOPOLOGY = 'cluster_topology'
+
+# API paths requested first by most programs, prefetched by
+# `Lava(..., prefetch=True)`
+PREFETCH_PATHS = ('flavors', 'stacks', 'distros', 'limits')
+
+
+class _Prefetch(object):
+
+    """Response to a prefetched GET request, set once it arrives"""
+
+    def __init__(self):
+        self.done = Event()
+        self.fetched = None
+        self.data = None
+
+
+class Catalog(object):
+
+    """
+    Time-limited cache of catalog data, used to validate requests locally
+    before they are sent to the API.
+
+    :param client: :class:`~lavaclient.Lava` instance
+    :param ttl: Number of seconds for which cached data is considered fresh
+    """
+
+    def __init__(self, client, ttl=DEFAULT_TTL):
+        self._client = client
+        self.ttl = ttl
+        self._cache = {}
+        self._prefetched = {}
+        self._lock = Lock()
+
+    def _cached(self, key, loader):
+        with self._lock:
+            entry = self._cache.get(key)
+
+        if entry is not None and time.time() - entry[0] < self.ttl:
+            return entry[1]
+
+        LOG.debug('Catalog cache miss: %s', key)
+        value = loader()
+
+        with self._lock:
+            self._cache[key] = (time.time(), value)
+
+        return value
+
+    def invalidate(self, key=None):
+        """Drop a single cached item, e.g. `'flavors'`, or everything if `key`
+        is `None`"""
+        with self._lock:
+            if key is None:
+                self._cache.clear()
+                self._prefetched.clear()
+            else:
+                self._cache.pop(key, None)
+
+    def invalidate_path(self, path):
+        """Drop cached items that may have been changed by a modifying request
+        to the given API path, e.g. `'credentials/ssh_keys'`"""
+        resource = path.lstrip('/').split('/', 1)[0].rstrip('s')
+        with self._lock:
+            for key in list(self._cache):
+                name = key[0] if isinstance(key, tuple) else key
+                if resource and name.startswith(resource):
+                    del self._cache[key]
+            for key in list(self._prefetched):
+                if resource and key.startswith(resource):
+                    del self._prefetched[key]
+
+    def prefetch(self, paths=PREFETCH_PATHS):
+        """
+        Send GET requests to the API paths concurrently in the background,
+        e.g. `'flavors'`. The first GET of each path made through the client
+        within `ttl` seconds uses the response instead, waiting for it if it
+        is still on its way. The requests also open connections that later
+        requests reuse.
+
+        :returns: The background thread
+        """
+        entries = [(path.strip('/'), _Prefetch()) for path in paths]
+        with self._lock:
+            self._prefetched.update(entries)
+
+        def fetch(item):
+            path, entry = item
+            try:
+                entry.data = self._client._request('GET', path)
+                entry.fetched = time.time()
+            except Exception as exc:
+                # The request is sent again when the path is first used
+                LOG.debug('Prefetching %s failed', path, exc_info=exc)
+            finally:
+                entry.done.set()
+
+        thread = Thread(target=util.parallel_map, args=(fetch, entries))
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    def take_prefetched(self, path):
+        """Prefetched response to a GET of the API path, which is then
+        dropped; `None` if it was not prefetched, failed, or is stale"""
+        if not self._prefetched:
+            return None
+
+        with self._lock:
+            entry = self._prefetched.pop(path.strip('/'), None)
+
+        if entry is None:
+            return None
+
+        entry.done.wait(timeouts.remaining())
+        if entry.fetched is None or time.time() - entry.fetched >= self.ttl:
+            return None
+
+        LOG.debug('Using prefetched response: %s', path)
+        self._client.metrics.increment('prefetch_hits')
+        return entry.data
+
+    def flavors(self):
+        """`dict` of flavor ID to :class:`~lavaclient.api.response.Flavor`"""
+        return self._cached('flavors', lambda: dict(
+            (flavor.id, flavor) for flavor in self._client.flavors.list()))
+
+    def stacks(self):
+        """`dict` of stack ID to :class:`~lavaclient.api.response.Stack`"""
+        return self._cached('stacks', lambda: dict(
+            (stack.id, stack) for stack in self._client.stacks.list()))
+
+    def stack(self, stack_id):
+        """:class:`~lavaclient.api.response.StackDetail` for the stack, or
+        `None` if it does not exist"""
+        if stack_id not in self.stacks():
+            return None
+
+        return self._cached(('stack', stack_id),
+                            lambda: self._client.stacks.get(stack_id))
+
+    def scripts(self):
+        """`dict` of script ID to :class:`~lavaclient.api.response.Script`"""
+        return self._cached('scripts', lambda: dict(
+            (script.id, script) for script in self._client.scripts.list()))
+
+    def distros(self):
+        """`dict` of distro ID to :class:`~lavaclient.api.response.Distro`"""
+        return self._cached('distros', lambda: dict(
+            (distro.id, distro) for distro in self._client.distros.list()))
+
+    def limits(self):
+        """:class:`~lavaclient.api.response.AbsoluteLimits` of the tenant"""
+        return self._cached('limits', self._client.limits.get)
+
+    def credentials(self):
+        """:class:`~lavaclient.api.response.Credentials`"""
+        return self._cached('credentials', self._client.credentials.list)
+
+    def topology(self, cluster_id, wait=False):
+        """:class:`~lavaclient.api.clusters.Topology` of the cluster's nodes,
+        as used by the SSH, tunnel, and proxy methods"""
+        return self._cached(
+            (TOPOLOGY, cluster_id),
+            lambda: self._client.clusters._load_topology(cluster_id,
+                                                         wait=wait))
+
+    def invalidate_topology(self, cluster_id):
+        """Drop the cached topology of the cluster, e.g. after a resize"""
+        self.invalidate((TOPOLOGY, cluster_id))
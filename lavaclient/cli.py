@@ -11,18 +11,27 @@
 #    under the License.
 
 import argparse
+import csv
+import json
 import six
 import sys
 import getpass
 import logging
 import os
+import shlex
+import time
 import figgis
+from contextlib import contextmanager
+from datetime import datetime
 
+from lavaclient import cassette, daemon, metrics, timeouts
 from lavaclient._version import __version__
 from lavaclient.client import Lava
-from lavaclient.error import LavaError
-from lavaclient.util import get_function_arguments, first_exists, table_data
+from lavaclient.error import LavaError, InvalidError
+from lavaclient.util import (get_function_arguments, first_exists, table_data,
+                             display_result, parallel_imap)
 from lavaclient.log import NullHandler
+from lavaclient.transport import TRANSPORTS
 from lavaclient.api import (clusters, limits, flavors, stacks, distros,
                             scripts, nodes, credentials)
 
@@ -30,53 +39,92 @@ from lavaclient.api import (clusters, limits, flavors, stacks, distros,
 LOG = logging.getLogger(__name__)
 LOG.addHandler(NullHandler())
 
+RESOURCE_MODULES = (clusters, limits, flavors, stacks, distros, scripts, nodes,
+                    credentials)
+
+OUTPUT_FORMATS = ('table', 'json', 'ndjson', 'csv')
+
+
+def client_options(args):
+    """
+    Keyword arguments to :class:`~lavaclient.Lava` from CLI args and
+    environment variables
+    """
+    return dict(
+        username=first_exists(args.user,
+                              os.environ.get('LAVA_USERNAME'),
+                              os.environ.get('OS_USERNAME'),
+                              getpass.getuser()),
+        api_key=first_exists(args.lava_api_key,
+                             os.environ.get('LAVA_API_KEY'),
+                             os.environ.get('OS_API_KEY')),
+        token=first_exists(args.token,
+                           os.environ.get('LAVA_AUTH_TOKEN'),
+                           os.environ.get('AUTH_TOKEN')),
+        password=first_exists(args.password,
+                              os.environ.get('LAVA_PASSWORD'),
+                              os.environ.get('OS_PASSWORD')),
+        tenant_id=first_exists(args.tenant,
+                               os.environ.get('LAVA_TENANT_NAME'),
+                               os.environ.get('OS_TENANT_NAME')),
+        region=first_exists(args.region,
+                            os.environ.get('LAVA_REGION_NAME'),
+                            os.environ.get('OS_REGION_NAME')),
+        auth_url=first_exists(args.auth_url,
+                              os.environ.get('LAVA_AUTH_URL'),
+                              os.environ.get('OS_AUTH_URL')),
+        endpoint=first_exists(args.endpoint,
+                              os.environ.get('LAVA2_API_URL'),
+                              os.environ.get('LAVA_API_URL')),
+        verify_ssl=args.verify_ssl,
+        transport=first_exists(args.transport,
+                               os.environ.get('LAVA_TRANSPORT')),
+        timeout=first_exists(args.request_timeout,
+                             float(os.environ.get('LAVA_REQUEST_TIMEOUT', 0)),
+                             timeouts.DEFAULT_TIMEOUT))
+
+
+def has_credentials(options):
+    """Whether client options include an API key, token, or password"""
+    return any((options['api_key'], options['token'], options['password']))
+
+
+def client_transport(args, transport=None):
+    """Transport recording or replaying requests, if requested by --record or
+    --replay, otherwise `transport`"""
+    if args.replay:
+        return cassette.ReplayTransport(args.replay,
+                                        timing=args.replay_timing)
+    elif args.record:
+        return cassette.RecordingTransport(args.record, transport=transport)
+
+    return transport
+
 
 def create_client(args):
     """
     Create instance of Lava from CLI args
     """
-    apikey = first_exists(args.lava_api_key,
-                          os.environ.get('LAVA_API_KEY'),
-                          os.environ.get('OS_API_KEY'))
-    token = first_exists(args.token,
-                         os.environ.get('LAVA_AUTH_TOKEN'),
-                         os.environ.get('AUTH_TOKEN'))
-    user = first_exists(args.user,
-                        os.environ.get('LAVA_USERNAME'),
-                        os.environ.get('OS_USERNAME'),
-                        getpass.getuser())
-    password = first_exists(args.password,
-                            os.environ.get('LAVA_PASSWORD'),
-                            os.environ.get('OS_PASSWORD'))
-
-    if not any((apikey, token, password)):
+    options = client_options(args)
+    options.update(transport=client_transport(args, options['transport']))
+
+    if args.replay:
+        # Nothing is sent to the API, so no real credentials are needed
+        options.update(token=options['token'] or 'replay',
+                       endpoint=options['endpoint'] or 'http://replay/v2/' +
+                       (options['tenant_id'] or 'replay'))
+
+    if not has_credentials(options):
         if args.headless:
             six.print_('Error: no API key, token, or password specified',
                        file=sys.stderr)
             sys.exit(1)
         else:
-            password = getpass.getpass('Password for {0}: '.format(user))
+            options['password'] = getpass.getpass(
+                'Password for {0}: '.format(options['username']))
 
     try:
-        return Lava(
-            user,
-            api_key=apikey,
-            token=token,
-            password=password,
-            tenant_id=first_exists(args.tenant,
-                                   os.environ.get('LAVA_TENANT_NAME'),
-                                   os.environ.get('OS_TENANT_NAME')),
-            region=first_exists(args.region,
-                                os.environ.get('LAVA_REGION_NAME'),
-                                os.environ.get('OS_REGION_NAME')),
-            auth_url=first_exists(args.auth_url,
-                                  os.environ.get('LAVA_AUTH_URL'),
-                                  os.environ.get('OS_AUTH_URL')),
-            endpoint=first_exists(args.endpoint,
-                                  os.environ.get('LAVA2_API_URL'),
-                                  os.environ.get('LAVA_API_URL')),
-            verify_ssl=args.verify_ssl,
-            _cli_args=args)
+        return Lava(_cli_args=args, **options)
     except LavaError as exc:
         six.print_('Error during authentication: {0}'.format(exc),
                    file=sys.stderr)
@@ -116,28 +164,126 @@ def print_unformatted_table(args, result):
                               for item in row))
 
 
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+
+    return six.text_type(value)
+
+
+def _jsonable(item):
+    if hasattr(item, 'to_dict'):
+        return item.to_dict()
+    elif isinstance(item, (list, tuple)):
+        return [_jsonable(value) for value in item]
+
+    return item
+
+
+def _to_json(item):
+    return json.dumps(_jsonable(item), sort_keys=True,
+                      default=_json_default)
+
+
+def _is_config_result(result):
+    return isinstance(result, figgis.Config) or (
+        isinstance(result, (list, tuple)) and
+        all(isinstance(item, figgis.Config) for item in result))
+
+
+def print_json(args, result):
+    """Print the result as a JSON document; lists are written one item at a
+    time"""
+    if not isinstance(result, (list, tuple)):
+        six.print_(_to_json(result))
+        return
+
+    sys.stdout.write('[')
+    for index, item in enumerate(result):
+        sys.stdout.write(',\n' if index else '\n')
+        sys.stdout.write(_to_json(item))
+    six.print_('\n]' if result else ']')
+
+
+def print_ndjson(args, result):
+    """Print the result as newline-delimited JSON, one item per line"""
+    for item in result if isinstance(result, (list, tuple)) else [result]:
+        six.print_(_to_json(item))
+
+
+def print_csv(args, result):
+    """Print the result's table columns as CSV, one row at a time"""
+    if not _is_config_result(result):
+        six.print_(result)
+        return
+
+    result_list = [result] if isinstance(result, figgis.Config) else result
+    if not result_list:
+        return
+
+    data, long_header = table_data(result_list, result_list[0].__class__)
+    header = [item.replace(' ', '_').lower() for item in long_header]
+
+    def encode(row):
+        row = [six.text_type(item) for item in row]
+        if six.PY2:
+            row = [item.encode('utf8') for item in row]
+        return row
+
+    writer = csv.writer(sys.stdout, lineterminator='\n')
+    writer.writerow(encode(header))
+    for row in data:
+        writer.writerow(encode(row))
+
+
+# Machine-readable output formats
+OUTPUT_DISPATCH = dict(
+    json=print_json,
+    ndjson=print_ndjson,
+    csv=print_csv,
+)
+
+
 def print_action(func, args, *f_args, **f_kwargs):
-    if args.pretty_print and hasattr(func, 'display'):
+    output = getattr(args, 'output', None)
+    if output in OUTPUT_DISPATCH:
+        result = func(*f_args, **f_kwargs)
+        if result is not None:
+            with metrics.phase('render'):
+                OUTPUT_DISPATCH[output](args, result)
+        return
+
+    pretty_print = args.pretty_print or output == 'table'
+    if pretty_print and hasattr(func, 'display'):
         func.display(func.__self__, *f_args, **f_kwargs)
     else:
         result = func(*f_args, **f_kwargs)
         if not result:
             return
 
-        if isinstance(result, figgis.Config) or (
-                isinstance(result, (list, tuple)) and
-                all(isinstance(item, figgis.Config) for item in result)):
-            print_unformatted_table(args, result)
-        else:
-            six.print_(result)
+        with metrics.phase('render'):
+            if _is_config_result(result) and output == 'table':
+                first = result if isinstance(result, figgis.Config) \
+                    else result[0]
+                display_result(result, first.__class__)
+            elif _is_config_result(result):
+                print_unformatted_table(args, result)
+            else:
+                six.print_(result)
 
 
-def call_action(func, args):
+def action_arguments(func, args):
+    """Positional and keyword arguments for func from CLI args"""
     required, optional = get_function_arguments(func)
 
     f_args = [getattr(args, name) for name in required]
     f_kwargs = dict((name, getattr(args, name)) for name in optional)
 
+    return f_args, f_kwargs
+
+
+def call_action(func, args):
+    f_args, f_kwargs = action_arguments(func, args)
     return print_action(func, args, *f_args, **f_kwargs)
 
 
@@ -146,10 +292,132 @@ def print_auth_token(client, args):
     six.print_('AUTH_TOKEN={0}'.format(client.token))
 
 
+BATCH_CONCURRENCY = 4
+
+
+def _read_batch(parser, lines):
+    """Parse batch lines; yields `(line number, command, args, error)`"""
+    for number, line in enumerate(lines, 1):
+        command = line.strip()
+        if not command or command.startswith('#'):
+            continue
+
+        stdout, stderr = sys.stdout, sys.stderr
+        sys.stdout = sys.stderr = output = six.StringIO()
+        try:
+            args = parse_argv(shlex.split(command), parser=parser)
+        except (SystemExit, ValueError) as exc:
+            message = output.getvalue().strip().split('\n')[-1] or str(exc)
+            yield number, command, None, message
+            continue
+        finally:
+            sys.stdout, sys.stderr = stdout, stderr
+
+        if not hasattr(args, 'method'):
+            yield number, command, None, 'Incomplete command'
+        elif args.resource in COMMAND_DISPATCH:
+            yield (number, command, None,
+                   '{0} is not supported in batch mode'.format(args.resource))
+        else:
+            yield number, command, args, None
+
+
+def _batch_action(client, args):
+    """
+    `(func, f_args, f_kwargs)` run for a batch command. Interactive commands
+    prompt or print tables through CLI-only wrappers such as `_delete`, so
+    the API method they wrap, e.g. `delete`, is called instead, with the
+    wrapper's arguments; `None` if there is no such method, or if it needs
+    arguments the wrapper doesn't have.
+    """
+    command = getattr(getattr(client, args.resource), args.method)
+    if not getattr(args, 'interactive', False):
+        return (command,) + action_arguments(command, args)
+    elif not args.method.startswith('_'):
+        return None
+
+    func = getattr(getattr(client, args.resource), args.method[1:], None)
+    if func is None:
+        return None
+
+    names = set(sum(get_function_arguments(command), []))
+    required, optional = get_function_arguments(func)
+    if not set(required) <= names:
+        return None
+
+    return (func, [getattr(args, name) for name in required],
+            dict((name, getattr(args, name)) for name in optional
+                 if name in names))
+
+
+def lava_batch(client, args):
+    """Run lava commands read from a file or stdin, one per line, with a
+    single client. Each command's result is printed as a line of JSON."""
+    parser = create_parser()
+    if args.file == '-':
+        commands = list(_read_batch(parser, sys.stdin))
+    else:
+        with open(args.file) as f:
+            commands = list(_read_batch(parser, f))
+
+    # Commands can't prompt for input or print progress messages
+    args.headless = True
+    client._bind_cli_args(args, command_line=False)
+
+    def run(command):
+        number, text, command_args, message = command
+        if message is not None:
+            raise InvalidError(message)
+
+        action = _batch_action(client, command_args)
+        if action is None:
+            raise InvalidError('{0} {1} is not supported in batch mode'.format(
+                command_args.resource, command_args.method.lstrip('_')))
+
+        func, f_args, f_kwargs = action
+        return func(*f_args, **f_kwargs)
+
+    failed = False
+    for index, result, exc in parallel_imap(
+            run, commands, concurrency=args.concurrency,
+            ordered=args.order == 'input'):
+        number, text = commands[index][:2]
+        record = dict(line=number, command=text)
+        if exc is None:
+            record.update(status='ok', result=_jsonable(result))
+        else:
+            failed = True
+            record.update(status='error', error=six.text_type(exc))
+
+        six.print_(json.dumps(record, sort_keys=True, default=_json_default))
+        sys.stdout.flush()
+
+    if failed:
+        sys.exit(1)
+
+
+def add_batch_arguments(parser):
+    parser.add_argument('file', nargs='?', default='-',
+                        help='File containing commands; reads stdin by '
+                             'default')
+    parser.add_argument('--concurrency', type=int, default=BATCH_CONCURRENCY,
+                        help='Number of commands to run at once')
+    parser.add_argument('--order', choices=('input', 'completion'),
+                        default='input',
+                        help='Print results in input order, or as soon as '
+                             'each command completes')
+
+
 # Dispatch for non-API commands
 COMMAND_DISPATCH = dict(
     shell=lava_shell,
     authenticate=print_auth_token,
+    batch=lava_batch,
+)
+
+# Arguments of non-API commands
+COMMAND_ARGUMENTS = dict(
+    batch=add_batch_arguments,
 )
 
 
@@ -228,7 +496,15 @@ def with_opposites(parser, dest, *options, **kwargs):
                         **kwargs)
 
 
-def parse_argv():
+def create_parser(resources=None):
+    """
+    Create the argument parser for the lava command. Only the subcommands of
+    the named resources are added (default: all of them); the parsers of
+    other resources are left empty, as building the whole tree takes a
+    significant part of the command's startup time.
+
+    :param resources: Names of resources, e.g. `['clusters']`
+    """
     pipe_out = not sys.stdout.isatty()
 
     # Suppress setting attributes on the namespace from subparser options if
@@ -266,6 +542,30 @@ def parse_argv():
         general.add_argument('--insecure', '-k', action='store_false',
                              dest='verify_ssl',
                              help='Turn of SSL cert validation')
+        general.add_argument('--transport', choices=sorted(TRANSPORTS),
+                             help='HTTP library used to send API requests; '
+                                  'defaults to requests')
+        general.add_argument('--request-timeout', type=float,
+                             metavar='SECONDS',
+                             help='Timeout of each API request; defaults to '
+                                  '10 seconds to connect and 60 to read the '
+                                  'response')
+        general.add_argument('--profile', action='store_true',
+                             help='Print the time taken by each phase of the '
+                                  'command to stderr')
+        general.add_argument('--profile-dump', metavar='FILE',
+                             help='Write cProfile statistics of the command '
+                                  'to FILE, for use with pstats')
+        general.add_argument('--record', metavar='FILE',
+                             help='Record API requests and responses to the '
+                                  'cassette FILE, without secrets')
+        general.add_argument('--replay', metavar='FILE',
+                             help='Answer API requests with the responses '
+                                  'recorded in the cassette FILE instead of '
+                                  'calling the API')
+        general.add_argument('--replay-timing', action='store_true',
+                             help='Take as long to replay each response as '
+                                  'the original request')
 
         fmt = prs.add_argument_group('Formatting Options')
         with_opposites(fmt, 'pretty_print', '--format', '-f',
@@ -276,62 +576,159 @@ def parse_argv():
         fmt.add_argument('--delimiter', '-l',
                          help='Column delimiter to use when formatting is '
                               'disabled')
+        fmt.add_argument('--output', choices=OUTPUT_FORMATS,
+                         help='Output format. json, ndjson, and csv are '
+                              'written as results are read, for use in '
+                              'scripts; table is the same as --format')
 
     # Ugly hack; add defaults only to main parser so as to not override values
     # via child parsers
     parser.set_defaults(enable_cli=True,
                         verify_ssl=not os.environ.get('LAVA_INSECURE'),
+                        profile=bool(os.environ.get('LAVA_PROFILE')),
+                        profile_dump=os.environ.get('LAVA_PROFILE_DUMP'),
                         delimiter=',',
+                        output=None,
                         show_header=False,
                         pretty_print=not pipe_out)
 
     subparsers = parser.add_subparsers(title='Commands')
 
     for command, func in COMMAND_DISPATCH.items():
-        (subparsers.add_parser(command, parents=[parser_base],
-                               description=func.__doc__)
-                   .set_defaults(resource=command, method=command))
-
-    for module in (clusters, limits, flavors, stacks, distros, scripts, nodes,
-                   credentials):
+        subparser = subparsers.add_parser(command, parents=[parser_base],
+                                          description=func.__doc__)
+        # Non-API commands read the terminal, or need a client of their own
+        subparser.set_defaults(resource=command, method=command,
+                               interactive=True)
+        if command in COMMAND_ARGUMENTS:
+            COMMAND_ARGUMENTS[command](subparser)
+
+    for module in RESOURCE_MODULES:
         name = module.__name__.split('.')[-1]
+        if resources is not None and name not in resources:
+            # Placeholder; accepts anything, so that parse_known_args can
+            # find the resource name without building the rest of the tree
+            subparsers.add_parser(name, add_help=False).set_defaults(
+                resource=name)
+            continue
+
         subparser = subparsers.add_parser(name, parents=[parser_base])
         subparser.set_defaults(resource=name)
         module.Resource._add_arguments(parser_base, subparser)
 
-    args = parser.parse_args()
+    return parser
+
+
+def _resource_name(argv):
+    """Resource named by the command line, or `None`, found by parsing it
+    without the resources' subcommands"""
+    args, _ = create_parser(resources=()).parse_known_args(argv)
+    return getattr(args, 'resource', None)
+
+
+def parse_argv(argv=None, parser=None):
+    if parser is None:
+        resource = _resource_name(argv)
+        parser = create_parser(resources=() if resource is None
+                               else (resource,))
+
+    args = parser.parse_args(argv)
 
     # Force re-authentication for the 'authenticate' method
-    if args.resource == 'authenticate':
+    if getattr(args, 'resource', None) == 'authenticate':
         args.token = None
 
     return args
 
 
-def main():
-    args = parse_argv()
-    if args.version:
-        six.print_('lavaclient version ' + __version__)
-        sys.exit(0)
-
-    initialize_logging(args)
-
-    try:
-        client = create_client(args)
-    except Exception as exc:
-        LOG.critical('Error while creating client', exc_info=exc)
-        six.print_('ERROR: {0}'.format(exc), file=sys.stderr)
-        sys.exit(1)
+def run_command(client, args):
+    """
+    Execute lava command, printing any error
 
+    :returns: Exit status
+    """
     try:
         execute_command(client, args)
     except Exception as exc:
         LOG.debug('Error while executing command', exc_info=exc)
         six.print_('ERROR: {0}'.format(exc), file=sys.stderr)
-        sys.exit(1)
+        return 1
     except KeyboardInterrupt:
         pass
 
+    return 0
+
+
+@contextmanager
+def profiling(args, started, parsed):
+    """
+    Profile the rest of the command if requested by --profile or
+    --profile-dump, printing the summary to stderr when done
+
+    :param started: Time at which main was entered
+    :param parsed: Time at which the command line had been parsed
+    """
+    if not (args.profile or args.profile_dump):
+        yield
+        return
+
+    process_started = metrics.process_started() or started
+    profiler = metrics.start_profiling(started=process_started)
+    profiler.add('startup', max(started - process_started, 0.0))
+    profiler.add('parse_argv', parsed - started)
+
+    cprofile = None
+    if args.profile_dump:
+        import cProfile
+        cprofile = cProfile.Profile()
+        cprofile.enable()
+
+    try:
+        yield
+    finally:
+        if cprofile is not None:
+            cprofile.disable()
+            cprofile.dump_stats(args.profile_dump)
+
+        metrics.stop_profiling()
+        if args.profile:
+            profiler.print_summary()
+
+
+def main():
+    started = time.time()
+    argv = sys.argv[1:]
+    if argv[:1] == ['daemon']:
+        sys.exit(daemon.main(argv[1:]))
+
+    # Let a running daemon execute the command with its warm client
+    if not os.environ.get('LAVA_NO_DAEMON'):
+        status = daemon.forward(argv)
+        if status is not None:
+            sys.exit(status)
+
+    args = parse_argv(argv)
+    if args.version:
+        six.print_('lavaclient version ' + __version__)
+        sys.exit(0)
+
+    initialize_logging(args)
+
+    with profiling(args, started, time.time()):
+        try:
+            with metrics.phase('create_client'):
+                client = create_client(args)
+        except Exception as exc:
+            LOG.critical('Error while creating client', exc_info=exc)
+            six.print_('ERROR: {0}'.format(exc), file=sys.stderr)
+            status = 1
+        else:
+            with metrics.phase('command'):
+                status = run_command(client, args)
+
+    if status:
+        sys.exit(status)
+
 
 if __name__ == '__main__':  # pragma: nocover
     main()
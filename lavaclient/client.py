@@ -14,34 +14,48 @@
 Lava client setup and authentication
 """
 
+import json
 import logging
 import six
 import re
+import time
 import uuid
-import requests
 from threading import Lock
+from six.moves.http_client import responses, UNAUTHORIZED
+from six.moves.urllib.parse import urlencode
 
 from lavaclient._version import __version__
-from lavaclient import keystone
 from lavaclient import util
+from lavaclient import catalog
+from lavaclient import metrics
+from lavaclient import hedging
+from lavaclient import ssh
+from lavaclient import timeouts
 from lavaclient import constants
 from lavaclient import error
 from lavaclient.log import NullHandler
+from lavaclient.transport import (get_transport, TransportError,
+                                  TransportTimeout)
 from lavaclient.api import (clusters, limits, flavors, stacks, distros,
                             workloads, scripts, nodes, credentials)
-from keystoneclient import exceptions as ks_error
-from keystoneclient.i18n import _
+from lavaclient.api.resource import Resource
 
 LOG = logging.getLogger(__name__)
 LOG.addHandler(NullHandler())
 
 CURRENT_LAVA_VERSION = '2'
 
+# keystoneclient and requests take most of the time needed to import
+# lavaclient, and are imported when they are first used: keystoneclient only
+# when authenticating with keystone rather than a token
+
 
 class Lava(object):
     """
     Lava(username, region=None, password=None, token=None, api_key=None, \
-auth_url=None, tenant_id=None, endpoint=None, verify_ssl=None)
+auth_url=None, tenant_id=None, endpoint=None, verify_ssl=None, \
+multiplex_ssh=False, transport=None, timeout=(10, 60), hedge=None, \
+prefetch=False)
 
     Cloud Big Data API client. Creating an instance will automatically attempt
     to authenticate.
@@ -56,6 +70,29 @@ auth_url=None, tenant_id=None, endpoint=None, verify_ssl=None)
     :param tenant_id: Rackspace tenant ID
     :param endpoint: Cloud Big Data endpoint URL; usually discovered
                      automatically with a valid `region`
+    :param multiplex_ssh: Reuse one SSH connection per node for repeated SSH
+                          commands; see :class:`lavaclient.ssh.Multiplexer`.
+                          Call :meth:`close` when finished to shut the
+                          connections down.
+    :param transport: Transport that sends API requests: the name of one of
+                      the transports in :mod:`lavaclient.transport`, e.g.
+                      `'urllib3'`, or a
+                      :class:`~lavaclient.transport.Transport` instance, such
+                      as the transports in :mod:`lavaclient.cassette` that
+                      record and replay requests. Defaults to `'requests'`.
+    :param timeout: Timeout of each API request in seconds, as a number or a
+                    `(connect, read)` tuple, or `None` to wait indefinitely;
+                    see :mod:`lavaclient.timeouts` to override it or set a
+                    deadline for several requests
+    :param hedge: Send a duplicate of GET requests that are slow to be
+                  answered, and use the first response; `True` to hedge
+                  after the 95th percentile of recent GET latencies, or a
+                  :class:`~lavaclient.hedging.Hedging` policy
+    :param prefetch: Request flavors, stacks, distros, and limits
+                     concurrently in the background once authenticated, so
+                     that the first calls to list or get them use the
+                     responses; `True`, or a list of API paths to prefetch.
+                     See :meth:`~lavaclient.catalog.Catalog.prefetch`.
     """
 
     def __init__(self,
@@ -68,6 +105,11 @@ auth_url=None, tenant_id=None, endpoint=None, verify_ssl=None)
                  tenant_id=None,
                  endpoint=None,
                  verify_ssl=None,
+                 multiplex_ssh=False,
+                 transport=None,
+                 timeout=timeouts.DEFAULT_TIMEOUT,
+                 hedge=None,
+                 prefetch=False,
                  _cli_args=None):
         if not any((api_key, password, token)):
             raise error.InvalidError("One of api_key, token, or password is "
@@ -92,6 +134,18 @@ auth_url=None, tenant_id=None, endpoint=None, verify_ssl=None)
         self._verify_ssl = verify_ssl
         self._token = token
 
+        # Sends API requests; see lavaclient.transport
+        self.transport = get_transport(transport)
+
+        # (connect, read) timeout of each request
+        self.timeout = timeouts.normalize(timeout)
+
+        # Hedging policy of GET requests, if enabled
+        self.hedging = hedging.Hedging() if hedge is True else hedge or None
+
+        # Timings of recent requests and other client statistics
+        self.metrics = metrics.Metrics()
+
         if token and not endpoint:
             raise error.InvalidError(
                 'Token must be accompanied by a hard-coded endpoint')
@@ -126,8 +180,51 @@ auth_url=None, tenant_id=None, endpoint=None, verify_ssl=None)
         # it entirely. Therefore, I'll just make it private for now.
         self._workloads = workloads.Resource(self, cli_args=_cli_args)
 
+        # Cached flavors, stacks, etc. used for validating requests locally
+        self.catalog = catalog.Catalog(self)
+
+        # Shared SSH master connections to cluster nodes, if enabled
+        self.ssh_multiplexer = ssh.Multiplexer() if multiplex_ssh else None
+
+        # Shared SSH tunnels and SOCKS proxies to cluster nodes
+        self.tunnels = ssh.TunnelPool(self)
+
         self._auth_lock = Lock()
 
+        if prefetch:
+            self.catalog.prefetch(catalog.PREFETCH_PATHS if prefetch is True
+                                  else prefetch)
+
+    def _bind_cli_args(self, cli_args, command_line=None):
+        """Use new command-line arguments for the CLI-only methods of every
+        resource, e.g. when the client is reused for several commands. If
+        `command_line` is `False`, progress messages are logged but not
+        printed."""
+        if command_line is None:
+            command_line = cli_args is not None
+
+        for value in vars(self).values():
+            if isinstance(value, Resource):
+                value._args = cli_args
+                value._command_line = command_line
+
+    def close(self):
+        """Release resources held by the client, e.g. pooled SSH tunnels and
+        master connections, and HTTP connections. Call it when done with the
+        client, or use the client as a context manager; otherwise tunnels
+        and master connections stay open until the client is garbage
+        collected or the interpreter exits."""
+        self.tunnels.close()
+        if self.ssh_multiplexer is not None:
+            self.ssh_multiplexer.close()
+        self.transport.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
     def _validate_endpoint(self, endpoint, tenant_id):
         """Validate that the endpoint ends with v2/<tenant_id>"""
 
@@ -149,6 +246,9 @@ auth_url=None, tenant_id=None, endpoint=None, verify_ssl=None)
     def _throw_endpoint_error(self, endpoint_type, service_name,
                               region_name, service_type):
 
+        from keystoneclient import exceptions as ks_error
+        from keystoneclient.i18n import _
+
         MSG = '{endpoint_type}s endpoint for {service_type}s service '
 
         if service_name and region_name:
@@ -181,6 +281,8 @@ auth_url=None, tenant_id=None, endpoint=None, verify_ssl=None)
             By default choose public URL available if no versioning
             otherwise filter specific version.
         """
+        from keystoneclient import exceptions as ks_error
+
         current_lava_url = None
         sc_endpoints = service_catalog.get_endpoints(
             service_type=service_type, endpoint_type=endpoint_type,
@@ -209,6 +311,8 @@ auth_url=None, tenant_id=None, endpoint=None, verify_ssl=None)
         return current_lava_url or fallback_url
 
     def _get_endpoint(self, region, tenant_id):
+        from keystoneclient import exceptions as ks_error
+
         filters = dict(
             service_type=constants.CBD_SERVICE_TYPE,
             region_name=region.upper(),
@@ -228,14 +332,18 @@ auth_url=None, tenant_id=None, endpoint=None, verify_ssl=None)
     def _authenticate(self, auth_url, api_key, region, username, password,
                       tenant_id):
         """Return keystone authentication client"""
+        from keystoneclient import exceptions as ks_error
+        from lavaclient import keystone
+
         try:
-            return keystone.Client(
-                auth_url=util.strip_url(auth_url),
-                api_key=api_key,
-                password=password,
-                region=region,
-                username=username,
-                tenant_id=tenant_id)
+            with metrics.phase('authenticate'):
+                return keystone.Client(
+                    auth_url=util.strip_url(auth_url),
+                    api_key=api_key,
+                    password=password,
+                    region=region,
+                    username=username,
+                    tenant_id=tenant_id)
         except ks_error.AuthorizationFailure as exc:
             LOG.critical('Unable to authenticate', exc_info=exc)
             raise error.AuthenticationError(
@@ -283,7 +391,13 @@ auth_url=None, tenant_id=None, endpoint=None, verify_ssl=None)
     ######################################################################
 
     def _get(self, path, **kwargs):
-        """Make a GET request, same as requests.get"""
+        """Make a GET request, same as requests.get, or use its prefetched
+        response"""
+        if not kwargs:
+            data = self.catalog.take_prefetched(path)
+            if data is not None:
+                return data
+
         return self._request('GET', path, **kwargs)
 
     def _post(self, path, **kwargs):
@@ -307,47 +421,85 @@ auth_url=None, tenant_id=None, endpoint=None, verify_ssl=None)
         }
 
     def _request(self, method, path, reauthenticate=True, **kwargs):
-        """Same as requests.request, but automatically injects
-        authentication headers into request and prepends endpoint to path"""
-        if self._verify_ssl is not None:
-            kwargs['verify'] = kwargs.get('verify', self._verify_ssl)
-
-        headers = kwargs.get('headers') or {}
+        """Make an API request with the client's transport, injecting
+        authentication headers and prepending the endpoint to path. Accepts
+        the `headers`, `params`, `json`, `data`, and `verify` arguments of
+        requests.request. Requests time out as described in
+        lavaclient.timeouts."""
+        headers = dict(kwargs.get('headers') or {})
         headers.update(self._generate_headers())
-        kwargs['headers'] = headers
+
+        body = kwargs.get('data')
+        if kwargs.get('json') is not None:
+            body = json.dumps(kwargs['json']).encode('utf8')
+            headers['Content-Type'] = 'application/json'
+        elif isinstance(body, six.text_type):
+            body = body.encode('utf8')
 
         url = '{0}/{1}'.format(self.endpoint, path.lstrip('/'))
+        if kwargs.get('params'):
+            url += '?' + urlencode(kwargs['params'], doseq=True)
+
+        verify = kwargs.get('verify', self._verify_ssl)
+
+        description = '{0} /{1}'.format(method.upper(), path.lstrip('/'))
+        timeout = timeouts.request_timeout(self.timeout, description)
 
+        def send(attempt):
+            attempt_headers = headers
+            if attempt:
+                # A hedged duplicate is a separate request
+                attempt_headers = dict(headers, **{
+                    'Client-Request-ID': six.text_type(uuid.uuid4())})
+
+            return self.transport.send(method.upper(), url,
+                                       headers=attempt_headers, body=body,
+                                       verify=verify, timeout=timeout)
+
+        start, resp = time.time(), None
         try:
-            resp = requests.request(method, url, **kwargs)
-            resp.raise_for_status()
-        except requests.exceptions.HTTPError as exc:
-            if exc.response.status_code != requests.codes.unauthorized:
-                try:
-                    msg = exc.response.json()['fault']['message']
-                except (KeyError, ValueError):
-                    msg = exc.response.text or str(exc)
-
-                six.raise_from(
-                    error.RequestError(msg, code=exc.response.status_code),
-                    exc)
+            with metrics.phase('http'):
+                if self.hedging is not None and method.upper() == 'GET':
+                    resp = self.hedging.call(send, self.metrics)
+                else:
+                    resp = send(0)
+        except TransportTimeout as exc:
+            self.metrics.increment('timeouts')
+            msg = '{0}: Timed out'.format(description)
+            LOG.critical(msg, exc_info=exc)
+            six.raise_from(error.TimeoutError(msg), exc)
+        except TransportError as exc:
+            msg = '{0}: Error encountered during request'.format(description)
+            LOG.critical(msg, exc_info=exc)
+            six.raise_from(error.RequestError(msg), exc)
+        finally:
+            self.metrics.record_request(
+                method, path, getattr(resp, 'status', None),
+                time.time() - start)
 
+        if resp.status == UNAUTHORIZED:
             if reauthenticate:
                 self.reauthenticate()
                 return self._request(method, path, reauthenticate=False,
                                      **kwargs)
 
-            msg = '{0} /{1}: Unauthorized'.format(
-                method.upper(), path.lstrip('/'))
-            LOG.critical(msg, exc_info=exc)
-            six.raise_from(error.AuthorizationError(msg), exc)
-        except requests.exceptions.RequestException as exc:
-            msg = '{0} /{1}: Error encountered during request'.format(
-                method.upper(), path.lstrip('/'))
-            LOG.critical(msg, exc_info=exc)
-            six.raise_from(error.RequestError(msg), exc)
+            msg = '{0}: Unauthorized'.format(description)
+            LOG.critical(msg)
+            raise error.AuthorizationError(msg)
+        elif resp.status >= 400:
+            try:
+                msg = resp.json()['fault']['message']
+            except (KeyError, TypeError, ValueError):
+                msg = resp.text or '{0} {1} for url: {2}'.format(
+                    resp.status, responses.get(resp.status, 'Error'), url)
+
+            raise error.RequestError(msg, code=resp.status)
+
+        if method.upper() != 'GET':
+            self.catalog.invalidate_path(path)
 
         try:
-            return resp.json()
+            with metrics.phase('json'):
+                return resp.json()
         except ValueError:
             return resp
@@ -0,0 +1,474 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""
+Background process that runs lava commands with a long-lived, authenticated
+client, so that repeated invocations of the `lava` command skip startup and
+authentication.
+
+The daemon listens on a UNIX socket. The `lava` command sends it one JSON
+message per invocation, containing the command line, working directory, and
+`LAVA_*`/`OS_*` environment variables; the daemon replies with the command's
+output and exit status, or asks the caller to run the command itself.
+Commands are run one at a time.
+"""
+
+import argparse
+import base64
+import json
+import logging
+import os
+import socket
+import subprocess
+import sys
+import time
+import six
+from contextlib import contextmanager
+from six.moves import socketserver
+
+from lavaclient.log import NullHandler
+
+
+LOG = logging.getLogger(__name__)
+LOG.addHandler(NullHandler())
+
+
+DEFAULT_SOCKET = os.path.join('~', '.lavaclient', 'daemon.sock')
+
+# Seconds without any commands after which the daemon exits
+DEFAULT_IDLE_TIMEOUT = 3600
+
+# Seconds to wait for a new daemon to start listening
+START_TIMEOUT = 10
+
+# Environment variables passed along with each command
+ENVIRON_PREFIXES = ('LAVA_', 'OS_', 'AUTH_TOKEN')
+
+
+def socket_path(path=None):
+    """Path of the daemon's socket; `LAVA_DAEMON_SOCKET` or
+    `~/.lavaclient/daemon.sock` by default"""
+    return os.path.expanduser(
+        path or os.environ.get('LAVA_DAEMON_SOCKET') or DEFAULT_SOCKET)
+
+
+def _forwarded_environ(environ):
+    return dict((key, value) for key, value in six.iteritems(environ)
+                if key.startswith(ENVIRON_PREFIXES))
+
+
+def _send(sock_file, message):
+    sock_file.write((json.dumps(message) + '\n').encode('utf8'))
+    sock_file.flush()
+
+
+def _receive(sock_file):
+    for line in iter(sock_file.readline, six.b('')):
+        yield json.loads(line.decode('utf8'))
+
+
+def _connect(path, timeout=None):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        sock.connect(path)
+    except socket.error:
+        sock.close()
+        raise
+
+    return sock
+
+
+def _binary(stream):
+    return getattr(stream, 'buffer', stream)
+
+
+def forward(argv, path=None, stdout=None, stderr=None):
+    """
+    Run a lava command in the daemon, if one is running, writing its output to
+    `stdout` and `stderr`.
+
+    :param argv: Command-line arguments, excluding the program name
+    :param path: Path of the daemon's socket; see :func:`socket_path`
+    :returns: Exit status of the command, or `None` if it should be run
+              locally instead, e.g. because the daemon is not running
+    """
+    path = socket_path(path)
+    if not os.path.exists(path):
+        return None
+
+    stdout = sys.stdout if stdout is None else stdout
+    stderr = sys.stderr if stderr is None else stderr
+
+    try:
+        sock = _connect(path)
+    except socket.error as exc:
+        LOG.debug('Unable to connect to lava daemon: %s', exc)
+        return None
+
+    received = False
+    sock_file = sock.makefile('rwb')
+    try:
+        _send(sock_file, dict(argv=list(argv),
+                              environ=_forwarded_environ(os.environ),
+                              cwd=os.getcwd(),
+                              tty=stdout.isatty()))
+
+        for message in _receive(sock_file):
+            received = True
+            if 'fallback' in message:
+                return None
+            elif 'exit' in message:
+                return message['exit']
+
+            stream = _binary(stdout if message['fd'] == 1 else stderr)
+            stream.write(base64.b64decode(message['data']))
+            stream.flush()
+    except socket.error as exc:
+        LOG.debug('Lost connection to lava daemon: %s', exc)
+    finally:
+        sock_file.close()
+        sock.close()
+
+    if not received:
+        return None
+
+    # Output has already been written, so running the command again locally
+    # could repeat it
+    six.print_('ERROR: lava daemon exited before the command finished',
+               file=stderr)
+    return 1
+
+
+class _Fallback(Exception):
+    pass
+
+
+def _exit_status(exc):
+    """Exit status of a process ending with the given `SystemExit`"""
+    if exc.code is None:
+        return 0
+    elif isinstance(exc.code, int):
+        return exc.code
+
+    six.print_(exc.code, file=sys.stderr)
+    return 1
+
+
+class _Output(object):
+
+    """Stand-in for stdout/stderr that sends everything written to the
+    calling process"""
+
+    encoding = 'utf-8'
+
+    def __init__(self, handler, fd, tty):
+        self._handler = handler
+        self._fd = fd
+        self._tty = tty
+
+    @property
+    def buffer(self):
+        return self
+
+    def write(self, data):
+        if isinstance(data, six.text_type):
+            data = data.encode('utf8')
+
+        if data:
+            self._handler.send(fd=self._fd,
+                               data=base64.b64encode(data).decode('ascii'))
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def flush(self):
+        pass
+
+    def isatty(self):
+        return self._tty
+
+
+@contextmanager
+def _command_context(handler, environ, cwd, tty):
+    """Run with the caller's environment, working directory, and output"""
+    saved_environ = _forwarded_environ(os.environ)
+    saved_cwd = os.getcwd()
+    saved_streams = sys.stdout, sys.stderr
+
+    try:
+        for key in saved_environ:
+            del os.environ[key]
+        os.environ.update(environ)
+        os.chdir(cwd)
+        sys.stdout = _Output(handler, 1, tty)
+        sys.stderr = _Output(handler, 2, False)
+
+        yield
+    finally:
+        sys.stdout, sys.stderr = saved_streams
+        os.chdir(saved_cwd)
+        for key in _forwarded_environ(os.environ):
+            del os.environ[key]
+        os.environ.update(saved_environ)
+
+
+class _Handler(socketserver.StreamRequestHandler):
+
+    def send(self, **message):
+        _send(self.wfile, message)
+
+    def handle(self):
+        try:
+            message = json.loads(self.rfile.readline().decode('utf8'))
+        except ValueError:
+            return
+
+        try:
+            if 'control' in message:
+                self.send(**self.server.control(message['control']))
+                return
+
+            try:
+                with _command_context(self, message['environ'],
+                                      message['cwd'], message['tty']):
+                    status = self.server.execute(message['argv'])
+            except _Fallback:
+                self.send(fallback=True)
+            else:
+                self.send(exit=status)
+        except socket.error as exc:
+            LOG.debug('Lost connection to lava command: %s', exc)
+
+
+class Daemon(socketserver.UnixStreamServer):
+
+    """
+    Server that executes lava commands sent to a UNIX socket, keeping one
+    authenticated :class:`~lavaclient.Lava` client, along with its catalog
+    and SSH caches, for each set of credentials it has seen.
+
+    :param path: Path of the socket
+    :param idle_timeout: Seconds without commands after which to exit
+    """
+
+    def __init__(self, path, idle_timeout=DEFAULT_IDLE_TIMEOUT):
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory, 0o700)
+
+        socketserver.UnixStreamServer.__init__(self, path, _Handler)
+        os.chmod(path, 0o600)
+
+        self.path = path
+        self.timeout = idle_timeout
+        self.clients = {}
+        self.started = time.time()
+        self.commands = 0
+        self._running = False
+
+    def execute(self, argv):
+        """Execute one command; :class:`_Fallback` means that the caller
+        should run it instead"""
+        from lavaclient import cli
+
+        try:
+            args = cli.parse_argv(argv)
+        except SystemExit as exc:
+            return _exit_status(exc)
+
+        # Commands that prompt the user or run until interrupted (marked
+        # `interactive`), print debugging or profiling output to the
+        # terminal, or record or replay requests can't be run here
+        options = cli.client_options(args)
+        if getattr(args, 'interactive', False) or args.debug or \
+                args.profile or args.profile_dump or \
+                args.record or args.replay or \
+                not cli.has_credentials(options):
+            raise _Fallback()
+
+        self.commands += 1
+        if args.version:
+            six.print_('lavaclient version ' + cli.__version__)
+            return 0
+
+        key = tuple(sorted(options.items()))
+        try:
+            client = self.clients.get(key)
+            if client is None:
+                try:
+                    client = cli.create_client(args)
+                except Exception as exc:
+                    LOG.critical('Error while creating client', exc_info=exc)
+                    six.print_('ERROR: {0}'.format(exc), file=sys.stderr)
+                    return 1
+
+                self.clients[key] = client
+
+            client._bind_cli_args(args)
+            return cli.run_command(client, args)
+        except SystemExit as exc:
+            return _exit_status(exc)
+
+    def control(self, command):
+        if command == 'stop':
+            self._running = False
+            return dict(stopping=True)
+
+        return dict(pid=os.getpid(),
+                    uptime=int(time.time() - self.started),
+                    clients=len(self.clients),
+                    commands=self.commands)
+
+    def handle_timeout(self):
+        LOG.info('lava daemon idle for %d seconds; exiting', self.timeout)
+        self._running = False
+
+    def serve(self):
+        """Handle commands until stopped or idle"""
+        self._running = True
+        try:
+            while self._running:
+                self.handle_request()
+        finally:
+            self.close()
+
+    def close(self):
+        self.server_close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+        for client in self.clients.values():
+            client.close()
+        self.clients = {}
+
+
+def _control(path, command):
+    sock = _connect(path, timeout=START_TIMEOUT)
+    sock_file = sock.makefile('rwb')
+    try:
+        _send(sock_file, dict(control=command))
+        return next(_receive(sock_file))
+    finally:
+        sock_file.close()
+        sock.close()
+
+
+def status(path=None):
+    """
+    Get the state of the running daemon.
+
+    :returns: `dict` with `pid`, `uptime`, `clients`, and `commands` keys, or
+              `None` if no daemon is running
+    """
+    try:
+        return _control(socket_path(path), 'status')
+    except (socket.error, StopIteration):
+        return None
+
+
+def start(path=None, idle_timeout=DEFAULT_IDLE_TIMEOUT):
+    """
+    Start a daemon in the background, unless one is already running.
+
+    :returns: :func:`status` of the daemon
+    """
+    path = socket_path(path)
+    state = status(path)
+    if state is not None:
+        return state
+
+    if os.path.exists(path):
+        LOG.debug('Removing stale lava daemon socket %s', path)
+        os.remove(path)
+
+    with open(os.devnull, 'r+') as devnull:
+        subprocess.Popen(
+            [sys.executable, '-m', 'lavaclient.daemon', 'run',
+             '--socket', path, '--idle-timeout', str(idle_timeout)],
+            stdin=devnull, stdout=devnull, stderr=devnull, close_fds=True,
+            preexec_fn=os.setsid)
+
+    deadline = time.time() + START_TIMEOUT
+    while time.time() < deadline:
+        state = status(path)
+        if state is not None:
+            return state
+        time.sleep(0.05)
+
+    raise RuntimeError('lava daemon did not start within {0} seconds'.format(
+        START_TIMEOUT))
+
+
+def stop(path=None):
+    """Stop the running daemon; returns `False` if none was running"""
+    try:
+        _control(socket_path(path), 'stop')
+    except (socket.error, StopIteration):
+        return False
+
+    return True
+
+
+def main(argv=None):
+    """Entry point for `lava daemon`; returns the exit status"""
+    parser = argparse.ArgumentParser(
+        prog='lava daemon',
+        description='Run lava commands in a long-lived background process. '
+                    'While the daemon is running, lava commands are sent to '
+                    'it automatically; set LAVA_NO_DAEMON=1 to bypass it.')
+    parser.add_argument('action', choices=('start', 'stop', 'status', 'run'),
+                        help='run stays in the foreground')
+    parser.add_argument('--socket', help='Socket path (default: '
+                                         '$LAVA_DAEMON_SOCKET or '
+                                         '{0})'.format(DEFAULT_SOCKET))
+    parser.add_argument('--idle-timeout', type=int,
+                        default=DEFAULT_IDLE_TIMEOUT,
+                        help='Exit after this many seconds without commands')
+    args = parser.parse_args(argv)
+    path = socket_path(args.socket)
+
+    if args.action == 'run':
+        if status(path) is not None:
+            six.print_('ERROR: lava daemon is already running',
+                       file=sys.stderr)
+            return 1
+        if os.path.exists(path):
+            os.remove(path)
+
+        Daemon(path, idle_timeout=args.idle_timeout).serve()
+        return 0
+    elif args.action == 'start':
+        try:
+            state = start(path, idle_timeout=args.idle_timeout)
+        except RuntimeError as exc:
+            six.print_('ERROR: {0}'.format(exc), file=sys.stderr)
+            return 1
+    elif args.action == 'stop':
+        if not stop(path):
+            six.print_('lava daemon is not running', file=sys.stderr)
+            return 1
+        return 0
+    else:
+        state = status(path)
+        if state is None:
+            six.print_('lava daemon is not running', file=sys.stderr)
+            return 1
+
+    six.print_('lava daemon running with PID {pid} on {0}; {commands} '
+               'commands, {clients} clients'.format(path, **state))
+    return 0
+
+
+if __name__ == '__main__':  # pragma: nocover
+    sys.exit(main())
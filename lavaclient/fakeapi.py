@@ -0,0 +1,855 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""
+In-process fake of the Cloud Big Data v2 API and of Keystone v2.0
+authentication, for tests and benchmarks that should exercise the real HTTP
+path of :class:`~lavaclient.Lava` without a network.
+
+The fake serves clusters, nodes, stacks, flavors, distros, scripts,
+credentials, and limits generated from a few size parameters, and can add
+latency, fail requests, expire tokens, and move clusters through their
+states::
+
+    with FakeServer(clusters=100, latency=0.01, build_time=1) as server:
+        lava = server.client()
+        cluster = lava.clusters.create('name', server.api.stack_ids[0],
+                                       ssh_keys=['mykey'])
+        lava.clusters.wait(cluster.id)
+"""
+
+import fnmatch
+import json
+import logging
+import random
+import re
+import threading
+import time
+import uuid
+import six
+from collections import namedtuple, deque
+from copy import deepcopy
+from six.moves import BaseHTTPServer, socketserver
+from six.moves.urllib.parse import urlsplit
+
+from lavaclient import constants
+from lavaclient.log import NullHandler
+
+
+LOG = logging.getLogger(__name__)
+LOG.addHandler(NullHandler())
+
+
+DEFAULT_TENANT_ID = '12345'
+DEFAULT_REGION = 'DFW'
+
+# Number of handled requests kept in FakeApi.log
+DEFAULT_LOG_SIZE = 10000
+
+# (id, ram, vcpus, disk) of generated flavors, smallest first
+FLAVOR_SIZES = (
+    ('hadoop1-7', 7680, 2, 1250),
+    ('hadoop1-15', 15360, 4, 2500),
+    ('hadoop1-30', 30720, 8, 5000),
+    ('hadoop1-60', 61440, 16, 10000),
+    ('hadoop1-120', 122880, 32, 20000),
+)
+
+CREDENTIAL_KEYS = dict(
+    ssh_keys='key_name',
+    cloud_files='username',
+    s3='access_key_id',
+    ambari='username',
+)
+
+
+HandledRequest = namedtuple('HandledRequest', ['method', 'path', 'status'])
+
+
+class _Fault(Exception):
+
+    def __init__(self, status, message):
+        super(_Fault, self).__init__(message)
+        self.status = status
+        self.message = message
+
+
+def _timestamp(when=None):
+    return time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(when))
+
+
+def _links(path):
+    return [{'rel': 'self', 'href': path}]
+
+
+def _unwrap(data, key):
+    """Request body with an optional wrapper key removed"""
+    if not isinstance(data, dict):
+        raise _Fault(400, 'Request body must be a JSON object')
+
+    data = data.get(key, data)
+    if not isinstance(data, dict):
+        raise _Fault(400, 'Request body must be a JSON object')
+
+    return data
+
+
+class FakeApi(object):
+
+    """
+    State and request handling of a fake Cloud Big Data API, along with the
+    Keystone token endpoint. Thread safe; usually served by
+    :class:`FakeServer`, but :meth:`handle` may be called directly.
+
+    :param tenant_id: Tenant in the API's URLs and the service catalog
+    :param clusters: Number of generated ACTIVE clusters
+    :param nodes: Number of slave nodes in each generated cluster, in addition
+                  to one master node
+    :param stacks: Number of generated stacks
+    :param distros: Number of generated distros
+    :param scripts: Number of generated scripts
+    :param credentials: Number of generated credentials of each type
+    :param node_quota: `node_count` limit of the tenant
+    :param latency: Seconds added to every response, or a function of
+                    `(method, path)` returning them
+    :param error_rate: Fraction of API requests, chosen at random, that fail
+                       with `error_status`
+    :param error_status: HTTP status of random failures
+    :param token_ttl: Seconds after which tokens are rejected with a 401; they
+                      are advertised as valid for a day, as if revoked early
+    :param build_time: Seconds for which new, resized, or deleted clusters are
+                       BUILDING, UPDATING, or DELETING
+    :param seed: Seed of the random failures
+    """
+
+    def __init__(self,
+                 tenant_id=DEFAULT_TENANT_ID,
+                 clusters=10,
+                 nodes=3,
+                 stacks=5,
+                 distros=2,
+                 scripts=5,
+                 credentials=2,
+                 node_quota=1000,
+                 latency=0,
+                 error_rate=0,
+                 error_status=500,
+                 token_ttl=None,
+                 build_time=0,
+                 seed=0):
+        self.tenant_id = six.text_type(tenant_id)
+        self.node_quota = node_quota
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.token_ttl = token_ttl
+        self.build_time = build_time
+        self.log = deque(maxlen=DEFAULT_LOG_SIZE)
+
+        # Base URL of the server, used in links and the service catalog
+        self.url = 'http://localhost'
+
+        self._random = random.Random(seed)
+        self._lock = threading.RLock()
+        self._tokens = {}
+        self._failures = []
+        self._transitions = []
+        self._counter = 0
+
+        self._flavors = [self._make_flavor(*size) for size in FLAVOR_SIZES]
+        self._distros = [self._make_distro(index)
+                         for index in six.moves.range(distros)]
+        self._stacks = dict((stack['id'], stack) for stack in (
+            self._make_stack(index) for index in six.moves.range(stacks)))
+        self._scripts = dict((script['id'], script) for script in (
+            self._make_script(index) for index in six.moves.range(scripts)))
+        self._credentials = dict(
+            (kind, [self._make_credential(kind, index)
+                    for index in six.moves.range(credentials)])
+            for kind in CREDENTIAL_KEYS)
+
+        self._clusters = {}
+        self._nodes = {}
+        for _ in six.moves.range(clusters):
+            self._add_cluster(dict(username='username',
+                                   stack_id=self.stack_ids[0]),
+                              nodes=nodes, status='ACTIVE')
+
+    ######################################################################
+    # Generated data
+    ######################################################################
+
+    def _next_id(self, prefix):
+        self._counter += 1
+        return '{0}-{1:04d}'.format(prefix, self._counter)
+
+    def _make_flavor(self, flavor_id, ram, vcpus, disk):
+        return dict(id=flavor_id, name='{0} GB Hadoop Instance'.format(
+                        ram // 1024),
+                    ram=ram, vcpus=vcpus, disk=disk,
+                    links=_links('flavors/' + flavor_id))
+
+    def _make_distro(self, index):
+        distro_id = 'HDP2.{0}'.format(index + 2)
+        return dict(
+            id=distro_id,
+            name='HortonWorks Data Platform',
+            version='2.{0}'.format(index + 2),
+            links=_links('distros/' + distro_id),
+            services=[dict(name=name, version='2.{0}'.format(index + 2),
+                           description=name,
+                           components=[dict(name=name + '_master')])
+                      for name in ('HDFS', 'YARN', 'Hive', 'Spark')])
+
+    def _make_stack(self, index):
+        stack_id = self._next_id('stack')
+        services = [dict(name=name, modes=[], version='2.2',
+                         components=[dict(name=name + '_master')])
+                    for name in ('HDFS', 'YARN')]
+        return dict(
+            id=stack_id,
+            name='Stack {0}'.format(index),
+            distro='HDP2.2',
+            description='Generated stack',
+            services=services,
+            created=_timestamp(),
+            links=_links('stacks/' + stack_id),
+            node_groups=[
+                dict(id='master', flavor_id='hadoop1-15', count=1,
+                     components=[dict(name='Namenode')],
+                     resource_limits=dict(min_count=1, max_count=1,
+                                          min_ram=15360)),
+                dict(id='slave', flavor_id='hadoop1-7', count=3,
+                     components=[dict(name='Datanode')],
+                     resource_limits=dict(min_count=1, max_count=100,
+                                          min_ram=7680)),
+            ])
+
+    def _make_script(self, index, **data):
+        script_id = self._next_id('script')
+        script = dict(id=script_id, name='script{0}'.format(index),
+                      type='POST_INIT',
+                      url='http://example.com/script{0}.sh'.format(index),
+                      is_public=False, created=_timestamp(),
+                      updated=_timestamp(), links=_links('scripts/' +
+                                                         script_id))
+        script.update(data)
+        return script
+
+    def _make_credential(self, kind, index):
+        name = '{0}{1:03d}'.format(CREDENTIAL_KEYS[kind][:3], index)
+        if kind == 'ssh_keys':
+            return dict(key_name=name, public_key='ssh-rsa ' + 'A' * 50)
+        elif kind == 'cloud_files':
+            return dict(username=name, api_key='a' * 32)
+        elif kind == 's3':
+            return dict(access_key_id=name.upper().ljust(20, 'X'),
+                        access_secret_key='a' * 40)
+        return dict(username=name, password='password')
+
+    def _make_nodes(self, cluster_id, node_groups, status):
+        nodes = []
+        for group in node_groups:
+            for index in six.moves.range(1, group['count'] + 1):
+                node_id = self._next_id('node')
+                number = self._counter
+                name = '{0}-{1}'.format(group['id'].upper(), index)
+                nodes.append(dict(
+                    id=node_id,
+                    name=name,
+                    status=status,
+                    created=_timestamp(),
+                    updated=None,
+                    flavor_id=group['flavor_id'],
+                    node_group=group['id'],
+                    addresses=dict(
+                        public=[dict(addr='10.1.{0}.{1}'.format(
+                            number // 250 % 250, number % 250 + 1),
+                            version='4.0')],
+                        private=[dict(addr='10.2.{0}.{1}'.format(
+                            number // 250 % 250, number % 250 + 1),
+                            version='4.0')]),
+                    components=[dict(name=component['name'],
+                                     nice_name=component['name'],
+                                     uri='http://{0}:8080'.format(name))
+                                for component in group['components']],
+                    links=_links('clusters/{0}/nodes/{1}'.format(cluster_id,
+                                                                 node_id))))
+        return nodes
+
+    def _add_cluster(self, data, nodes=None, status='BUILDING'):
+        stack = self._stacks.get(data.get('stack_id'))
+        if stack is None:
+            raise _Fault(404, 'Stack {0} not found'.format(
+                data.get('stack_id')))
+
+        counts = dict((group['id'], group.get('count'))
+                      for group in data.get('node_groups') or ())
+        if nodes is not None:
+            counts.setdefault('slave', nodes)
+
+        node_groups = []
+        for group in stack['node_groups']:
+            node_groups.append(dict(
+                id=group['id'],
+                flavor_id=group['flavor_id'],
+                count=counts.get(group['id']) or group['count'],
+                components=deepcopy(group['components'])))
+
+        if self._used('node_count') + sum(
+                group['count'] for group in node_groups) > self.node_quota:
+            raise _Fault(413, 'Node count quota exceeded')
+
+        cluster_id = self._next_id('cluster')
+        cluster = dict(
+            id=cluster_id,
+            name=data.get('name') or cluster_id,
+            created=_timestamp(),
+            updated=None,
+            status=status,
+            stack_id=stack['id'],
+            cbd_version=2,
+            links=_links('clusters/' + cluster_id),
+            node_groups=node_groups,
+            username=data.get('username') or 'username',
+            scripts=[dict(id=script['id'], name=script['id'],
+                          status='PENDING')
+                     for script in data.get('scripts') or ()],
+            progress=1.0 if status == 'ACTIVE' else 0.0,
+            credentials=[dict(type='ssh_keys', name=name)
+                         for name in data.get('ssh_keys') or ()])
+
+        self._clusters[cluster_id] = cluster
+        self._nodes[cluster_id] = self._make_nodes(cluster_id, node_groups,
+                                                   status)
+        return cluster
+
+    ######################################################################
+    # Control
+    ######################################################################
+
+    @property
+    def cluster_ids(self):
+        with self._lock:
+            return sorted(self._clusters)
+
+    @property
+    def stack_ids(self):
+        with self._lock:
+            return sorted(self._stacks)
+
+    def issue_token(self):
+        """Create a valid token, as if returned by Keystone"""
+        token = uuid.uuid4().hex
+        with self._lock:
+            self._tokens[token] = (None if self.token_ttl is None
+                                   else time.time() + self.token_ttl)
+        return token
+
+    def expire_tokens(self):
+        """Reject all tokens issued so far with a 401"""
+        with self._lock:
+            self._tokens.clear()
+
+    def fail(self, status, method=None, path='*', count=1, message=None):
+        """
+        Fail the next `count` API requests that match with the given status
+
+        :param method: HTTP method of requests to fail, or `None` for all
+        :param path: `fnmatch` pattern of the paths, relative to the tenant
+                     endpoint, of requests to fail, e.g. `clusters/*`
+        """
+        with self._lock:
+            self._failures.append([status, method, path, count,
+                                   message or 'Injected failure'])
+
+    def transition(self):
+        """Finish all pending cluster state transitions now"""
+        with self._lock:
+            for transition in self._transitions:
+                transition[0] = 0
+            self._advance()
+
+    def set_status(self, cluster_id, status):
+        """Change the status of a cluster and its nodes"""
+        with self._lock:
+            cluster = self._cluster(cluster_id)
+            cluster['status'] = status
+            cluster['updated'] = _timestamp()
+            cluster['progress'] = 1.0 if status == 'ACTIVE' else 0.5
+            for node in self._nodes[cluster_id]:
+                node['status'] = status
+
+    def _schedule(self, cluster_id, status):
+        """Change the status of a cluster after `build_time`; `None` removes
+        the cluster"""
+        self._transitions.append([time.time() + self.build_time, cluster_id,
+                                  status])
+
+    def _advance(self):
+        now = time.time()
+        due = [transition for transition in self._transitions
+               if transition[0] <= now]
+        self._transitions = [transition for transition in self._transitions
+                             if transition[0] > now]
+
+        for _, cluster_id, status in due:
+            if cluster_id not in self._clusters:
+                continue
+            elif status is None:
+                del self._clusters[cluster_id]
+                del self._nodes[cluster_id]
+            else:
+                self.set_status(cluster_id, status)
+
+    ######################################################################
+    # Request handling
+    ######################################################################
+
+    def handle(self, method, path, headers=None, body=None):
+        """
+        Handle one HTTP request
+
+        :param path: Request path, including the `/v2/<tenant_id>` or
+                     `/v2.0` prefix
+        :param headers: Request headers
+        :param body: JSON request body, or `None`
+        :returns: Tuple of response status and JSON-serializable data, which
+                  is `None` if there is no response body
+        """
+        method = method.upper()
+        path = urlsplit(path).path
+        latency = self.latency(method, path) if callable(self.latency) \
+            else self.latency
+        if latency:
+            time.sleep(latency)
+
+        try:
+            data = json.loads(body) if body else None
+        except ValueError:
+            data = None
+
+        try:
+            with self._lock:
+                status, result = self._dispatch(method, path,
+                                                headers or {}, data)
+        except _Fault as exc:
+            status, result = exc.status, {'fault': {'code': exc.status,
+                                                    'message': exc.message}}
+
+        with self._lock:
+            self.log.append(HandledRequest(method, path, status))
+        return status, result
+
+    def _dispatch(self, method, path, headers, data):
+        if path.rstrip('/') == '/v2.0/tokens':
+            if method != 'POST':
+                raise _Fault(405, 'Method not allowed')
+            return 200, self._keystone_tokens(data)
+
+        prefix = '/v2/{0}/'.format(self.tenant_id)
+        if not path.startswith(prefix):
+            raise _Fault(404, 'Not found')
+        path = path[len(prefix):].strip('/')
+
+        token = dict((key.lower(), value)
+                     for key, value in headers.items()).get('x-auth-token')
+        expires = self._tokens.get(token, 0)
+        if expires == 0 or (expires is not None and expires < time.time()):
+            raise _Fault(401, 'Invalid or expired token')
+
+        self._advance()
+        self._inject_failure(method, path)
+
+        for route_method, pattern, name in ROUTES:
+            match = re.match(pattern + '$', path)
+            if match and route_method == method:
+                return getattr(self, name)(data, *match.groups())
+
+        raise _Fault(404, 'No route for {0} {1}'.format(method, path))
+
+    def _inject_failure(self, method, path):
+        for failure in self._failures:
+            status, fail_method, pattern, count, message = failure
+            if fail_method not in (None, method) or \
+                    not fnmatch.fnmatch(path, pattern):
+                continue
+
+            failure[3] -= 1
+            if failure[3] <= 0:
+                self._failures.remove(failure)
+            raise _Fault(status, message)
+
+        if self.error_rate and self._random.random() < self.error_rate:
+            raise _Fault(self.error_status, 'Random failure')
+
+    def _keystone_tokens(self, data):
+        auth = (data or {}).get('auth') or {}
+        if not any(key in auth for key in ('RAX-KSKEY:apiKeyCredentials',
+                                           'passwordCredentials')):
+            raise _Fault(401, 'Unable to authenticate user with credentials '
+                              'provided')
+
+        return {
+            'access': {
+                'token': {
+                    'id': self.issue_token(),
+                    'expires': _timestamp(time.time() + 86400),
+                    'tenant': {'id': self.tenant_id,
+                               'name': self.tenant_id},
+                },
+                'user': {
+                    'id': 'username',
+                    'name': 'username',
+                    'roles': [],
+                    'roles_links': [],
+                },
+                'serviceCatalog': [{
+                    'name': constants.CBD_SERVICE_NAME,
+                    'type': constants.CBD_SERVICE_TYPE,
+                    'endpoints': [{
+                        'tenantId': self.tenant_id,
+                        'publicURL': '{0}/v2/{1}'.format(self.url,
+                                                         self.tenant_id),
+                        'region': DEFAULT_REGION,
+                        'versionId': '2',
+                    }],
+                    'endpoints_links': [],
+                }],
+            },
+        }
+
+    def _cluster(self, cluster_id):
+        try:
+            return self._clusters[cluster_id]
+        except KeyError:
+            raise _Fault(404, 'Cluster {0} not found'.format(cluster_id))
+
+    def _used(self, limit):
+        flavors = dict((flavor['id'], flavor) for flavor in self._flavors)
+        used = 0
+        for cluster in self._clusters.values():
+            for group in cluster['node_groups']:
+                if limit == 'node_count':
+                    used += group['count']
+                else:
+                    used += group['count'] * flavors[group['flavor_id']][limit]
+        return used
+
+    ######################################################################
+    # Routes
+    ######################################################################
+
+    def list_clusters(self, data):
+        summary_keys = ('id', 'created', 'updated', 'name', 'status',
+                        'stack_id', 'cbd_version', 'links')
+        return 200, {'clusters': [
+            dict((key, self._clusters[cluster_id][key])
+                 for key in summary_keys)
+            for cluster_id in sorted(self._clusters)]}
+
+    def get_cluster(self, data, cluster_id):
+        return 200, {'cluster': self._cluster(cluster_id)}
+
+    def create_cluster(self, data):
+        data = _unwrap(data, 'cluster')
+        if not data.get('name'):
+            raise _Fault(400, 'Cluster name is required')
+
+        cluster = self._add_cluster(data)
+        self._schedule(cluster['id'], 'ACTIVE')
+        return 200, {'cluster': cluster}
+
+    def update_cluster(self, data, cluster_id):
+        cluster = self._cluster(cluster_id)
+        counts = dict((group['id'], group['count'])
+                      for group in _unwrap(data, 'cluster').get(
+                          'node_groups') or ())
+
+        for group in cluster['node_groups']:
+            group['count'] = counts.get(group['id'], group['count'])
+        self._nodes[cluster_id] = self._make_nodes(
+            cluster_id, cluster['node_groups'], 'UPDATING')
+        self.set_status(cluster_id, 'UPDATING')
+        self._schedule(cluster_id, 'ACTIVE')
+        return 200, {'cluster': cluster}
+
+    def delete_cluster(self, data, cluster_id):
+        self._cluster(cluster_id)
+        self.set_status(cluster_id, 'DELETING')
+        self._schedule(cluster_id, None)
+        return 204, None
+
+    def list_nodes(self, data, cluster_id):
+        self._cluster(cluster_id)
+        return 200, {'nodes': self._nodes[cluster_id]}
+
+    def list_flavors(self, data):
+        return 200, {'flavors': self._flavors}
+
+    def list_distros(self, data):
+        return 200, {'distros': [
+            dict((key, value) for key, value in distro.items()
+                 if key != 'services')
+            for distro in self._distros]}
+
+    def get_distro(self, data, distro_id):
+        for distro in self._distros:
+            if distro['id'] == distro_id:
+                return 200, {'distro': distro}
+
+        raise _Fault(404, 'Distro {0} not found'.format(distro_id))
+
+    def list_stacks(self, data):
+        return 200, {'stacks': [
+            dict((key, value) for key, value in self._stacks[stack_id].items()
+                 if key not in ('created', 'node_groups'))
+            for stack_id in sorted(self._stacks)]}
+
+    def get_stack(self, data, stack_id):
+        try:
+            return 200, {'stack': self._stacks[stack_id]}
+        except KeyError:
+            raise _Fault(404, 'Stack {0} not found'.format(stack_id))
+
+    def create_stack(self, data):
+        data = _unwrap(data, 'stack')
+        stack = self._make_stack(len(self._stacks))
+        stack.update((key, value) for key, value in data.items()
+                     if key in ('name', 'description', 'distro', 'services'))
+        stack['node_groups'] = [
+            dict(group, resource_limits=dict(min_count=1, max_count=100,
+                                             min_ram=7680))
+            for group in data.get('node_groups') or stack['node_groups']]
+        self._stacks[stack['id']] = stack
+        return 200, {'stack': stack}
+
+    def delete_stack(self, data, stack_id):
+        self.get_stack(data, stack_id)
+        del self._stacks[stack_id]
+        return 204, None
+
+    def list_scripts(self, data):
+        return 200, {'scripts': [self._scripts[script_id]
+                                 for script_id in sorted(self._scripts)]}
+
+    def create_script(self, data):
+        data = _unwrap(data, 'script')
+        script = self._make_script(len(self._scripts), **dict(
+            (key, data[key]) for key in ('name', 'url', 'type')
+            if data.get(key)))
+        self._scripts[script['id']] = script
+        return 200, {'script': script}
+
+    def update_script(self, data, script_id):
+        if script_id not in self._scripts:
+            raise _Fault(404, 'Script {0} not found'.format(script_id))
+
+        script = self._scripts[script_id]
+        script.update((key, value)
+                      for key, value in _unwrap(data, 'script').items()
+                      if key in ('name', 'url', 'type') and value)
+        script['updated'] = _timestamp()
+        return 200, {'script': script}
+
+    def delete_script(self, data, script_id):
+        if self._scripts.pop(script_id, None) is None:
+            raise _Fault(404, 'Script {0} not found'.format(script_id))
+        return 204, None
+
+    def list_credentials(self, data, kind=None):
+        if kind is None:
+            return 200, {'credentials': self._credentials}
+        elif kind not in self._credentials:
+            raise _Fault(404, 'Unknown credential type {0}'.format(kind))
+        return 200, {'credentials': {kind: self._credentials[kind]}}
+
+    def _find_credential(self, kind, name):
+        for credential in self._credentials[kind]:
+            if credential[CREDENTIAL_KEYS[kind]] == name:
+                return credential
+
+        raise _Fault(404, 'Credential {0} not found'.format(name))
+
+    def create_credential(self, data, kind):
+        credential = dict(_unwrap(data, kind))
+        name = credential.get(CREDENTIAL_KEYS[kind])
+        if any(item[CREDENTIAL_KEYS[kind]] == name
+               for item in self._credentials[kind]):
+            raise _Fault(409, 'Credential {0} already exists'.format(name))
+
+        self._credentials[kind].append(credential)
+        return 200, {'credentials': {kind: credential}}
+
+    def update_credential(self, data, kind, name):
+        credential = self._find_credential(kind, name)
+        credential.update(_unwrap(data, kind))
+        return 200, {'credentials': {kind: credential}}
+
+    def delete_credential(self, data, kind, name):
+        self._credentials[kind].remove(self._find_credential(kind, name))
+        return 204, None
+
+    def get_limits(self, data):
+        limits = dict(node_count=self.node_quota, ram=self.node_quota * 61440,
+                      vcpus=self.node_quota * 16,
+                      disk=self.node_quota * 10000)
+        return 200, {'limits': {
+            'absolute': dict(
+                (name, {'limit': limit,
+                        'remaining': max(limit - self._used(name), 0)})
+                for name, limit in limits.items()),
+            'links': _links('limits'),
+        }}
+
+
+_CREDENTIAL_TYPES = '(' + '|'.join(CREDENTIAL_KEYS) + ')'
+
+# (method, path pattern, FakeApi method) of each API route
+ROUTES = (
+    ('GET', r'clusters', 'list_clusters'),
+    ('POST', r'clusters', 'create_cluster'),
+    ('GET', r'clusters/([^/]+)', 'get_cluster'),
+    ('PUT', r'clusters/([^/]+)', 'update_cluster'),
+    ('DELETE', r'clusters/([^/]+)', 'delete_cluster'),
+    ('GET', r'clusters/([^/]+)/nodes', 'list_nodes'),
+    ('GET', r'flavors', 'list_flavors'),
+    ('GET', r'distros', 'list_distros'),
+    ('GET', r'distros/([^/]+)', 'get_distro'),
+    ('GET', r'stacks', 'list_stacks'),
+    ('POST', r'stacks', 'create_stack'),
+    ('GET', r'stacks/([^/]+)', 'get_stack'),
+    ('DELETE', r'stacks/([^/]+)', 'delete_stack'),
+    ('GET', r'scripts', 'list_scripts'),
+    ('POST', r'scripts', 'create_script'),
+    ('PUT', r'scripts/([^/]+)', 'update_script'),
+    ('DELETE', r'scripts/([^/]+)', 'delete_script'),
+    ('GET', r'credentials', 'list_credentials'),
+    ('GET', r'credentials/' + _CREDENTIAL_TYPES, 'list_credentials'),
+    ('POST', r'credentials/' + _CREDENTIAL_TYPES, 'create_credential'),
+    ('PUT', r'credentials/' + _CREDENTIAL_TYPES + r'/([^/]+)',
+     'update_credential'),
+    ('DELETE', r'credentials/' + _CREDENTIAL_TYPES + r'/([^/]+)',
+     'delete_credential'),
+    ('GET', r'limits', 'get_limits'),
+)
+
+
+class _Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    # Keep connections alive, as the real API does
+    protocol_version = 'HTTP/1.1'
+
+    # Headers and body are written separately; without TCP_NODELAY, the body
+    # of each response on a reused connection waits for a delayed ACK
+    disable_nagle_algorithm = True
+
+    def _handle(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length).decode('utf8') if length else None
+
+        status, data = self.server.api.handle(
+            self.command, self.path, dict(self.headers.items()), body)
+
+        payload = b'' if data is None else json.dumps(data).encode('utf8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    do_GET = do_POST = do_PUT = do_DELETE = _handle
+
+    def log_message(self, format, *args):
+        LOG.debug(format, *args)
+
+
+class _Server(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+
+    daemon_threads = True
+
+
+class FakeServer(object):
+
+    """
+    HTTP server for a :class:`FakeApi`, running in a background thread on a
+    local port. Use as a context manager, or call :meth:`start` and
+    :meth:`stop`.
+
+    :param api: :class:`FakeApi` to serve; if `None`, one is created with the
+                remaining keyword arguments
+    :param host: Address to listen on
+    :param port: Port to listen on; by default, any free port
+    """
+
+    def __init__(self, api=None, host='127.0.0.1', port=0, **kwargs):
+        self.api = api if api is not None else FakeApi(**kwargs)
+        self._address = (host, port)
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return 'http://{0}:{1}'.format(host, port)
+
+    @property
+    def auth_url(self):
+        """Keystone URL, to be passed as `auth_url` to
+        :class:`~lavaclient.Lava`"""
+        return self.url + '/v2.0'
+
+    @property
+    def endpoint(self):
+        """Cloud Big Data endpoint, including the tenant ID"""
+        return '{0}/v2/{1}'.format(self.url, self.api.tenant_id)
+
+    def start(self):
+        self._server = _Server(self._address, _Handler)
+        self._server.api = self.api
+        self.api.url = self.url
+
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        kwargs=dict(poll_interval=0.05))
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._thread.join()
+            self._server = self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def client(self, **kwargs):
+        """
+        :class:`~lavaclient.Lava` client of the fake API; by default it
+        authenticates with an API key through the fake Keystone
+
+        :param kwargs: Options of the client, overriding the defaults
+        """
+        from lavaclient.client import Lava
+
+        options = dict(username='username', region=DEFAULT_REGION,
+                       api_key='api_key', auth_url=self.auth_url,
+                       tenant_id=self.api.tenant_id)
+        if kwargs.get('token'):
+            options.update(endpoint=self.endpoint, api_key=None)
+        options.update(kwargs)
+        return Lava(**options)
@@ -0,0 +1,384 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""
+Declarative management of a fleet of clusters: compute the difference between
+a desired description of clusters and the clusters that exist, then create,
+resize, and delete clusters until they match
+"""
+
+import logging
+import six
+from collections import namedtuple
+from copy import deepcopy
+from datetime import datetime, timedelta
+
+from lavaclient import error
+from lavaclient.log import NullHandler
+from lavaclient.util import parallel_map, print_table
+
+
+LOG = logging.getLogger(__name__)
+LOG.addHandler(NullHandler())
+
+
+CREATE = 'create'
+RESIZE = 'resize'
+DELETE = 'delete'
+
+# Clusters in these states are on their way out and are ignored
+GONE_STATES = frozenset(['DELETING', 'DELETED'])
+
+# Keys that every desired cluster must have
+REQUIRED_KEYS = ('name', 'stack_id')
+
+
+# A single change to the fleet. `spec` is the keyword arguments to
+# clusters.create for `create` actions, the changed node groups for `resize`
+# actions, and `None` for `delete` actions
+Action = namedtuple('Action', ['kind', 'name', 'cluster_id', 'spec'])
+
+ActionResult = namedtuple('ActionResult', ['action', 'cluster', 'error'])
+
+
+def _node_groups(node_groups):
+    """Transform node groups (list of dicts, or dict of dicts) into a dict of
+    node group ID to attributes"""
+    if isinstance(node_groups, dict):
+        return dict((key, dict(value, id=key))
+                    for key, value in six.iteritems(node_groups))
+
+    return dict((group['id'], dict(group)) for group in node_groups or [])
+
+
+def _desired_specs(desired):
+    """Transform desired fleet (list of create specs, or dict of cluster name
+    to create spec) into a list of specs"""
+    if isinstance(desired, dict):
+        specs = [dict(spec, name=name)
+                 for name, spec in six.iteritems(desired)]
+    else:
+        specs = [dict(spec) for spec in desired]
+
+    for index, spec in enumerate(specs):
+        missing = [key for key in REQUIRED_KEYS if not spec.get(key)]
+        if missing:
+            raise error.InvalidError(
+                'Desired cluster {0} is missing {1}'.format(
+                    spec.get('name', '#{0}'.format(index + 1)),
+                    ', '.join(missing)))
+
+    return specs
+
+
+class Plan(object):
+
+    """The actions required to reconcile the fleet, plus any differences
+    that could not be reconciled (`conflicts`)"""
+
+    def __init__(self, actions=None, conflicts=None):
+        self.actions = actions or []
+        self.conflicts = conflicts or []
+
+    def _of_kind(self, kind):
+        return [action for action in self.actions if action.kind == kind]
+
+    @property
+    def creates(self):
+        return self._of_kind(CREATE)
+
+    @property
+    def resizes(self):
+        return self._of_kind(RESIZE)
+
+    @property
+    def deletes(self):
+        return self._of_kind(DELETE)
+
+    def __len__(self):
+        return len(self.actions)
+
+    def __repr__(self):
+        return 'Plan(creates={0}, resizes={1}, deletes={2}, ' \
+               'conflicts={3})'.format(len(self.creates), len(self.resizes),
+                                       len(self.deletes), len(self.conflicts))
+
+    def to_dict(self):
+        return {
+            'actions': [dict(action._asdict()) for action in self.actions],
+            'conflicts': list(self.conflicts),
+        }
+
+
+class Report(object):
+
+    """Result of :func:`reconcile`"""
+
+    def __init__(self, plan, results=None):
+        self.plan = plan
+        self.results = results or []
+
+    @property
+    def succeeded(self):
+        """`True` if every action succeeded and there were no conflicts"""
+        return not self.plan.conflicts and all(
+            result.error is None for result in self.results)
+
+    def __repr__(self):
+        return 'Report(plan={0!r}, failed={1})'.format(
+            self.plan, sum(1 for result in self.results if result.error))
+
+    def to_dict(self):
+        return {
+            'plan': self.plan.to_dict(),
+            'results': [
+                {'action': dict(result.action._asdict()),
+                 'cluster_id': result.cluster.id if result.cluster else None,
+                 'status': result.cluster.status if result.cluster else None,
+                 'error': str(result.error) if result.error else None}
+                for result in self.results],
+        }
+
+    def display(self):
+        results = dict((id(result.action), result) for result in self.results)
+
+        rows = []
+        for action in self.plan.actions:
+            result = results.get(id(action))
+            if result is None:
+                outcome = 'PLANNED'
+            elif result.error is not None:
+                outcome = 'FAILED: {0}'.format(result.error)
+            else:
+                outcome = 'OK'
+
+            details = ''
+            if action.kind == RESIZE:
+                details = ', '.join('{0}={1}'.format(group['id'],
+                                                     group['count'])
+                                    for group in action.spec)
+            rows.append((action.kind, action.name, action.cluster_id or '',
+                         details, outcome))
+
+        print_table(rows, ('Action', 'Cluster', 'ID', 'Details', 'Result'),
+                    title='Plan')
+
+        if self.plan.conflicts:
+            print_table([(conflict,) for conflict in self.plan.conflicts],
+                        ('Conflict',))
+
+
+def plan(clusters, desired, prune=False, replace=False, concurrency=None):
+    """
+    Compute the actions needed to make the live clusters match `desired`.
+
+    :param clusters: :class:`lavaclient.api.clusters.Resource`
+    :param desired: List of `dicts` of keyword arguments to
+                    :meth:`~lavaclient.api.clusters.Resource.create`, or a
+                    `dict` of cluster name to keyword arguments. Clusters are
+                    identified by name.
+    :param prune: Delete live clusters that are not in `desired`
+    :param replace: Delete and recreate clusters whose stack or node group
+                    flavors differ; otherwise they are reported as conflicts
+    :param concurrency: Maximum number of concurrent API requests
+    :returns: :class:`Plan`
+    """
+    specs = _desired_specs(desired)
+    live = {}
+    conflicts = []
+
+    for cluster in clusters.list():
+        if cluster.status in GONE_STATES:
+            continue
+        if cluster.name in live:
+            conflicts.append('Multiple clusters named {0}'.format(
+                cluster.name))
+        live.setdefault(cluster.name, []).append(cluster)
+
+    wanted = [spec for spec in specs if len(live.get(spec['name'], [])) == 1]
+    details = parallel_map(lambda spec: clusters.get(live[spec['name']][0].id),
+                           wanted, concurrency=concurrency)
+    current = {}
+    for spec, (cluster, exc) in zip(wanted, details):
+        if exc is not None:
+            conflicts.append('Unable to get cluster {0}: {1}'.format(
+                spec['name'], exc))
+        else:
+            current[spec['name']] = cluster
+
+    actions = []
+    for spec in specs:
+        name = spec['name']
+        if name not in live:
+            actions.append(Action(CREATE, name, None, spec))
+            continue
+        elif name not in current:
+            continue
+
+        cluster = current[name]
+        groups = dict((group.id, group) for group in cluster.node_groups)
+        changed = []
+        recreate = cluster.stack_id != spec['stack_id']
+
+        for group_id, group in six.iteritems(_node_groups(
+                spec.get('node_groups'))):
+            live_group = groups.get(group_id)
+            if live_group is None:
+                conflicts.append('Cluster {0} has no node group {1}'.format(
+                    name, group_id))
+            elif group.get('flavor_id', live_group.flavor_id) != \
+                    live_group.flavor_id:
+                recreate = True
+            elif int(group.get('count', live_group.count)) != \
+                    live_group.count:
+                changed.append({'id': group_id, 'count': int(group['count']),
+                                'from': live_group.count})
+
+        if recreate:
+            if replace:
+                actions.append(Action(DELETE, name, cluster.id, None))
+                actions.append(Action(CREATE, name, None, spec))
+            else:
+                conflicts.append('Cluster {0} must be recreated to change '
+                                 'its stack or flavors'.format(name))
+        elif changed:
+            if cluster.status != 'ACTIVE':
+                conflicts.append('Cluster {0} can not be resized while '
+                                 '{1}'.format(name, cluster.status))
+            else:
+                actions.append(Action(RESIZE, name, cluster.id, changed))
+
+    if prune:
+        names = set(spec['name'] for spec in specs)
+        actions.extend(Action(DELETE, name, cluster.id, None)
+                       for name, named in sorted(six.iteritems(live))
+                       if name not in names for cluster in named)
+
+    return Plan(actions, conflicts)
+
+
+def _shrinks(action):
+    return action.kind == RESIZE and all(
+        group['count'] < group['from'] for group in action.spec)
+
+
+def _remaining_minutes(timeout_date):
+    if timeout_date is None:
+        return None
+
+    return max((timeout_date - datetime.now()).total_seconds() / 60.0,
+               1.0 / 60)
+
+
+def reconcile(clusters, desired, prune=False, replace=False, dry_run=False,
+              concurrency=None, interval=None, timeout=None):
+    """
+    Create, resize, and delete clusters so that they match `desired`. See
+    :func:`plan` for the meaning of the arguments.
+
+    Deletes and shrinking resizes run first, and are waited on, so that the
+    quota they release is available to creates and growing resizes. Creates
+    go through :meth:`~lavaclient.api.clusters.Resource.create_many`, so they
+    are admitted according to the remaining quota. All clusters affected by a
+    stage are waited on together.
+
+    :param dry_run: Only compute the plan
+    :param interval: Poll interval (in seconds)
+    :param timeout: Overall timeout in minutes (default: no timeout)
+    :returns: :class:`Report`
+    """
+    the_plan = plan(clusters, desired, prune=prune, replace=replace,
+                    concurrency=concurrency)
+    if dry_run or not the_plan.actions:
+        return Report(the_plan)
+
+    timeout_date = None
+    if timeout:
+        timeout_date = datetime.now() + timedelta(minutes=timeout)
+
+    def resize(action):
+        return clusters.resize(action.cluster_id, node_groups=[
+            {'id': group['id'], 'count': group['count']}
+            for group in action.spec])
+
+    def run(action):
+        if action.kind == DELETE:
+            return clusters.delete(action.cluster_id)
+        return resize(action)
+
+    results = []
+
+    def submit_and_wait(actions, deleted=False):
+        submitted = parallel_map(run, actions, concurrency=concurrency)
+        waiting = []
+        for action, (cluster, exc) in zip(actions, submitted):
+            if exc is not None:
+                results.append(ActionResult(action, None, exc))
+            else:
+                waiting.append(action)
+
+        if not waiting:
+            return
+
+        waited = clusters.wait_many(
+            [action.cluster_id for action in waiting], deleted=deleted,
+            interval=interval, timeout=_remaining_minutes(timeout_date))
+        results.extend(ActionResult(action, cluster, exc)
+                       for action, (cluster, exc) in zip(waiting, waited))
+
+    # Stage 1: release quota
+    submit_and_wait(the_plan.deletes, deleted=True)
+    submit_and_wait([action for action in the_plan.resizes
+                     if _shrinks(action)])
+
+    # Stage 2: consume quota. Replacements whose delete failed are skipped
+    failed = set(result.action.name for result in results
+                 if result.action.kind == DELETE and result.error)
+
+    creates = []
+    for action in the_plan.creates:
+        if action.name in failed:
+            results.append(ActionResult(action, None, error.FailedError(
+                'Cluster {0} could not be deleted'.format(action.name))))
+        else:
+            creates.append(action)
+
+    grows = [action for action in the_plan.resizes if not _shrinks(action)]
+    grown = parallel_map(resize, grows, concurrency=concurrency)
+
+    if creates:
+        created = clusters.create_many(
+            [deepcopy(action.spec) for action in creates],
+            concurrency=concurrency, interval=interval,
+            timeout=_remaining_minutes(timeout_date))
+        results.extend(ActionResult(action, result.cluster, result.error)
+                       for action, result in zip(creates, created))
+
+    waiting = []
+    for action, (cluster, exc) in zip(grows, grown):
+        if exc is not None:
+            results.append(ActionResult(action, None, exc))
+        else:
+            waiting.append(action)
+
+    if waiting:
+        waited = clusters.wait_many(
+            [action.cluster_id for action in waiting], interval=interval,
+            timeout=_remaining_minutes(timeout_date))
+        results.extend(ActionResult(action, cluster, exc)
+                       for action, (cluster, exc) in zip(waiting, waited))
+
+    order = dict((id(action), index)
+                 for index, action in enumerate(the_plan.actions))
+    results.sort(key=lambda result: order[id(result.action)])
+
+    return Report(the_plan, results)
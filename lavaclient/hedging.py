@@ -0,0 +1,169 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""
+Hedged GET requests: if a GET has not been answered after a delay, one
+duplicate is sent, and whichever response arrives first is used. This cuts
+the tail latency caused by occasional slow API responses, at the cost of a
+few extra requests, which are limited by a budget::
+
+    lava = Lava(..., hedge=Hedging(budget=0.05))
+
+The delay is fixed, or by default the 95th percentile of the client's recent
+GET latencies (see :class:`lavaclient.metrics.Metrics`). The client counts
+`hedges` sent, `hedge_wins` (hedges answered first), and `hedges_skipped`
+for lack of budget in `Lava.metrics.counters`.
+"""
+
+import logging
+import sys
+import threading
+import six
+
+from lavaclient.log import NullHandler
+from lavaclient.metrics import percentile
+
+
+LOG = logging.getLogger(__name__)
+LOG.addHandler(NullHandler())
+
+
+DEFAULT_PERCENTILE = 95
+DEFAULT_BUDGET = 0.05
+
+# Recent GET latencies needed before their percentile is used as the delay
+DEFAULT_MIN_SAMPLES = 20
+
+# GET requests between recomputations of the percentile
+REFRESH_INTERVAL = 20
+
+
+class Hedging(object):
+
+    """
+    Hedging policy of a client; pass it as the `hedge` option of
+    :class:`~lavaclient.Lava`
+
+    :param delay: Seconds to wait for a response before sending a duplicate.
+                  By default, the `percentile` of recent GET latencies, and
+                  nothing is hedged until there are `min_samples` of them.
+    :param percentile: Percentile of recent GET latencies used as the delay
+    :param min_delay: Shortest delay, in seconds
+    :param min_samples: Recent GET latencies needed to use their percentile
+    :param budget: Largest fraction of GET requests that may be hedged; each
+                   GET earns `budget` hedges, up to `burst`
+    :param burst: Most hedges that may be sent in quick succession
+    """
+
+    def __init__(self,
+                 delay=None,
+                 percentile=DEFAULT_PERCENTILE,
+                 min_delay=0.01,
+                 min_samples=DEFAULT_MIN_SAMPLES,
+                 budget=DEFAULT_BUDGET,
+                 burst=10):
+        self.delay = delay
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.min_samples = min_samples
+        self.budget = budget
+        self.burst = burst
+
+        self._lock = threading.Lock()
+        self._tokens = 0.0
+        self._requests = 0
+        self._observed = None
+
+    def _delay(self, metrics):
+        """Seconds to wait before hedging, or `None` not to hedge"""
+        if self.delay is not None:
+            return self.delay
+
+        with self._lock:
+            refresh = self._requests % REFRESH_INTERVAL == 0
+            self._requests += 1
+
+        if refresh or self._observed is None:
+            latencies = metrics.latencies('GET')
+            self._observed = percentile(latencies, self.percentile) \
+                if len(latencies) >= self.min_samples else None
+
+        if self._observed is None:
+            return None
+
+        return max(self.min_delay, self._observed)
+
+    def _earn(self):
+        with self._lock:
+            self._tokens = min(self.burst, self._tokens + self.budget)
+
+    def _spend(self):
+        """Take one hedge from the budget, if there is one"""
+        with self._lock:
+            if self._tokens < 1:
+                return False
+
+            self._tokens -= 1
+            return True
+
+    def call(self, send, metrics):
+        """
+        Call `send(attempt)`, where `attempt` is 0, and call it again with 1
+        from another thread if it has not returned after the delay
+
+        :param metrics: :class:`~lavaclient.metrics.Metrics` of the client
+        :returns: The first value returned; if one attempt raises an
+                  exception, the result of the other
+        """
+        self._earn()
+        delay = self._delay(metrics)
+        if delay is None:
+            return send(0)
+
+        outcomes = six.moves.queue.Queue()
+
+        def attempt(number):
+            try:
+                outcomes.put((number, send(number), None))
+            except Exception:
+                outcomes.put((number, None, sys.exc_info()))
+
+        def start(number):
+            thread = threading.Thread(target=attempt, args=(number,))
+            thread.daemon = True
+            thread.start()
+
+        start(0)
+        try:
+            outcome = outcomes.get(timeout=delay)
+        except six.moves.queue.Empty:
+            if not self._spend():
+                metrics.increment('hedges_skipped')
+                outcome = outcomes.get()
+            else:
+                LOG.debug('Hedging request after %.3f seconds', delay)
+                metrics.increment('hedges')
+                start(1)
+
+                outcome = outcomes.get()
+                if outcome[2] is not None:
+                    LOG.debug('Hedged attempt %d failed', outcome[0],
+                              exc_info=outcome[2])
+                    outcome = outcomes.get()
+                if outcome[0] == 1 and outcome[2] is None:
+                    metrics.increment('hedge_wins')
+
+        number, result, exc_info = outcome
+        if exc_info is not None:
+            six.reraise(*exc_info)
+
+        return result
@@ -0,0 +1,232 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""
+Request metrics of a client, and wall-time profiling of the phases of a lava
+command
+"""
+
+import logging
+import math
+import os
+import sys
+import threading
+import time
+import six
+from collections import namedtuple, deque, defaultdict
+from contextlib import contextmanager
+
+from lavaclient.log import NullHandler
+
+
+LOG = logging.getLogger(__name__)
+LOG.addHandler(NullHandler())
+
+
+# Number of recent requests whose timings are kept
+DEFAULT_MAX_REQUESTS = 1000
+
+
+RequestTiming = namedtuple('RequestTiming',
+                           ['method', 'path', 'status', 'elapsed'])
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers, or `None` if it is
+    empty"""
+    if not values:
+        return None
+
+    values = sorted(values)
+    rank = int(math.ceil(pct / 100.0 * len(values)))
+    return values[min(max(rank, 1), len(values)) - 1]
+
+
+class Metrics(object):
+
+    """
+    Timings of a client's recent API requests, plus named counters. Safe to
+    use from several threads.
+
+    :param max_requests: Number of recent requests to keep
+    """
+
+    def __init__(self, max_requests=DEFAULT_MAX_REQUESTS):
+        self.requests = deque(maxlen=max_requests)
+        self.counters = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def record_request(self, method, path, status, elapsed):
+        """Record one API request; `status` is `None` if no response was
+        received"""
+        timing = RequestTiming(method.upper(), path, status, elapsed)
+        with self._lock:
+            self.requests.append(timing)
+            self.counters['requests'] += 1
+
+        profiler = _profiler
+        if profiler is not None:
+            profiler.add_request(timing)
+
+    def increment(self, name, count=1):
+        with self._lock:
+            self.counters[name] += count
+
+    def latencies(self, method=None):
+        """`list` of recent request times in seconds, optionally only those
+        using one HTTP method"""
+        with self._lock:
+            return [timing.elapsed for timing in self.requests
+                    if method is None or timing.method == method.upper()]
+
+    def percentile(self, pct, method=None):
+        """Percentile of recent request times, e.g. `percentile(95)`, or
+        `None` if there have been no requests"""
+        return percentile(self.latencies(method), pct)
+
+    def to_dict(self):
+        latencies = self.latencies()
+        with self._lock:
+            counters = dict(self.counters)
+
+        return dict(counters=counters,
+                    latency=dict((
+                        'p{0}'.format(pct), percentile(latencies, pct))
+                        for pct in (50, 95, 99)))
+
+
+class Profiler(object):
+
+    """
+    Accumulates the wall time spent in each phase of a command. Phases may be
+    nested, in which case the time of the inner phase is not counted towards
+    the outer one; a phase nested in one of the same name is part of it.
+    """
+
+    def __init__(self):
+        self.totals = defaultdict(float)
+        self.counts = defaultdict(int)
+        self.order = []
+        self.requests = []
+        self.started = time.time()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def add(self, name, elapsed):
+        with self._lock:
+            if name not in self.totals:
+                self.order.append(name)
+            self.totals[name] += elapsed
+            self.counts[name] += 1
+
+    def add_request(self, timing):
+        with self._lock:
+            self.requests.append(timing)
+
+    @contextmanager
+    def phase(self, name):
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+
+        if stack and stack[-1][1] == name:
+            yield
+            return
+
+        # Each entry is [time spent in nested phases, name]
+        stack.append([0.0, name])
+        start = time.time()
+        try:
+            yield
+        finally:
+            elapsed = time.time() - start
+            nested = stack.pop()[0]
+            if stack:
+                stack[-1][0] += elapsed
+            self.add(name, elapsed - nested)
+
+    def summary(self):
+        """Lines of a report of phase times and individual requests"""
+        total = time.time() - self.started
+        lines = ['Profile (wall time):']
+        for name in self.order:
+            count = self.counts[name]
+            lines.append('  {0:<16} {1:>9.1f}ms{2}'.format(
+                name, 1000 * self.totals[name],
+                '  ({0} calls)'.format(count) if count > 1 else ''))
+        lines.append('  {0:<16} {1:>9.1f}ms'.format('total', 1000 * total))
+
+        if self.requests:
+            lines.append('Requests:')
+            for timing in self.requests:
+                lines.append('  {0:>9.1f}ms  {1:<3} {2} /{3}'.format(
+                    1000 * timing.elapsed, timing.status or '-',
+                    timing.method, timing.path.lstrip('/')))
+
+        return lines
+
+    def print_summary(self, file=None):
+        for line in self.summary():
+            six.print_(line, file=sys.stderr if file is None else file)
+
+
+def process_started():
+    """Time at which the current process started, or `None` if it can't be
+    found out (it is read from /proc, so is only available on Linux)"""
+    try:
+        with open('/proc/self/stat') as f:
+            # Fields following the executable name, which may contain spaces;
+            # the 22nd field of the file is the start time in clock ticks
+            # after boot
+            fields = f.read().rsplit(')', 1)[1].split()
+        with open('/proc/uptime') as f:
+            uptime = float(f.read().split()[0])
+
+        ticks = float(fields[19]) / os.sysconf('SC_CLK_TCK')
+        return time.time() - uptime + ticks
+    except (IOError, OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+# Profiler of the running command, if profiling is enabled
+_profiler = None
+
+
+@contextmanager
+def _no_phase():
+    yield
+
+
+def phase(name):
+    """Context manager that times a phase of the running command if
+    profiling is enabled, e.g. `with phase('http'): ...`"""
+    profiler = _profiler
+    if profiler is None:
+        return _no_phase()
+
+    return profiler.phase(name)
+
+
+def start_profiling(started=None):
+    """Enable profiling of command phases; returns the :class:`Profiler`"""
+    global _profiler
+    _profiler = Profiler()
+    if started is not None:
+        _profiler.started = started
+
+    return _profiler
+
+
+def stop_profiling():
+    """Disable profiling of command phases"""
+    global _profiler
+    _profiler = None
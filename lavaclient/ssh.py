@@ -0,0 +1,424 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""
+Reuse of SSH connections, tunnels, and proxies to cluster nodes
+"""
+
+import atexit
+import hashlib
+import logging
+import os
+import shlex
+import shutil
+import socket
+import subprocess
+import tempfile
+import weakref
+import six
+from threading import Lock
+
+from lavaclient import error
+from lavaclient.log import NullHandler
+from lavaclient.util import (create_socks_proxy, create_ssh_tunnel,
+                             parallel_map)
+
+
+LOG = logging.getLogger(__name__)
+LOG.addHandler(NullHandler())
+
+
+DEFAULT_IDLE_TIMEOUT = 300
+
+# Remote port used in the keys of SOCKS proxies in a TunnelPool
+SOCKS = 'socks'
+
+
+# Cleanups of pools that have not been garbage collected, by id of a weak
+# reference to the pool
+_finalizers = {}
+_finalizers_lock = Lock()
+
+
+def _finalize(obj, func, *args):
+    """
+    Call `func(*args)` once `obj` has been garbage collected, or at
+    interpreter exit if it is still alive then; like `weakref.finalize`, which
+    Python 2 lacks. `func` and `args` must not refer to `obj`, or it is never
+    collected.
+    """
+    def collected(ref):
+        with _finalizers_lock:
+            entry = _finalizers.pop(id(ref), None)
+        if entry is not None:
+            entry[1](*entry[2])
+
+    ref = weakref.ref(obj, collected)
+    with _finalizers_lock:
+        _finalizers[id(ref)] = (ref, func, args)
+
+
+@atexit.register
+def _finalize_all():
+    with _finalizers_lock:
+        entries = list(_finalizers.values())
+        _finalizers.clear()
+
+    for _, func, args in entries:
+        try:
+            func(*args)
+        except Exception as exc:
+            LOG.debug('Cleanup at exit failed', exc_info=exc)
+
+
+def _base_command(ssh_command):
+    if isinstance(ssh_command, six.string_types):
+        return shlex.split(ssh_command)
+    elif ssh_command is None:
+        return ['ssh']
+
+    return list(ssh_command)
+
+
+class Multiplexer(object):
+
+    """
+    Keeps one master SSH connection per user and host open, so that repeated
+    commands only need to open a new channel rather than perform a full SSH
+    handshake. The master connections are created on first use by ssh itself
+    (`ControlMaster=auto`), and exit on their own after `idle_timeout`
+    seconds without any sessions, or when :meth:`close` (or
+    :meth:`lavaclient.Lava.close`) is called. Master connections of a
+    multiplexer that is garbage collected or still open at interpreter exit
+    are shut down then.
+
+    :param idle_timeout: Seconds that an unused master connection stays open
+    :param control_dir: Directory in which to create the control sockets;
+                        defaults to a new temporary directory
+    """
+
+    def __init__(self, idle_timeout=DEFAULT_IDLE_TIMEOUT, control_dir=None):
+        self.idle_timeout = idle_timeout
+        self._control_dir = control_dir
+        self._owns_dir = control_dir is None
+        self._masters = {}
+        self._temp_dirs = []
+        self._lock = Lock()
+        _finalize(self, _close_masters, self._masters, self._temp_dirs,
+                  self._lock)
+
+    def _control_path(self, username, host, base):
+        key = '{0}@{1} {2}'.format(username, host, ' '.join(base))
+        name = hashlib.sha1(key.encode('utf8')).hexdigest()[:16]
+
+        # Control sockets are subject to the UNIX socket path length limit,
+        # so they get short hashed names in a short directory
+        return os.path.join(self._control_dir, name)
+
+    def options(self, username, host, ssh_command=None):
+        """
+        Return the ssh options needed to share a master connection to the
+        host.
+
+        :returns: `list` of ssh command-line options
+        """
+        base = _base_command(ssh_command)
+
+        with self._lock:
+            if self._control_dir is None:
+                self._control_dir = tempfile.mkdtemp(prefix='lava-ssh-')
+                self._temp_dirs.append(self._control_dir)
+
+            path = self._control_path(username, host, base)
+            self._masters[(username, host, tuple(base))] = path
+
+        return ['-o', 'ControlMaster=auto',
+                '-o', 'ControlPath={0}'.format(path),
+                '-o', 'ControlPersist={0}'.format(int(self.idle_timeout))]
+
+    def command(self, username, host, ssh_command=None):
+        """
+        Return an ssh command which shares a master connection to the host,
+        suitable for use as the `ssh_command` argument to SSH methods.
+
+        :param username: Login user
+        :param host: Host name or IP address
+        :param ssh_command: ssh command string or `list`, e.g.
+                            `ssh -F configfile`
+        :returns: `list` of command arguments
+        """
+        return _base_command(ssh_command) + self.options(username, host,
+                                                         ssh_command)
+
+    def close(self):
+        """Shut down all master connections"""
+        with self._lock:
+            if self._owns_dir:
+                self._control_dir = None
+
+        _close_masters(self._masters, self._temp_dirs, self._lock)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def _close_masters(masters, temp_dirs, lock):
+    """Shut down the master connections of a :class:`Multiplexer`, given as
+    a `dict` of `(username, host, base command)` to control path, and remove
+    its temporary directories"""
+    with lock:
+        items = list(six.iteritems(masters))
+        masters.clear()
+        directories = list(temp_dirs)
+        del temp_dirs[:]
+
+    with open(os.devnull, 'w') as devnull:
+        for (username, host, base), path in items:
+            if not os.path.exists(path):
+                continue
+
+            LOG.debug('Closing SSH master connection to %s@%s',
+                      username, host)
+            try:
+                subprocess.call(
+                    list(base) + ['-o', 'ControlPath={0}'.format(path),
+                                  '-O', 'exit',
+                                  '{0}@{1}'.format(username, host)],
+                    stdout=devnull, stderr=devnull)
+            except OSError as exc:
+                LOG.debug('Unable to close master connection: %s', exc)
+
+    for directory in directories:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def free_port():
+    """Return a local TCP port that is not currently in use"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    try:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+    finally:
+        sock.close()
+
+
+class Tunnel(object):
+
+    """
+    A pooled SSH tunnel or SOCKS proxy. Connect to it at
+    `localhost:local_port`.
+    """
+
+    def __init__(self, key, local_port, process, node):
+        self.key = key
+        self.local_port = local_port
+        self.process = process
+        self.node = node
+
+    @property
+    def alive(self):
+        """`True` if the ssh process is still running"""
+        return self.process is not None and self.process.poll() is None
+
+    @property
+    def address(self):
+        """`(host, port)` tuple on which the tunnel listens"""
+        return ('localhost', self.local_port)
+
+    def close(self):
+        if self.alive:
+            LOG.debug('Closing tunnel %s on port %d', self.key,
+                      self.local_port)
+            self.process.kill()
+            self.process.wait()
+
+    def __repr__(self):
+        return 'Tunnel(key={0!r}, local_port={1}, alive={2})'.format(
+            self.key, self.local_port, self.alive)
+
+
+def _kill_processes(processes, lock):
+    """Kill the ssh processes of a :class:`TunnelPool` that are still
+    running"""
+    with lock:
+        running = list(processes.values())
+        processes.clear()
+
+    for process in running:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+
+
+class TunnelPool(object):
+
+    """
+    Long-lived SSH tunnels and SOCKS proxies to cluster nodes, shared between
+    callers. Tunnels are keyed by cluster, node (or component), and remote
+    port; asking for the same tunnel twice returns the existing one, and a
+    tunnel whose ssh process has died is restarted on the same local port
+    when possible. All tunnels are closed by :meth:`close` (or
+    :meth:`lavaclient.Lava.close`); those of a pool that is garbage collected
+    or still open at interpreter exit are closed then.
+
+    :param client: :class:`~lavaclient.Lava` instance
+    :param ssh_command: ssh command string or `list` used for all tunnels
+    """
+
+    def __init__(self, client, ssh_command=None):
+        self._client = client
+        self.ssh_command = ssh_command
+        self._tunnels = {}
+        self._locks = {}
+        self._lock = Lock()
+
+        # ssh processes of the tunnels, by key; unlike the tunnels, they
+        # don't refer to the client, so they can be killed once it is gone
+        self._processes = {}
+        _finalize(self, _kill_processes, self._processes, self._lock)
+
+    def _key_lock(self, key):
+        with self._lock:
+            return self._locks.setdefault(key, Lock())
+
+    def _get(self, key, start):
+        with self._key_lock(key):
+            tunnel = self._tunnels.get(key)
+            if tunnel is not None and tunnel.alive:
+                return tunnel
+
+            if tunnel is None:
+                local_port = free_port()
+            else:
+                LOG.warning('Tunnel %s on port %d died; restarting', key,
+                            tunnel.local_port)
+                local_port = tunnel.local_port
+
+            try:
+                process, node = start(local_port)
+            except error.LavaError:
+                if tunnel is None:
+                    raise
+
+                # The old port may have been taken in the meantime
+                local_port = free_port()
+                process, node = start(local_port)
+
+            tunnel = Tunnel(key, local_port, process, node)
+            with self._lock:
+                self._tunnels[key] = tunnel
+                self._processes[key] = process
+
+            return tunnel
+
+    def tunnel(self, cluster_id, remote_port, node_name=None, component=None,
+               wait=False):
+        """
+        Get a tunnel from a local port to a port on a cluster node, creating
+        it if necessary. See :meth:`lavaclient.api.clusters.Resource.\
+ssh_tunnel`.
+
+        :param cluster_id: Cluster ID
+        :param remote_port: Port on the cluster node
+        :param node_name: Name of the node; mutually exclusive with
+                          `component`
+        :param component: Component whose node to tunnel to, e.g.
+                          `HiveServer2`; mutually exclusive with `node_name`
+        :param wait: If `True`, wait for the cluster to become active first
+        :returns: :class:`Tunnel`
+        """
+        self._client.clusters._check_tunnel_target(node_name, component)
+        key = (cluster_id, node_name or component.lower(), int(remote_port))
+
+        def start(local_port):
+            cluster, node = self._client.clusters._tunnel_target(
+                cluster_id, node_name=node_name, component=component,
+                wait=wait)
+            return create_ssh_tunnel(cluster.username, node, local_port,
+                                     remote_port,
+                                     ssh_command=self.ssh_command), node
+
+        return self._get(key, start)
+
+    def proxy(self, cluster_id, node_name=None, wait=False):
+        """
+        Get a SOCKS proxy through a cluster node, creating it if necessary.
+        See :meth:`lavaclient.api.clusters.Resource.ssh_proxy`.
+
+        :param cluster_id: Cluster ID
+        :param node_name: Name of the node through which to proxy. By
+                          default, use first available node.
+        :param wait: If `True`, wait for the cluster to become active first
+        :returns: :class:`Tunnel`
+        """
+        key = (cluster_id, node_name, SOCKS)
+
+        def start(local_port):
+            cluster, node, test_url = self._client.clusters._proxy_target(
+                cluster_id, node_name=node_name, wait=wait)
+            return create_socks_proxy(cluster.username, node.public_ip,
+                                      local_port,
+                                      ssh_command=self.ssh_command,
+                                      test_url=test_url), node
+
+        return self._get(key, start)
+
+    def proxies(self, cluster_ids, wait=False, concurrency=None):
+        """
+        Get SOCKS proxies to several clusters, bringing up any that do not
+        exist yet concurrently.
+
+        :param cluster_ids: List of cluster IDs
+        :param wait: If `True`, wait for the clusters to become active first
+        :param concurrency: Maximum number of proxies to start at once
+                            (default: all of them)
+        :returns: List of `(tunnel, exception)` pairs in the same order as
+                  `cluster_ids`; exactly one of each pair is `None`
+        """
+        return parallel_map(lambda cluster_id: self.proxy(cluster_id,
+                                                          wait=wait),
+                            cluster_ids, concurrency=concurrency)
+
+    def tunnels(self):
+        """`list` of all :class:`Tunnel` objects in the pool"""
+        with self._lock:
+            return list(self._tunnels.values())
+
+    def close_cluster(self, cluster_id):
+        """Close all tunnels to a cluster, e.g. before deleting it"""
+        with self._lock:
+            keys = [key for key in self._tunnels if key[0] == cluster_id]
+            tunnels = [self._tunnels.pop(key) for key in keys]
+            for key in keys:
+                self._processes.pop(key, None)
+
+        for tunnel in tunnels:
+            tunnel.close()
+
+    def close(self):
+        """Close all tunnels"""
+        with self._lock:
+            tunnels = list(self._tunnels.values())
+            self._tunnels.clear()
+            self._processes.clear()
+
+        for tunnel in tunnels:
+            tunnel.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,189 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""
+Timeouts of API requests, and deadlines covering everything run within a
+block. Each request of a :class:`~lavaclient.Lava` client is limited by the
+client's `timeout` option, which :func:`timeout` overrides for a block::
+
+    with timeout(300):
+        lava.clusters.create(...)
+
+A deadline also limits the requests and SSH commands of methods that run
+many of them, such as :meth:`clusters.wait` or
+:meth:`clusters.ssh_execute_all`. Each request times out after the client's
+timeout or the time left until the deadline, whichever is shorter, and
+:class:`~lavaclient.error.TimeoutError` is raised once it has passed::
+
+    with deadline(30):
+        cluster = lava.clusters.get(cluster_id)
+        nodes = lava.nodes.list(cluster_id)
+
+Deadlines and timeouts apply to the thread that set them, and to the worker
+threads started for it by :func:`lavaclient.util.parallel_map` and
+:func:`~lavaclient.util.parallel_imap`.
+"""
+
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from lavaclient import error
+from lavaclient.log import NullHandler
+
+
+LOG = logging.getLogger(__name__)
+LOG.addHandler(NullHandler())
+
+
+# Default (connect, read) timeout of API requests in seconds
+DEFAULT_TIMEOUT = (10, 60)
+
+_local = threading.local()
+_UNSET = object()
+
+
+def normalize(timeout):
+    """`(connect, read)` tuple of a timeout in seconds, given as a number or
+    a tuple, or `None` for no timeout"""
+    if timeout is None:
+        return None
+    elif isinstance(timeout, (tuple, list)):
+        connect, read = timeout
+        return (connect, read)
+
+    return (timeout, timeout)
+
+
+class Deadline(object):
+
+    """
+    Point in time by which an operation must finish
+
+    :param seconds: Seconds from now
+    """
+
+    def __init__(self, seconds):
+        self.expires = time.time() + seconds
+
+    def remaining(self):
+        """Seconds left, or zero if the deadline has passed"""
+        return max(0.0, self.expires - time.time())
+
+    @property
+    def expired(self):
+        return time.time() >= self.expires
+
+    def __repr__(self):
+        return 'Deadline(remaining={0:.3f})'.format(self.remaining())
+
+
+def current_deadline():
+    """The :class:`Deadline` of the current thread, or `None`"""
+    return getattr(_local, 'deadline', None)
+
+
+@contextmanager
+def deadline(seconds):
+    """
+    Context manager that limits everything run within it to `seconds`. An
+    earlier deadline of an enclosing block still applies; `None` adds no
+    limit.
+
+    :returns: The :class:`Deadline` in effect within the block, or `None`
+    """
+    outer = current_deadline()
+    inner = outer
+    if seconds is not None:
+        limit = Deadline(seconds)
+        if outer is None or limit.expires < outer.expires:
+            inner = limit
+
+    _local.deadline = inner
+    try:
+        yield inner
+    finally:
+        _local.deadline = outer
+
+
+@contextmanager
+def timeout(seconds):
+    """Context manager that overrides the client's timeout for the requests
+    made within it; `seconds` is a number, a `(connect, read)` tuple, or
+    `None` for no timeout"""
+    outer = vars(_local).get('timeout', _UNSET)
+    _local.timeout = normalize(seconds)
+    try:
+        yield
+    finally:
+        if outer is _UNSET:
+            del _local.timeout
+        else:
+            _local.timeout = outer
+
+
+def request_timeout(default, description):
+    """
+    `(connect, read)` timeout of a request: the timeout set by
+    :func:`timeout` or else `default`, shortened to the time left until the
+    current deadline
+
+    :param default: Normalized timeout of the client
+    :param description: Request, e.g. `GET /clusters`, used in errors
+    :raises TimeoutError: if the deadline has passed
+    """
+    request = vars(_local).get('timeout', default)
+
+    limit = current_deadline()
+    if limit is None:
+        return request
+
+    remaining = limit.remaining()
+    if remaining <= 0:
+        raise error.TimeoutError('{0}: Deadline exceeded'.format(description))
+    elif request is None:
+        return (remaining, remaining)
+
+    return tuple(remaining if part is None else min(part, remaining)
+                 for part in request)
+
+
+def remaining(seconds=None):
+    """Shorter of `seconds` and the time left until the current deadline,
+    or `None` if neither is set"""
+    limit = current_deadline()
+    if limit is None:
+        return seconds
+    elif seconds is None:
+        return limit.remaining()
+
+    return min(seconds, limit.remaining())
+
+
+def propagate(func):
+    """Wrap `func` so that it runs with the deadline and timeout of the
+    calling thread, e.g. in a worker thread"""
+    state = dict(vars(_local))
+    if not state:
+        return func
+
+    def wrapper(*args, **kwargs):
+        saved = dict(vars(_local))
+        vars(_local).update(state)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            vars(_local).clear()
+            vars(_local).update(saved)
+
+    return wrapper
@@ -0,0 +1,242 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""
+HTTP transports, which send the API requests of a :class:`~lavaclient.Lava`
+client. A transport only sends a request and returns the response;
+authentication, reauthentication, and mapping of errors to
+:mod:`lavaclient.error` exceptions are done by the client.
+
+Available transports are `requests` (the default), `urllib3`, which skips
+the per-request overhead of `requests` sessions, adapters, and hooks, and
+`asyncio`, which multiplexes requests from any number of threads on one event
+loop (Python 3 only).
+"""
+
+import json
+import logging
+import threading
+import six
+from collections import namedtuple
+
+from lavaclient import error
+from lavaclient.log import NullHandler
+
+
+LOG = logging.getLogger(__name__)
+LOG.addHandler(NullHandler())
+
+
+DEFAULT_TRANSPORT = 'requests'
+
+# Connections kept open to each host by pooling transports
+DEFAULT_POOL_SIZE = 10
+
+
+class TransportError(Exception):
+
+    """Raised by a transport when no response was received, e.g. because the
+    connection failed"""
+
+    def __init__(self, msg, cause=None):
+        super(TransportError, self).__init__(msg)
+        self.cause = cause
+
+
+class TransportTimeout(TransportError):
+
+    """Raised by a transport when connecting or waiting for the response
+    took longer than the request's timeout"""
+
+
+class Response(namedtuple('Response', ['status', 'headers', 'body'])):
+
+    """
+    HTTP response returned by a transport
+
+    :param status: Status code
+    :param headers: `dict` of headers, with lower-case names
+    :param body: Body as bytes
+    """
+
+    __slots__ = ()
+
+    @property
+    def text(self):
+        return self.body.decode('utf8', 'replace')
+
+    def json(self):
+        """Decoded JSON body; raises `ValueError` if it is not JSON"""
+        return json.loads(self.text)
+
+
+def _lower_keys(headers):
+    return dict((key.lower(), value) for key, value in headers.items())
+
+
+def ca_bundle():
+    """Path of the CA certificates that `requests` uses, or `None` to use
+    the system's"""
+    try:
+        import certifi
+    except ImportError:
+        return None
+
+    return certifi.where()
+
+
+class Transport(object):
+
+    """Base class of transports"""
+
+    def send(self, method, url, headers=None, body=None, verify=None,
+             timeout=None):
+        """
+        Send a request
+
+        :param headers: `dict` of request headers
+        :param body: Request body as bytes, or `None`
+        :param verify: `False` to skip verification of SSL certificates, the
+                       path of a CA bundle, or `None` or `True` to verify them
+                       with the default CA bundle
+        :param timeout: `(connect, read)` timeout in seconds, or `None` to
+                        wait indefinitely
+        :returns: :class:`Response`
+        :raises TransportTimeout: if the request timed out
+        :raises TransportError: if no response was received
+        """
+        raise NotImplementedError
+
+    def close(self):
+        """Release any connections held by the transport"""
+        pass
+
+
+class RequestsTransport(Transport):
+
+    """Transport using `requests.request`"""
+
+    def send(self, method, url, headers=None, body=None, verify=None,
+             timeout=None):
+        import requests
+
+        kwargs = dict(headers=headers)
+        if body is not None:
+            kwargs['data'] = body
+        if verify is not None:
+            kwargs['verify'] = verify
+        if timeout is not None:
+            kwargs['timeout'] = timeout
+
+        try:
+            resp = requests.request(method, url, **kwargs)
+        except requests.exceptions.Timeout as exc:
+            raise TransportTimeout(str(exc), exc)
+        except requests.exceptions.RequestException as exc:
+            raise TransportError(str(exc), exc)
+
+        return Response(resp.status_code, _lower_keys(resp.headers),
+                        resp.content)
+
+
+class Urllib3Transport(Transport):
+
+    """
+    Transport using a `urllib3` connection pool, which avoids the overhead
+    `requests` adds to every request
+
+    :param pool_size: Connections kept open to each host
+    """
+
+    def __init__(self, pool_size=DEFAULT_POOL_SIZE):
+        self.pool_size = pool_size
+        self._managers = {}
+        self._lock = threading.Lock()
+
+    def _manager(self, verify):
+        import urllib3
+
+        key = verify if isinstance(verify, six.string_types) \
+            else verify is not False
+        with self._lock:
+            manager = self._managers.get(key)
+            if manager is None:
+                options = dict(maxsize=self.pool_size)
+                if key is False:
+                    options.update(cert_reqs='CERT_NONE')
+                else:
+                    options.update(cert_reqs='CERT_REQUIRED',
+                                   ca_certs=ca_bundle() if key is True
+                                   else key)
+                manager = self._managers[key] = urllib3.PoolManager(
+                    **options)
+
+            return manager
+
+    def send(self, method, url, headers=None, body=None, verify=None,
+             timeout=None):
+        import urllib3
+
+        if timeout is not None:
+            timeout = urllib3.Timeout(connect=timeout[0], read=timeout[1])
+
+        try:
+            resp = self._manager(verify).request(method, url, body=body,
+                                                 headers=headers,
+                                                 retries=False,
+                                                 timeout=timeout)
+        except urllib3.exceptions.NewConnectionError as exc:
+            # A subclass of ConnectTimeoutError, whatever the cause
+            raise TransportError(str(exc), exc)
+        except urllib3.exceptions.TimeoutError as exc:
+            raise TransportTimeout(str(exc), exc)
+        except urllib3.exceptions.HTTPError as exc:
+            raise TransportError(str(exc), exc)
+
+        return Response(resp.status, _lower_keys(resp.headers), resp.data)
+
+    def close(self):
+        with self._lock:
+            managers, self._managers = self._managers, {}
+        for manager in managers.values():
+            manager.clear()
+
+
+def _asyncio_transport(**kwargs):
+    from lavaclient.aiotransport import AsyncioTransport
+    return AsyncioTransport(**kwargs)
+
+
+TRANSPORTS = dict(
+    requests=RequestsTransport,
+    urllib3=Urllib3Transport,
+    asyncio=_asyncio_transport,
+)
+
+
+def get_transport(transport=None):
+    """
+    Transport instance from a name in :data:`TRANSPORTS`, or `None` for the
+    default; transport instances are returned as they are
+    """
+    if transport is None:
+        transport = DEFAULT_TRANSPORT
+
+    if not isinstance(transport, six.string_types):
+        return transport
+
+    try:
+        return TRANSPORTS[transport]()
+    except KeyError:
+        raise error.InvalidError(
+            'Unknown transport {0}; choose from {1}'.format(
+                transport, ', '.join(sorted(TRANSPORTS))))
@@ -22,27 +22,33 @@ import json
 import argparse
 import math
 import textwrap
+import unicodedata
 import six
 import binascii
+import hashlib
 import base64
 import os.path
+import socket
+import threading
 import six.moves.urllib as urllib
-import socks
 import warnings
-from sockshandler import SocksiPyHandler
 from functools import wraps
-from collections import namedtuple
+from collections import namedtuple, deque
 from figgis import Config
-from prettytable import PrettyTable
 
 from lavaclient.log import NullHandler
-from lavaclient import error
+from lavaclient import error, metrics, timeouts
 
 
 RETRY_DEFAULT_ATTEMPTS = 3
 RETRY_DEFAULT_DELAY = 1
 RETRY_DEFAULT_BACKOFF = 2
 
+# Seconds between checks for a listening port, and the default overall time
+# allowed for a SOCKS proxy to come up
+PORT_POLL_INTERVAL = 0.05
+PROXY_TIMEOUT = 30
+
 
 LOG = logging.getLogger(__name__)
 LOG.addHandler(NullHandler())
@@ -108,6 +114,8 @@ def b64encode(value):
 
 
 def create_table(data, header):
+    from prettytable import PrettyTable
+
     table = PrettyTable(header)
     types = [set() for i in range(len(header))]
 
@@ -126,6 +134,8 @@ def create_table(data, header):
 
 
 def create_single_table(data, header):
+    from prettytable import PrettyTable
+
     table = PrettyTable(header=False)
 
     table.add_column('Property', header, align='l')
@@ -158,18 +168,120 @@ def print_titled(table, title=None):
     six.print_(table)
 
 
+def _text_width(text):
+    """Number of terminal columns taken up by text"""
+    if all(ord(char) < 0x300 for char in text):
+        return len(text)
+
+    width = 0
+    for char in text:
+        if unicodedata.combining(char):
+            continue
+        width += 2 if unicodedata.east_asian_width(char) in 'WF' else 1
+
+    return width
+
+
+def _justify(text, width, align):
+    excess = width - _text_width(text)
+    if align == 'r':
+        return ' ' * excess + text
+
+    # Same as str.center, i.e. the way PrettyTable centers text
+    left = excess // 2 + (excess & width & 1)
+    return ' ' * left + text + ' ' * (excess - left)
+
+
+def render_table(data, header, title=None):
+    """
+    Render rows as a table identical to the one printed by
+    :func:`create_table`/:func:`print_titled`, but without building a
+    :class:`~prettytable.PrettyTable`. The rows are formatted and measured in
+    a single pass, after which the table is generated one line at a time.
+
+    :returns: Generator of lines
+    """
+    n_fields = len(header)
+    numeric = [True] * n_fields
+    rows = []
+
+    for row in data:
+        cells = []
+        for index, item in enumerate(row):
+            if type(item) not in (int, float):
+                numeric[index] = False
+            cells.append(item)
+        rows.append(cells)
+
+    widths = [_text_width(six.text_type(name)) for name in header]
+    for cells in rows:
+        for index, item in enumerate(cells):
+            if numeric[index] and isinstance(item, float):
+                text = '{0:.2f}'.format(item)
+            else:
+                text = six.text_type(item)
+
+            lines = text.split('\n')
+            cells[index] = lines
+            widths[index] = max(widths[index],
+                                max(_text_width(line) for line in lines))
+
+    padding = 1
+    width = sum(widths) + 2 * padding * n_fields + n_fields + 1
+    if title:
+        if width < len(title) + 4:
+            # Add padding so that the table is as wide as the title
+            extra = int(math.ceil((len(title) + 4 - width) /
+                                  (2.0 * n_fields)))
+            padding += extra
+            width += 2 * n_fields * extra
+
+        yield '+' + '-' * (width - 2) + '+'
+        yield '| ' + title.center(width - 4) + ' |'
+
+    aligns = ['r' if is_numeric else 'c' for is_numeric in numeric]
+    border = '+' + '+'.join('-' * (field_width + 2 * padding)
+                            for field_width in widths) + '+'
+    pad = ' ' * padding
+
+    def render_row(cells):
+        height = max(len(lines) for lines in cells)
+        for line in range(height):
+            yield '|' + '|'.join(
+                pad + _justify(lines[line] if line < len(lines) else '',
+                               field_width, align) + pad
+                for lines, field_width, align in zip(cells, widths,
+                                                     aligns)) + '|'
+
+    yield border
+    for line in render_row([[six.text_type(name)] for name in header]):
+        yield line
+    yield border
+
+    # Release each row once it has been rendered
+    rows.reverse()
+    while rows:
+        for line in render_row(rows.pop()):
+            yield line
+
+    yield border
+
+
 def print_table(data, header, title=None):
     """
     Print a pretty table from multiple rows
     """
-    print_titled(create_table(data, header), title)
+    with metrics.phase('render'):
+        for line in render_table(data, header, title=title):
+            six.print_(line)
 
 
 def print_single_table(data, header, title=None):
     """
     Print a pretty table for a single item
     """
-    print_titled(create_single_table(data, header), title)
+    with metrics.phase('render'):
+        print_titled(create_single_table(data, header), title)
 
 
 def no_nulls(data):
@@ -245,16 +357,17 @@ def display_table(response_config, title=None):
         def display_func(*args, **kwargs):
             result = func(*args, **kwargs)
 
-            if hasattr(response_config, 'display'):
-                if isinstance(result, (list, tuple)):
-                    for item in result:
+            with metrics.phase('render'):
+                if hasattr(response_config, 'display'):
+                    if isinstance(result, (list, tuple)):
+                        for item in result:
+                            response_config.display(result)
+                    else:
                         response_config.display(result)
-                else:
-                    response_config.display(result)
 
-                return
+                    return
 
-            display_result(result, response_config, title=title)
+                display_result(result, response_config, title=title)
 
         func.display = display_func
         return func
@@ -268,7 +381,9 @@ def display(display_function):
     """
     def wrapper(func):
         def display_func(*args, **kwargs):
-            return display_function(func(*args, **kwargs))
+            result = func(*args, **kwargs)
+            with metrics.phase('render'):
+                return display_function(result)
 
         func.display = display_func
         return func
@@ -288,7 +403,8 @@ def post_binary(value):
     return six.text_type(value)
 
 
-Command = namedtuple('Command', ['arguments', 'function', 'parser_options'])
+Command = namedtuple('Command', ['arguments', 'function', 'parser_options',
+                                 'interactive'])
 
 
 class argument(object):
@@ -366,7 +482,7 @@ def _default_optional_argument(varname):
 
 def command(*args, **kwargs):
     """
-    command(parser_help=None, **arguments)
+    command(parser_help=None, interactive=False, **arguments)
 
     Decorator that creates an argparse subparser for the decorated function.
     Each argument key should be the name of n argument in the decorator
@@ -384,6 +500,9 @@ def command(*args, **kwargs):
 
     :param parser_help: An optional help string to be passed to the subparser
                         that contains the argument for the decorated function
+    :param interactive: `True` if the command may prompt the user or keep
+                        running until interrupted, so it must run in the
+                        terminal's process rather than in `lava daemon`
 
     Examples:
 
@@ -411,6 +530,7 @@ def command(*args, **kwargs):
         raise TypeError('command() takes zero or more keyword arguments')
 
     parser_options = kwargs.pop('parser_options', {})
+    interactive = kwargs.pop('interactive', False)
     if not isinstance(parser_options, dict):
         raise TypeError('parser_options must be a dictionary of arguments to '
                         'pass in during subparser creation')
@@ -443,7 +563,8 @@ def command(*args, **kwargs):
 
         return Command(arguments=arguments,
                        parser_options=parser_options,
-                       function=func)
+                       function=func,
+                       interactive=interactive)
 
     return decorator(args[0]) if args else decorator
 
@@ -453,17 +574,21 @@ class CommandLine(type):
     def __new__(cls, name, bases, dct):
         arguments = {}
         parser_options = {}
+        interactive = set()
 
         # Get list of items before modifying dct
         for key, value in list(dct.items()):
             if isinstance(value, Command):
                 arguments[key] = value.arguments
                 parser_options[key] = value.parser_options
+                if value.interactive:
+                    interactive.add(key)
                 dct[key] = value.function
 
         @classmethod
         def add_arguments(cls, parser_base, parser, arguments=arguments,
-                          parser_options=parser_options):
+                          parser_options=parser_options,
+                          interactive=interactive):
             subparsers = parser.add_subparsers()
 
             for cmd, args in arguments.items():
@@ -472,7 +597,8 @@ class CommandLine(type):
                     cmd.strip('_'), parents=[parser_base],
                     formatter_class=argparse.RawDescriptionHelpFormatter,
                     **parser_opts)
-                subparser.set_defaults(method=cmd)
+                subparser.set_defaults(method=cmd,
+                                       interactive=cmd in interactive)
                 group = subparser.add_argument_group('Command Arguments')
                 for arg in args:
                     arg.add_to_parser(group)
@@ -567,21 +693,67 @@ def coroutine(func):
     return wrapper
 
 
-@retry(attempts=5,
-       exceptions=[socks.ProxyConnectionError, socks.GeneralProxyError])
-def test_socks_connection(url, proxy_host, proxy_port):
+def wait_for_port(host, port, timeout, interval=PORT_POLL_INTERVAL,
+                  process=None):
+    """
+    Wait until something is accepting connections on a TCP port, polling at
+    a fine interval.
+
+    :param timeout: Maximum number of seconds to wait
+    :param process: :py:class:`~subprocess.Popen` object expected to open
+                    the port; stop waiting early if it exits
+    :returns: `True` if the port is accepting connections, `False` if the
+              timeout expired or the process exited
+    """
+    deadline = time.time() + timeout
+    while True:
+        if process is not None and process.poll() is not None:
+            return False
+
+        try:
+            socket.create_connection((host, port), timeout=interval).close()
+        except socket.error:
+            pass
+        else:
+            # Make sure the listener is not some other process that already
+            # held the port while ours failed to bind it
+            return process is None or process.poll() is None
+
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            return False
+
+        time.sleep(min(interval, remaining))
+
+
+def test_socks_connection(url, proxy_host, proxy_port, timeout=None):
     """Return HTTP code from opening URL via SOCKS proxy"""
+    import socks
+    from sockshandler import SocksiPyHandler
+
     opener = urllib.request.build_opener(
         SocksiPyHandler(socks.PROXY_TYPE_SOCKS5, proxy_host, proxy_port))
-    resp = opener.open(url)
+    if timeout is None:
+        resp = opener.open(url)
+    else:
+        resp = opener.open(url, timeout=timeout)
+
     try:
         return resp.code
     finally:
         resp.close()
 
 
-def create_socks_proxy(username, host, port, ssh_command=None, test_url=None):
-    """Create a SOCKS proxy via SSH"""
+def create_socks_proxy(username, host, port, ssh_command=None, test_url=None,
+                       timeout=PROXY_TIMEOUT):
+    """
+    Create a SOCKS proxy via SSH. ssh only starts listening on the local port
+    once the connection is established, so readiness is detected by polling
+    the port, after which a single request is made to `test_url` (if given)
+    through the proxy. Both must succeed within `timeout` seconds.
+    """
+    import socks
+
     if isinstance(ssh_command, six.string_types):
         ssh_command = shlex.split(ssh_command)
     elif ssh_command is None:
@@ -593,40 +765,44 @@ def create_socks_proxy(username, host, port, ssh_command=None, test_url=None):
     command = ssh_command + options + ['{0}@{1}'.format(username, host)]
 
     LOG.debug('SSH proxy command: %s', ' '.join(command))
+    deadline = time.time() + timeout
     process = subprocess.Popen(
         [expand(item) for item in command],
         stderr=subprocess.STDOUT,
         stdout=subprocess.PIPE)
 
-    if not test_url:
-        if process.poll():
-            output, _ = process.communicate()
-            LOG.critical('SOCKS proxy failed: %s', output)
-            raise error.LavaError('Failed to set up SOCKS proxy')
-
-        LOG.warn("No test URI's found; proxy may not be established yet")
-        return process
-
-    if process.poll():
-        output, _ = process.communicate()
-        LOG.critical('SOCKS proxy failed: %s', output)
-        raise error.LavaError('Failed to set up SOCKS proxy')
-
     try:
-        code = test_socks_connection(test_url, '127.0.0.1', port)
+        if not wait_for_port('127.0.0.1', port, timeout, process=process):
+            if process.poll() is not None:
+                output, _ = process.communicate()
+                LOG.critical('SOCKS proxy failed: %s', output)
+                raise error.LavaError('Failed to set up SOCKS proxy')
+
+            raise error.TimeoutError(
+                'SOCKS proxy was not ready after {0} seconds'.format(timeout))
+
+        if not test_url:
+            LOG.warning("No test URI's found; SOCKS proxy is listening on "
+                        "port %d but has not been tested end-to-end", port)
+            return process
+
+        code = test_socks_connection(
+            test_url, '127.0.0.1', port,
+            timeout=max(deadline - time.time(), PORT_POLL_INTERVAL))
         if code >= 400:
             LOG.debug('Connection to %s through SOCKS proxy failed '
                       'with HTTP code %d', test_url, code)
             raise error.ProxyError('SOCKS proxy connection failed')
 
         return process
-    except socks.ProxyConnectionError as exc:
+    except (socks.ProxyConnectionError, socks.GeneralProxyError) as exc:
         process.kill()
         LOG.critical('Failed to establish SOCKS proxy', exc_info=exc)
         six.raise_from(error.ProxyError('Failed to establish SOCKS proxy'),
                        exc)
     except Exception:
-        process.kill()
+        if process.poll() is None:
+            process.kill()
         raise
 
 
@@ -673,8 +849,9 @@ def inject_client(client, obj):
     return obj
 
 
-def ssh_to_host(username, host, ssh_command=None, command=None):
-    """SSH to a host"""
+def _ssh_command_list(username, host, ssh_command=None, command=None,
+                      options=None):
+    """Build the argument list for running ssh"""
     if isinstance(ssh_command, six.string_types):
         ssh_cmd = shlex.split(ssh_command)
     elif isinstance(ssh_command, (list, tuple)):
@@ -684,27 +861,34 @@ def ssh_to_host(username, host, ssh_command=None, command=None):
     else:
         ssh_cmd = ssh_command
 
-    command_list = ssh_cmd + ['{0}@{1}'.format(username, host)]
+    command_list = ssh_cmd + list(options or []) + [
+        '{0}@{1}'.format(username, host)]
     if command:
         command_list.append(six.text_type(command))
 
+    return [expand(item) for item in command_list]
+
+
+def ssh_to_host(username, host, ssh_command=None, command=None):
+    """SSH to a host"""
+    command_list = _ssh_command_list(username, host, ssh_command=ssh_command,
+                                     command=command)
+
     LOG.debug('SSH command: %s', ' '.join(command_list))
 
     if command:
-        proc = subprocess.Popen(
-            [expand(item) for item in command_list],
-            stderr=subprocess.STDOUT,
-            stdout=subprocess.PIPE)
-
-        output = proc.communicate()[0]
-        returncode = proc.returncode
+        returncode, output, timed_out = _run_with_timeout(
+            command_list, timeout=timeouts.remaining())
+        if timed_out:
+            raise error.TimeoutError(
+                'Command did not finish before the deadline')
     else:
-        returncode = subprocess.call([expand(item) for item in command_list])
+        returncode = subprocess.call(command_list)
         output = None
 
     if returncode:
         msg = 'Command returned non-zero status code {0}'.format(
-            proc.returncode)
+            returncode)
         LOG.error(msg)
         LOG.debug('Command output:\n%s', output)
 
@@ -713,6 +897,270 @@ def ssh_to_host(username, host, ssh_command=None, command=None):
     return output
 
 
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# Number of trailing chunks of streamed output kept for error logging
+STREAM_TAIL = 20
+
+# Options of every scp command, local or run on a relay node; host keys are
+# checked as by ssh
+SCP_OPTIONS = ('-q', '-o', 'BatchMode=yes')
+
+
+def stream_from_host(username, host, command, ssh_command=None, lines=True,
+                     chunk_size=STREAM_CHUNK_SIZE):
+    """
+    Run a command over SSH, yielding its combined stdout and stderr as it
+    arrives rather than collecting it all in memory. As with
+    :func:`ssh_to_host`, a non-zero exit status raises
+    :class:`~lavaclient.error.FailedError` once the output is exhausted. If
+    the generator is closed early, the ssh process is killed.
+
+    :param lines: Yield lines (of at most `chunk_size` bytes each) if `True`,
+                  otherwise yield chunks of up to `chunk_size` bytes as soon
+                  as they can be read
+    :returns: Generator of `bytes`
+    """
+    command_list = _ssh_command_list(username, host, ssh_command=ssh_command,
+                                     command=command)
+
+    LOG.debug('SSH command: %s', ' '.join(command_list))
+    proc = subprocess.Popen(command_list,
+                            stderr=subprocess.STDOUT,
+                            stdout=subprocess.PIPE)
+
+    if lines:
+        def read():
+            return proc.stdout.readline(chunk_size)
+    else:
+        fileno = proc.stdout.fileno()
+
+        def read():
+            return os.read(fileno, chunk_size)
+
+    tail = deque(maxlen=STREAM_TAIL)
+    try:
+        for chunk in iter(read, six.b('')):
+            tail.append(chunk)
+            yield chunk
+
+        returncode = proc.wait()
+    finally:
+        if proc.poll() is None:
+            proc.kill()
+            proc.wait()
+        proc.stdout.close()
+
+    if returncode:
+        msg = 'Command returned non-zero status code {0}'.format(returncode)
+        LOG.error(msg)
+        LOG.debug('Command output (last %d chunks):\n%s', len(tail),
+                  six.b('').join(tail))
+
+        raise error.FailedError(msg)
+
+
+def write_stream(chunks, fileobj):
+    """Write chunks of `bytes` to a file object, flushing after each one so
+    that output is visible as it arrives. Text streams such as `sys.stdout`
+    on Python 3 are written through their underlying binary buffer."""
+    fileobj = getattr(fileobj, 'buffer', fileobj)
+    for chunk in chunks:
+        fileobj.write(chunk)
+        fileobj.flush()
+
+
+SSHResult = namedtuple('SSHResult', ['returncode', 'output', 'timed_out'])
+
+
+def _run_with_timeout(command_list, timeout=None):
+    """Run a command, killing it after `timeout` seconds or at the current
+    deadline (see :mod:`lavaclient.timeouts`)"""
+    timeout = timeouts.remaining(timeout or None)
+    proc = subprocess.Popen(command_list,
+                            stderr=subprocess.STDOUT,
+                            stdout=subprocess.PIPE)
+
+    timed_out = []
+    timer = None
+    if timeout is not None:
+        def kill():
+            timed_out.append(True)
+            try:
+                proc.kill()
+            except OSError:
+                pass
+
+        timer = threading.Timer(timeout, kill)
+        timer.daemon = True
+        timer.start()
+
+    try:
+        output = proc.communicate()[0]
+    finally:
+        if timer is not None:
+            timer.cancel()
+
+    return SSHResult(proc.returncode, output, bool(timed_out))
+
+
+def run_on_host(username, host, command, ssh_command=None, timeout=None):
+    """
+    Run a command over SSH non-interactively. Unlike :func:`ssh_to_host`, a
+    non-zero exit status is not an error, and the ssh process is killed if it
+    runs for longer than `timeout` seconds.
+
+    :returns: :class:`SSHResult` `(returncode, output, timed_out)`, in which
+              `output` contains both stdout and stderr
+    """
+    command_list = _ssh_command_list(
+        username, host, ssh_command=ssh_command, command=command,
+        options=['-n', '-o', 'BatchMode=yes'])
+
+    LOG.debug('SSH command: %s', ' '.join(command_list))
+    return _run_with_timeout(command_list, timeout=timeout)
+
+
+def scp_to_host(username, host, local_path, remote_path, scp_command=None,
+                options=None, timeout=None):
+    """
+    Copy a local file to a host with scp. As with :func:`run_on_host`, a
+    non-zero exit status is not an error.
+
+    :param scp_command: scp command string or `list` (default: `'scp'`)
+    :param options: Additional ssh options, e.g. `['-o', 'Port=2222']`
+    :returns: :class:`SSHResult`
+    """
+    if isinstance(scp_command, six.string_types):
+        scp_cmd = shlex.split(scp_command)
+    elif scp_command is None:
+        scp_cmd = ['scp']
+    else:
+        scp_cmd = list(scp_command)
+
+    command_list = [expand(item) for item in scp_cmd + list(SCP_OPTIONS) +
+                    list(options or [])] + [
+        expand(local_path), '{0}@{1}:{2}'.format(username, host, remote_path)]
+
+    LOG.debug('SCP command: %s', ' '.join(command_list))
+    return _run_with_timeout(command_list, timeout=timeout)
+
+
+def file_checksum(path, chunk_size=STREAM_CHUNK_SIZE):
+    """Hex SHA-256 digest of a local file, as printed by `sha256sum`"""
+    digest = hashlib.sha256()
+    with open(expand(path), 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), six.b('')):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+def parallel_map(func, items, concurrency=None):
+    """
+    Call `func` on each item using at most `concurrency` threads (default: one
+    thread per item). Returns a list of `(result, exception)` pairs in the
+    same order as `items`; exactly one of each pair is `None`.
+    """
+    items = list(items)
+    results = [None] * len(items)
+
+    # Workers share the caller's deadline and request timeout
+    func = timeouts.propagate(func)
+
+    work = six.moves.queue.Queue()
+    for pair in enumerate(items):
+        work.put(pair)
+
+    def worker():
+        while True:
+            try:
+                index, item = work.get_nowait()
+            except six.moves.queue.Empty:
+                return
+
+            try:
+                results[index] = (func(item), None)
+            except Exception as exc:
+                LOG.debug('Parallel call failed for %r', item, exc_info=exc)
+                results[index] = (None, exc)
+
+    n_workers = min(concurrency or len(items), len(items))
+    if n_workers <= 1:
+        worker()
+        return results
+
+    threads = [threading.Thread(target=worker)
+               for _ in six.moves.range(n_workers)]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    return results
+
+
+def parallel_imap(func, items, concurrency=None, ordered=True):
+    """
+    Like :func:`parallel_map`, but yield `(index, result, exception)` tuples
+    as calls finish rather than waiting for all of them. If `ordered`,
+    results are yielded in the same order as `items`; otherwise in the order
+    in which they finish.
+    """
+    items = list(items)
+    n_workers = min(concurrency or len(items), len(items))
+
+    # Workers share the caller's deadline and request timeout
+    func = timeouts.propagate(func)
+
+    if n_workers <= 1:
+        for index, item in enumerate(items):
+            try:
+                outcome = (index, func(item), None)
+            except Exception as exc:
+                LOG.debug('Parallel call failed for %r', item, exc_info=exc)
+                outcome = (index, None, exc)
+            yield outcome
+        return
+
+    work = six.moves.queue.Queue()
+    for pair in enumerate(items):
+        work.put(pair)
+    done = six.moves.queue.Queue()
+
+    def worker():
+        while True:
+            try:
+                index, item = work.get_nowait()
+            except six.moves.queue.Empty:
+                return
+
+            try:
+                done.put((index, func(item), None))
+            except Exception as exc:
+                LOG.debug('Parallel call failed for %r', item, exc_info=exc)
+                done.put((index, None, exc))
+
+    for _ in six.moves.range(n_workers):
+        thread = threading.Thread(target=worker)
+        thread.daemon = True
+        thread.start()
+
+    finished = {}
+    next_index = 0
+    for _ in six.moves.range(len(items)):
+        outcome = done.get()
+        if not ordered:
+            yield outcome
+            continue
+
+        finished[outcome[0]] = outcome
+        while next_index in finished:
+            yield finished.pop(next_index)
+            next_index += 1
+
+
 def confirm(message, default_yes=False):
     """Present the user with a y/n choice. Returns True if the choice is `y`"""
     choices = 'Y/n' if default_yes else 'y/N'
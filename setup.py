@@ -73,7 +73,8 @@ if __name__ == '__main__':
 
         packages=find_packages(exclude=['tests']),
         entry_points={
-            'console_scripts': ['lava = lavaclient.cli:main'],
+            'console_scripts': ['lava = lavaclient.cli:main',
+                                'lava-bench = lavaclient.bench:main'],
         },
         install_requires=[
             'python-keystoneclient>=1.3.0',
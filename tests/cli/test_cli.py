@@ -1,8 +1,13 @@
+import json
 import pytest
 import shlex
+import six
+import time
 from mock import patch
 
-from lavaclient.cli import parse_argv
+from lavaclient import util
+from lavaclient.cli import (parse_argv, main, create_parser, client_options,
+                            RESOURCE_MODULES)
 
 
 @patch('sys.argv', ['lava', 'authenticate', '--token', 'mytoken'])
@@ -18,6 +23,10 @@ def test_authenticate():
     ('', '', 'endpoint', None),
     ('--endpoint foo/v2', '', 'endpoint', 'foo/v2'),
     ('', '--endpoint foo/v2', 'endpoint', 'foo/v2'),
+    ('', '', 'transport', None),
+    ('--transport urllib3', '', 'transport', 'urllib3'),
+    ('', '--transport asyncio', 'transport', 'asyncio'),
+    ('--request-timeout 2.5', '', 'request_timeout', 2.5),
 ])
 def test_argparse_order(pre_args, post_args, key, value):
     argstr = 'lava {0} clusters list {1}'.format(pre_args, post_args)
@@ -25,3 +34,220 @@ def test_argparse_order(pre_args, post_args, key, value):
         args = parse_argv()
 
     assert getattr(args, key) == value
+
+
+def test_transport_environ():
+    args = parse_argv(['flavors', 'list'])
+    with patch.dict('os.environ', {'LAVA_TRANSPORT': 'urllib3'}):
+        assert client_options(args)['transport'] == 'urllib3'
+
+    args = parse_argv(['flavors', 'list', '--transport', 'asyncio'])
+    with patch.dict('os.environ', {'LAVA_TRANSPORT': 'urllib3'}):
+        assert client_options(args)['transport'] == 'asyncio'
+
+
+def test_request_timeout_environ():
+    args = parse_argv(['flavors', 'list'])
+    assert client_options(args)['timeout'] == (10, 60)
+    with patch.dict('os.environ', {'LAVA_REQUEST_TIMEOUT': '5'}):
+        assert client_options(args)['timeout'] == 5
+
+
+RESOURCE_NAMES = [module.__name__.split('.')[-1]
+                  for module in RESOURCE_MODULES]
+
+
+@pytest.mark.parametrize('argstr', [
+    '', '--help', 'nosuch', 'shell', 'batch --help', 'batch -', 'flavors list',
+    '--token token clusters get id --insecure', 'clusters get',
+    'clusters nosuch', 'clusters create --help', 'stacks create --help',
+    'clusters list --output json --debug', '--bogus clusters list',
+    'clusters --token', '--token clusters list',
+] + ['{0} --help'.format(name) for name in RESOURCE_NAMES] + RESOURCE_NAMES)
+def test_parse_argv_lazy(argstr, capsys):
+    """The parser built for just one resource behaves like the full one"""
+    def parse(parser):
+        try:
+            result = vars(parse_argv(shlex.split(argstr), parser=parser))
+        except SystemExit as exc:
+            result = exc.code
+        return result, capsys.readouterr()
+
+    assert parse(None) == parse(create_parser())
+
+
+FLAVOR_JSON = ('{"disk": 2500, "id": "hadoop1-15", '
+               '"links": [{"href": "href", "rel": "rel"}], '
+               '"name": "Medium Hadoop Instance", "ram": 15360, "vcpus": 4}')
+
+
+@pytest.mark.parametrize('output,expected', [
+    ('json', '[\n' + FLAVOR_JSON + '\n]\n'),
+    ('ndjson', FLAVOR_JSON + '\n'),
+    ('csv', 'id,name,ram,vcpus,disk\n'
+            'hadoop1-15,Medium Hadoop Instance,15360,4,2500\n'),
+])
+def test_output_formats(output, expected, print_table, mock_client,
+                        flavors_response, capsys):
+    mock_client._request.return_value = flavors_response
+
+    with patch('sys.argv', ['lava', 'flavors', 'list', '--output', output]):
+        main()
+
+    assert capsys.readouterr()[0] == expected
+    assert not print_table.called
+
+
+def test_output_json_empty(mock_client, capsys):
+    mock_client._request.return_value = {'flavors': []}
+
+    with patch('sys.argv', ['lava', '--output', 'json', 'flavors', 'list']):
+        main()
+
+    assert capsys.readouterr()[0] == '[]\n'
+
+
+def test_output_table(print_table, mock_client, flavors_response):
+    mock_client._request.return_value = flavors_response
+
+    with patch('sys.argv', ['lava', 'flavors', 'list', '--no-format',
+                            '--output', 'table']):
+        main()
+
+    assert print_table.called
+
+
+def system_exit(status=None):
+    # mock_client's sys.exit raises an Exception, which batch commands catch
+    raise SystemExit(status)
+
+
+def test_batch(mock_client, flavors_response, tmpdir, capsys):
+    commands = tmpdir.join('commands')
+    commands.write('flavors list\n# comment\n\nclusters get\nshell\n'
+                   'flavors list --output csv\n')
+    mock_client._request.return_value = flavors_response
+
+    with patch('sys.argv', ['lava', 'batch', str(commands)]), \
+            patch('sys.exit', system_exit):
+        with pytest.raises(SystemExit) as exc:
+            main()
+    assert exc.value.code == 1
+
+    output = capsys.readouterr()[0]
+    records = [json.loads(line) for line in output.splitlines()]
+    assert [(record['line'], record['status']) for record in records] == [
+        (1, 'ok'), (4, 'error'), (5, 'error'), (6, 'ok')]
+    assert records[0]['result'][0]['id'] == 'hadoop1-15'
+    assert records[0]['result'] == records[3]['result']
+    assert 'required' in records[1]['error']
+    assert 'not supported' in records[2]['error']
+    assert mock_client._request.call_count == 2
+
+
+def test_batch_interactive(mock_client, capsys):
+    commands = ('clusters delete cluster_id\n'
+                'clusters ssh_proxy cluster_id\n'
+                'credentials create_ambari username\n')
+
+    with patch('sys.argv', ['lava', 'batch', '--concurrency', '1']), \
+            patch('sys.stdin', six.StringIO(commands)), \
+            patch('lavaclient.api.clusters.confirm') as confirm, \
+            patch('sys.exit', system_exit):
+        with pytest.raises(SystemExit) as exc:
+            main()
+    assert exc.value.code == 1
+
+    # The API method runs without a prompt or a table
+    assert not confirm.called
+    mock_client._request.assert_called_once_with('DELETE',
+                                                 'clusters/cluster_id')
+
+    output = capsys.readouterr()[0]
+    records = [json.loads(line) for line in output.splitlines()]
+    assert [record['status'] for record in records] == ['ok', 'error',
+                                                        'error']
+    assert records[1]['error'] == \
+        'clusters ssh_proxy is not supported in batch mode'
+    assert 'not supported' in records[2]['error']
+
+
+@pytest.mark.parametrize('order,lines', [
+    ('input', [1, 2]),
+    ('completion', [2, 1]),
+])
+def test_batch_order(mock_client, capsys, order, lines):
+    calls = []
+
+    def flavors_list():
+        calls.append(None)
+        if len(calls) == 1:
+            time.sleep(0.2)
+            return 'slow'
+        return 'fast'
+
+    with patch('sys.argv', ['lava', 'batch', '--order', order]), \
+            patch('sys.stdin', six.StringIO('flavors list\nflavors list\n')), \
+            patch.object(mock_client.flavors, 'list', flavors_list), \
+            patch('sys.exit', system_exit):
+        with pytest.raises(SystemExit) as exc:
+            main()
+    assert exc.value.code == 0
+
+    output = capsys.readouterr()[0]
+    records = [json.loads(line) for line in output.splitlines()]
+    assert [record['line'] for record in records] == lines
+    assert [record['result'] for record in records] == \
+        (['slow', 'fast'] if order == 'input' else ['fast', 'slow'])
+
+
+# Both machine-readable output and pretty tables are rendered in a phase
+@pytest.mark.parametrize('output', ['json', 'table'])
+def test_profile(mock_client, flavors_response, capsys, output):
+    def request(method, path, **kwargs):
+        mock_client.metrics.record_request(method, path, 200, 0.005)
+        return flavors_response
+
+    mock_client._request.side_effect = request
+
+    # Building the table's rows counts as rendering too
+    table_data = util.table_data
+
+    def slow_table_data(*args, **kwargs):
+        time.sleep(0.05)
+        return table_data(*args, **kwargs)
+
+    with patch('sys.argv', ['lava', 'flavors', 'list', '--profile',
+                            '--output', output]), \
+            patch('lavaclient.util.table_data', slow_table_data), \
+            patch('lavaclient.cli.table_data', slow_table_data):
+        main()
+
+    stdout, stderr = capsys.readouterr()
+    assert 'hadoop1-15' in stdout
+
+    lines = stderr.splitlines()
+    assert lines[0] == 'Profile (wall time):'
+    phases = [line.split()[0] for line in lines[1:lines.index('Requests:')]]
+    for name in ('startup', 'parse_argv', 'create_client', 'command',
+                 'render', 'total'):
+        assert name in phases
+    render = [line for line in lines if line.split()[0] == 'render'][0]
+    assert 'calls' not in render
+    if output == 'table':
+        assert float(render.split()[1].rstrip('ms')) >= 50
+    assert lines[-1].split()[1:] == ['200', 'GET', '/flavors']
+
+
+def test_profile_dump(mock_client, flavors_response, tmpdir, capsys):
+    import pstats
+
+    mock_client._request.return_value = flavors_response
+    path = str(tmpdir.join('lava.prof'))
+    with patch('sys.argv', ['lava', 'flavors', 'list', '--profile-dump',
+                            path, '--output', 'json']):
+        main()
+
+    assert pstats.Stats(path).total_calls > 0
+    # Only --profile prints the summary
+    assert not capsys.readouterr()[1]
@@ -254,6 +254,7 @@ def test_nodes(resp_print_table, print_table, mock_client, nodes_response):
     assert kwargs['title'] == 'Components'
 
 
+@patch('lavaclient.util.wait_for_port', MagicMock(return_value=True))
 @patch('subprocess.Popen')
 def test_ssh_proxy(popen, mock_client, cluster_response, nodes_response):
     del nodes_response['nodes'][0]['components'][0]['uri']
@@ -278,6 +279,7 @@ def test_ssh_proxy(popen, mock_client, cluster_response, nodes_response):
 @pytest.mark.parametrize('failure', [None,
                                      socks.ProxyConnectionError,
                                      socks.GeneralProxyError])
+@patch('lavaclient.util.wait_for_port', MagicMock(return_value=True))
 @patch('subprocess.Popen')
 @patch('lavaclient.util.test_socks_connection')
 def test_ssh_proxy_errors(test_connection, popen, failure, mock_client,
@@ -323,6 +325,7 @@ def test_ssh_proxy_cmd_fail(popen, mock_client, cluster_response,
 
 
 @pytest.mark.parametrize('error_code', [400, 500])
+@patch('lavaclient.util.wait_for_port', MagicMock(return_value=True))
 @patch('subprocess.Popen')
 @patch('lavaclient.util.test_socks_connection')
 def test_ssh_proxy_http_fail(test_connection, popen, error_code, mock_client,
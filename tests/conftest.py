@@ -1,3 +1,4 @@
+from copy import deepcopy
 from mock import patch, MagicMock
 import pytest
 
@@ -416,3 +417,69 @@ def credentials_response(ssh_key, cloud_files, s3, ambari):
             'ambari': [ambari],
         }
     }
+
+
+@pytest.fixture
+def catalog_api(stacks_response, stack_response, flavors_response,
+                scripts_response, credentials_response):
+    stack_group = stack_response['stack']['node_groups'][0]
+    stack_group['flavor_id'] = 'hadoop1-15'
+    stack_group['resource_limits']['max_count'] = 50
+
+    responses = {
+        '/flavors': flavors_response,
+        'stacks': stacks_response,
+        'stacks/stack_id': stack_response,
+        'scripts': scripts_response,
+        'credentials': credentials_response,
+    }
+
+    def request(method, path, **kwargs):
+        return responses[path]
+
+    return request
+
+
+@pytest.fixture
+def create_many_api(catalog_api, cluster_response, limits_response):
+    """Fake API for create_many; node_count quota fits exactly one cluster
+    with the default stack node group, i.e. 10 nodes, and is used by each
+    cluster until it has finished building"""
+    for field in ('node_count', 'ram', 'vcpus', 'disk'):
+        limits_response['limits']['absolute'][field] = {
+            'limit': 10 ** 6, 'remaining': 10 ** 6}
+    limits_response['limits']['absolute']['node_count'] = {
+        'limit': 15, 'remaining': 15}
+
+    state = {'created': 0, 'building': set()}
+
+    def request(method, path, **kwargs):
+        if path in ('/flavors', 'stacks', 'stacks/stack_id', 'scripts',
+                    'credentials'):
+            return catalog_api(method, path)
+        elif path == '/limits':
+            limits = deepcopy(limits_response)
+            limits['limits']['absolute']['node_count']['remaining'] -= \
+                10 * len(state['building'])
+            return limits
+        elif method == 'POST':
+            state['created'] += 1
+            cluster_id = 'cluster{0}'.format(state['created'])
+            assert not state['building'], 'Quota exceeded'
+            state['building'].add(cluster_id)
+
+            data = deepcopy(cluster_response)
+            data['cluster'].update(id=cluster_id, status='BUILDING')
+            return data
+        elif path == 'clusters':
+            clusters = []
+            for cluster_id in sorted(state['building']):
+                data = deepcopy(cluster_response['cluster'])
+                data.update(id=cluster_id)
+                clusters.append(data)
+            state['building'].clear()
+            return {'clusters': clusters}
+        else:
+            return cluster_response
+
+    return request
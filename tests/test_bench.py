@@ -0,0 +1,78 @@
+import json
+import pytest
+
+from lavaclient import bench
+from lavaclient.fakeapi import FakeServer
+
+
+ALL_OPERATIONS = ('clusters.list,clusters.get,nodes.list,credentials.list,'
+                  'clusters.create,clusters.delete')
+
+
+@pytest.fixture
+def server(request):
+    server = FakeServer(clusters=5).start()
+    request.addfinalizer(server.stop)
+    return server
+
+
+def test_load_generator(server):
+    generator = bench.LoadGenerator(
+        server.client(), bench.parse_mix(ALL_OPERATIONS), threads=4,
+        operations=60, stack_id=server.api.stack_ids[0])
+    results = generator.run()
+
+    operations = results['operations']
+    assert set(operations) == set(ALL_OPERATIONS.split(','))
+    assert sum(operation['count'] + operation['skipped']
+               for operation in operations.values()) == 60
+    assert not any(operation['errors'] for operation in operations.values())
+    for operation in operations.values():
+        if operation['count']:
+            assert operation['p50'] <= operation['p95'] <= operation['p99']
+    assert results['requests']['counters']['requests'] > sum(
+        operation['count'] for operation in operations.values())
+
+    # Clusters created by the benchmark are deleted
+    server.api.transition()
+    assert len(server.api.cluster_ids) == 5
+
+
+def test_load_generator_errors(server):
+    server.api.fail(500, path='flavors')
+    server.api.fail(503, method='GET', path='clusters/*', count=3)
+    generator = bench.LoadGenerator(server.client(),
+                                    bench.parse_mix('clusters.get'),
+                                    threads=2, operations=10)
+    results = generator.run()['operations']['clusters.get']
+
+    assert results['count'] == 10
+    assert results['errors'] == 3
+
+
+@pytest.mark.parametrize('mix', [
+    'nosuchoperation=1',
+    'clusters.list=x',
+    'clusters.list=0',
+])
+def test_parse_mix_errors(mix):
+    pytest.raises(ValueError, bench.parse_mix, mix)
+
+
+def test_main(capsys):
+    assert bench.main(['--fake', '--fake-clusters', '3', '-n', '20', '-t',
+                       '2', '--json']) == 0
+    results = json.loads(capsys.readouterr()[0])
+    assert results['threads'] == 2
+    assert sum(operation['count'] for operation in
+               results['operations'].values()) == 20
+
+    assert bench.main(['--fake', '-n', '5', '--mix', 'clusters.list']) == 0
+    assert 'clusters.list' in capsys.readouterr()[0]
+
+
+def test_main_errors(capsys):
+    assert bench.main(['--mix', 'nosuchoperation']) == 2
+    assert bench.main(['--mix', 'clusters.create', '--token', 'token',
+                       '--endpoint', 'http://localhost/v2/12345']) == 2
+    assert '--stack-id' in capsys.readouterr()[1]
@@ -0,0 +1,130 @@
+import json
+import pytest
+import time
+from mock import patch
+
+from lavaclient import cassette, error
+from lavaclient.cli import main
+from lavaclient.client import Lava
+from lavaclient.fakeapi import FakeServer
+
+
+@pytest.fixture
+def server(request):
+    server = FakeServer(clusters=3).start()
+    request.addfinalizer(server.stop)
+    return server
+
+
+def replay_client(path, **kwargs):
+    return Lava('username', token='token',
+                endpoint='http://replay/v2/tenant',
+                transport=cassette.ReplayTransport(path, **kwargs))
+
+
+@pytest.mark.parametrize('name', ['cassette.jsonl', 'cassette.jsonl.gz'])
+def test_record_replay(server, tmpdir, name):
+    path = str(tmpdir.join(name))
+    lava = server.client(transport=cassette.RecordingTransport(path))
+    clusters = lava.clusters.list()
+    cluster = lava.clusters.get(clusters[0].id)
+    lava.credentials.create_s3('A' * 20, 'hunter2' * 5 + 'x' * 5)
+    lava.credentials.create_cloud_files('username', 'k' * 32)
+
+    interactions = cassette.load(path)
+    assert [(item['method'], item['path'], item['status'])
+            for item in interactions] == [
+        ('GET', 'clusters', 200),
+        ('GET', 'clusters/' + cluster.id, 200),
+        ('POST', 'credentials/s3', 200),
+        ('POST', 'credentials/cloud_files', 200),
+    ]
+
+    # Neither tokens nor secrets are recorded
+    content = json.dumps(interactions)
+    for secret in (lava.token, 'hunter2', 'k' * 32, server.url):
+        assert secret not in content
+    assert interactions[2]['request']['s3']['access_secret_key'] == \
+        'REDACTED'
+    assert interactions[3]['json']['credentials']['cloud_files'][
+        'api_key'] == 'REDACTED'
+
+    replay = replay_client(path)
+    assert [item.id for item in replay.clusters.list()] == \
+        [item.id for item in clusters]
+    assert replay.clusters.get(cluster.id).name == cluster.name
+    assert replay.credentials.create_s3('A' * 20,
+                                        'x' * 40).access_key_id == 'A' * 20
+
+    with pytest.raises(error.RequestError) as exc:
+        replay.flavors.list()
+    assert 'No recorded response' in str(exc.value)
+
+
+def test_replay_order(server, tmpdir):
+    path = str(tmpdir.join('cassette.jsonl'))
+    server.api.build_time = 60
+    lava = server.client(transport=cassette.RecordingTransport(path))
+    cluster = lava.clusters.create('name', server.api.stack_ids[0],
+                                   ssh_keys=['ssh000'], username='username')
+    lava.clusters.get(cluster.id)
+    server.api.transition()
+    lava.clusters.get(cluster.id)
+    server.api.fail(503, path='flavors')
+    pytest.raises(error.RequestError, lava.flavors.list)
+
+    replay = replay_client(path)
+    assert replay.clusters.create('name', server.api.stack_ids[0],
+                                  ssh_keys=['ssh000'],
+                                  username='username').id == cluster.id
+
+    # Responses are replayed in order, repeating the last one
+    assert [replay.clusters.get(cluster.id).status
+            for _ in range(3)] == ['BUILDING', 'ACTIVE', 'ACTIVE']
+
+    with pytest.raises(error.RequestError) as exc:
+        replay.flavors.list()
+    assert exc.value.code == 503
+
+
+def test_replay_timing(tmpdir):
+    path = tmpdir.join('cassette.jsonl')
+    path.write(json.dumps(dict(method='GET', path='flavors', status=200,
+                               elapsed=0.05, json={'flavors': []})) + '\n')
+
+    start = time.time()
+    assert replay_client(str(path)).flavors.list() == []
+    assert time.time() - start < 0.05
+
+    start = time.time()
+    assert replay_client(str(path), timing=True).flavors.list() == []
+    assert time.time() - start >= 0.05
+
+
+def test_scrub():
+    data = {'auth': {'passwordCredentials': {'username': 'user',
+                                             'password': 'secret'}},
+            'items': [{'apiKey': 'key', 'token': {'id': 'token'}}]}
+    assert cassette.scrub(data) == {
+        'auth': {'passwordCredentials': {'username': 'user',
+                                         'password': 'REDACTED'}},
+        'items': [{'apiKey': 'REDACTED', 'token': 'REDACTED'}]}
+
+
+def test_cli_record_replay(server, tmpdir, capsys):
+    path = str(tmpdir.join('cassette.jsonl'))
+    token = server.api.issue_token()
+
+    argv = ['lava', 'flavors', 'list', '--output', 'json']
+    with patch('sys.argv', argv + ['--record', path, '--token', token,
+                                   '--endpoint', server.endpoint]), \
+            patch.dict('os.environ', {'LAVA_NO_DAEMON': '1'}):
+        main()
+    recorded = capsys.readouterr()[0]
+
+    # No credentials are needed to replay
+    with patch('sys.argv', argv + ['--replay', path]), \
+            patch.dict('os.environ', {'LAVA_NO_DAEMON': '1'}, clear=True):
+        main()
+    assert capsys.readouterr()[0] == recorded
+    assert json.loads(recorded)[0]['id'] == 'hadoop1-7'
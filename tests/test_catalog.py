@@ -0,0 +1,110 @@
+import pytest
+import time
+from mock import patch
+
+from lavaclient.fakeapi import FakeServer
+
+
+def test_cached(lavaclient, flavors_response):
+    with patch.object(lavaclient, '_request') as request:
+        request.return_value = flavors_response
+
+        assert list(lavaclient.catalog.flavors()) == ['hadoop1-15']
+        assert list(lavaclient.catalog.flavors()) == ['hadoop1-15']
+        assert request.call_count == 1
+
+        lavaclient.catalog.ttl = 0
+        lavaclient.catalog.flavors()
+        assert request.call_count == 2
+
+
+def test_invalidate_path(lavaclient, scripts_response, stacks_response,
+                         stack_response):
+    responses = {
+        'scripts': scripts_response,
+        'stacks': stacks_response,
+        'stacks/stack_id': stack_response,
+    }
+
+    with patch.object(lavaclient, '_request') as request:
+        request.side_effect = lambda method, path: responses[path]
+
+        lavaclient.catalog.scripts()
+        lavaclient.catalog.stack('stack_id')
+        assert request.call_count == 3
+
+        lavaclient.catalog.invalidate_path('/stacks/stack_id')
+        lavaclient.catalog.scripts()
+        lavaclient.catalog.stack('stack_id')
+        assert request.call_count == 5
+
+
+def test_topology(lavaclient, cluster_response, nodes_response):
+    with patch.object(lavaclient, '_request') as request, \
+            patch('lavaclient.api.response.ssh_to_host') as ssh_to_host:
+        request.side_effect = [cluster_response, nodes_response,
+                               cluster_response,
+                               cluster_response, nodes_response]
+        ssh_to_host.return_value = 'output'
+
+        for _ in range(5):
+            lavaclient.clusters.ssh_execute('cluster_id', 'nodename',
+                                            'uptime')
+        assert request.call_count == 2
+
+        topology = lavaclient.catalog.topology('cluster_id')
+        assert topology.username == 'username'
+        assert topology.component_node('COMPONENT_NAME').name == 'NODENAME'
+        assert topology.component_node('unknown') is None
+
+        # Resizing the cluster changes its topology
+        lavaclient.clusters.resize('cluster_id',
+                                   node_groups=[{'id': 'id', 'count': 2}])
+        lavaclient.clusters.ssh_execute('cluster_id', 'nodename', 'uptime')
+        assert request.call_count == 5
+
+
+@pytest.fixture
+def server(request):
+    server = FakeServer().start()
+    request.addfinalizer(server.stop)
+    return server
+
+
+def test_prefetch(server):
+    server.api.latency = 0.1
+    lava = server.client(prefetch=True)
+    try:
+        start = time.time()
+        assert lava.flavors.list()
+        assert lava.stacks.list()
+        assert lava.distros.list()
+        assert lava.limits.get()
+        # Requested concurrently rather than one after another
+        assert time.time() - start < 0.3
+        assert lava.metrics.counters['prefetch_hits'] == 4
+
+        # Each response is used once
+        assert lava.flavors.list()
+        assert lava.metrics.counters['prefetch_hits'] == 4
+        paths = [request.path.rsplit('/', 1)[-1] for request in server.api.log
+                 if request.method == 'GET']
+        assert sorted(paths) == ['distros', 'flavors', 'flavors', 'limits',
+                                 'stacks']
+    finally:
+        lava.close()
+
+
+def test_prefetch_failed(server):
+    server.api.fail(500, method='GET', path='flavors')
+    lava = server.client(prefetch=['flavors'])
+    try:
+        assert lava.catalog.take_prefetched('stacks') is None
+        assert lava.catalog.flavors()
+        assert 'prefetch_hits' not in lava.metrics.counters
+
+        lava.catalog.prefetch(['flavors'])
+        lava.catalog.invalidate()
+        assert lava.catalog.take_prefetched('flavors') is None
+    finally:
+        lava.close()
@@ -6,45 +6,50 @@ from lavaclient import error
 from lavaclient import __version__
 
 
+def response(status_code=200, content=b''):
+    """Mock response of requests.request"""
+    return MagicMock(status_code=status_code, headers={}, content=content)
+
+
 @patch('uuid.uuid4')
 def test_requests(uuid4, lavaclient):
     uuid4.return_value = 'uuid'
 
-    with patch('requests.request') as request:
+    with patch('requests.request', return_value=response()) as request:
         lavaclient._get('path')
         request.assert_called_with(
             'GET', 'v2/tenant_id/path',
-            verify=False,
+            verify=False, timeout=(10, 60),
             headers={'X-Auth-Token': 'auth_token',
                      'Client-Request-ID': 'uuid',
                      'User-Agent': 'python-lavaclient {0}'.format(
                          __version__)})
 
-    with patch('requests.request') as request:
+    with patch('requests.request', return_value=response()) as request:
         lavaclient._post('path')
         request.assert_called_with(
             'POST', 'v2/tenant_id/path',
-            verify=False,
+            verify=False, timeout=(10, 60),
             headers={'X-Auth-Token': 'auth_token',
                      'Client-Request-ID': 'uuid',
                      'User-Agent': 'python-lavaclient {0}'.format(
                          __version__)})
 
-    with patch('requests.request') as request:
+    with patch('requests.request', return_value=response()) as request:
         lavaclient._put('path')
         request.assert_called_with(
             'PUT', 'v2/tenant_id/path',
-            verify=False,
+            verify=False, timeout=(10, 60),
             headers={'X-Auth-Token': 'auth_token',
                      'Client-Request-ID': 'uuid',
                      'User-Agent': 'python-lavaclient {0}'.format(
                          __version__)})
 
-    with patch('requests.request') as request:
+    with patch('requests.request', return_value=response()) as request:
         lavaclient._delete('path')
         request.assert_called_with(
             'DELETE', 'v2/tenant_id/path',
-            verify=False,
+            verify=False, timeout=(10, 60),
             headers={'X-Auth-Token': 'auth_token',
                      'Client-Request-ID': 'uuid',
                      'User-Agent': 'python-lavaclient {0}'.format(
@@ -55,11 +60,11 @@ def test_requests(uuid4, lavaclient):
 def test_headers(uuid4, lavaclient):
     uuid4.return_value = 'uuid'
 
-    with patch('requests.request') as request:
+    with patch('requests.request', return_value=response()) as request:
         lavaclient._get('path', headers={'foo': 'bar'})
         request.assert_called_with(
             'GET', 'v2/tenant_id/path',
-            verify=False,
+            verify=False, timeout=(10, 60),
             headers={'foo': 'bar',
                      'X-Auth-Token': 'auth_token',
                      'Client-Request-ID': 'uuid',
@@ -82,14 +87,8 @@ def test_reauthenticate(lavaclient):
     with patch('requests.request') as request:
         # First call mocks 401 error, second call goes through
         request.side_effect = [
-            MagicMock(raise_for_status=MagicMock(
-                side_effect=requests.exceptions.HTTPError(
-                    response=MagicMock(status_code=requests.codes.unauthorized)
-                )
-            )),
-            MagicMock(
-                json=MagicMock(return_value={'key': 'value'})
-            )
+            response(requests.codes.unauthorized),
+            response(content=b'{"key": "value"}'),
         ]
         result = lavaclient._get('path')
         assert result == {'key': 'value'}
@@ -109,11 +108,7 @@ def test_reauthenticate_failure(lavaclient):
     )
 
     with patch('requests.request') as request:
-        request.return_value = MagicMock(raise_for_status=MagicMock(
-            side_effect=requests.exceptions.HTTPError(
-                response=MagicMock(status_code=requests.codes.unauthorized)
-            )
-        ))
+        request.return_value = response(requests.codes.unauthorized)
 
         pytest.raises(error.AuthorizationError, lavaclient._get, 'path')
         assert request.call_count == 2
@@ -121,15 +116,8 @@ def test_reauthenticate_failure(lavaclient):
 
 @patch('requests.request')
 def test_http_error(request, lavaclient):
-    request.return_value = MagicMock(
-        raise_for_status=MagicMock(
-            side_effect=requests.exceptions.HTTPError(
-                response=MagicMock(
-                    status_code=requests.codes.internal_server_error
-                )
-            )
-        )
-    )
+    request.return_value = response(requests.codes.internal_server_error,
+                                    b'{"fault": {"message": "Oops"}}')
 
     try:
         lavaclient._get('path')
@@ -139,14 +127,24 @@ def test_http_error(request, lavaclient):
         pytest.fail('Did not catch RequestError')
 
     assert exception.code == requests.codes.internal_server_error
+    assert str(exception) == 'Oops'
 
 
 @patch('requests.request')
 def test_request_exception(request, lavaclient):
-    request.return_value = MagicMock(
-        raise_for_status=MagicMock(
-            side_effect=requests.exceptions.RequestException
-        )
-    )
+    request.side_effect = requests.exceptions.RequestException
 
     pytest.raises(error.RequestError, lavaclient._get, 'path')
+
+
+def test_request_metrics(lavaclient):
+    with patch('requests.request', return_value=response()) as request:
+        lavaclient._get('path')
+
+        request.side_effect = requests.exceptions.ConnectionError
+        pytest.raises(error.RequestError, lavaclient._post, 'path')
+
+    assert [(timing.method, timing.path, timing.status)
+            for timing in lavaclient.metrics.requests] == [
+        ('GET', 'path', 200), ('POST', 'path', None)]
+    assert lavaclient.metrics.counters['requests'] == 2
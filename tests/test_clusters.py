@@ -1,8 +1,12 @@
+import itertools
 import pytest
+import six
+import time
+from copy import deepcopy
 from mock import patch, MagicMock
 
 from lavaclient.api import response
-from lavaclient import error
+from lavaclient import error, util
 
 
 def test_api_list(lavaclient, clusters_response):
@@ -116,3 +120,302 @@ def test_api_clusters_nodes_property(lavaclient, nodes_response,
         for cluster in clusters:
             nodes = cluster.nodes
             assert all(isinstance(node, response.Node) for node in nodes)
+
+
+@patch('time.sleep', MagicMock())
+def test_api_create_many(lavaclient, create_many_api):
+    with patch.object(lavaclient, '_request') as request:
+        request.side_effect = create_many_api
+
+        base = {'stack_id': 'stack_id', 'username': 'user',
+                'ssh_keys': ['mykey']}
+        specs = [dict(base, name=name) for name in ('one', 'two', 'three',
+                                                    'four')]
+        specs[1]['node_groups'] = {'id': {'count': 20}}
+        specs[3]['node_groups'] = [{'id': 'id', 'flavor_id': 'unknown'}]
+
+        results = lavaclient.clusters.create_many(specs)
+
+    assert [result.spec['name'] for result in results] == [
+        'one', 'two', 'three', 'four']
+
+    assert results[0].error is None
+    assert isinstance(results[0].cluster, response.ClusterDetail)
+    assert results[2].error is None
+
+    assert isinstance(results[1].error, error.InvalidError)
+    assert 'exceeds quota' in str(results[1].error)
+    assert isinstance(results[3].error, error.InvalidError)
+
+    # 'three' waits in the queue until 'one' has finished building and the
+    # quota it used is available again
+    calls = [(args[0], args[1],
+              kwargs.get('json', {}).get('cluster', {}).get('name'))
+             for args, kwargs in request.call_args_list
+             if args[1] in ('/limits', 'clusters')]
+    assert calls == [
+        ('GET', '/limits', None),
+        ('POST', 'clusters', 'one'),
+        ('GET', 'clusters', None),
+        ('GET', '/limits', None),
+        ('POST', 'clusters', 'three'),
+        ('GET', 'clusters', None)]
+
+
+def test_api_create_many_no_wait(lavaclient):
+    pytest.raises(error.InvalidError, lavaclient.clusters.create_many,
+                  [{'name': 'name', 'stack_id': 'stack_id', 'wait': True}])
+
+
+@patch('time.sleep', MagicMock())
+def test_api_create_many_timeout(lavaclient, create_many_api,
+                                 cluster_response, limits_response):
+    def api(method, path, **kwargs):
+        if path == '/limits':
+            # Quota is used up once the first cluster has been submitted
+            limits = deepcopy(limits_response)
+            if any(args[0] == 'POST' for args, _ in request.call_args_list):
+                limits['limits']['absolute']['node_count']['remaining'] = 5
+            return limits
+        elif method == 'GET' and path == 'clusters':
+            # The first cluster never finishes building
+            data = deepcopy(cluster_response['cluster'])
+            data.update(id='cluster1', status='BUILDING')
+            return {'clusters': [data]}
+        return create_many_api(method, path, **kwargs)
+
+    with patch.object(lavaclient, '_request') as request, \
+            patch('lavaclient.timeouts.time') as clock:
+        request.side_effect = api
+        # The deadline is set, checked once, and then has passed
+        clock.time.side_effect = itertools.chain([0, 0],
+                                                 itertools.repeat(3600))
+
+        base = {'stack_id': 'stack_id', 'username': 'user',
+                'ssh_keys': ['mykey']}
+        results = lavaclient.clusters.create_many(
+            [dict(base, name='one'), dict(base, name='two')], timeout=30)
+
+    assert results[0].cluster.id == 'cluster1'
+    assert 'did not become active' in str(results[0].error)
+    assert results[1].cluster is None
+    assert isinstance(results[1].error, error.TimeoutError)
+    assert 'not submitted before timeout: insufficient quota' in \
+        str(results[1].error)
+
+
+@patch('time.sleep', MagicMock())
+@pytest.mark.parametrize('validate', [True, False])
+def test_api_create_many_malformed(lavaclient, create_many_api, validate):
+    with patch.object(lavaclient, '_request') as request:
+        request.side_effect = create_many_api
+
+        results = lavaclient.clusters.create_many(
+            [{'name': 'nostack'},
+             {'name': 'extra', 'stack_id': 'stack_id', 'bogus': 1}],
+            validate=validate)
+
+    assert all(isinstance(result.error, error.InvalidError)
+               for result in results)
+    assert 'nostack' in str(results[0].error)
+    assert not any(args[0] == 'POST' for args, _ in request.call_args_list)
+
+
+@pytest.mark.parametrize('kwargs,message', [
+    ({}, None),
+    ({'stack_id': 'unknown'}, 'Invalid stack: unknown'),
+    ({'node_groups': [{'id': 'unknown'}]}, 'Invalid node group'),
+    ({'node_groups': [{'id': 'id', 'count': 100}]}, 'count must be between'),
+    ({'node_groups': [{'id': 'id', 'flavor_id': 'hadoop1-7'}]},
+     'Invalid flavor: hadoop1-7'),
+    ({'user_scripts': ['unknown']}, 'Invalid user script: unknown'),
+    ({'ssh_keys': ['unknown']}, 'Invalid SSH key: unknown'),
+    ({'credentials': [{'cloud_files': 'unknown'}]},
+     'Invalid cloud_files credential: unknown'),
+])
+def test_api_validate(lavaclient, catalog_api, kwargs, message):
+    args = dict(name='name', stack_id='stack_id', username='user',
+                ssh_keys=['mykey'], user_scripts=['id'],
+                credentials=[{'s3': 'access_key_id'}])
+    args.update(kwargs)
+
+    with patch.object(lavaclient, '_request') as request:
+        request.side_effect = catalog_api
+
+        if message is None:
+            lavaclient.clusters.validate(**args)
+        else:
+            with pytest.raises(error.InvalidError) as exc:
+                lavaclient.clusters.validate(**args)
+            assert message in str(exc.value)
+
+        # Catalog data is only requested once
+        lavaclient.clusters.validate(
+            'name', 'stack_id', username='user', ssh_keys=['mykey'])
+        assert request.call_count <= 5
+
+
+def test_api_ssh_execute_all(lavaclient, cluster_response, node):
+    nodes = []
+    for name, group, ip in (('slave-2', 'slave', '1.1.1.2'),
+                            ('master-1', 'master', '1.1.1.1'),
+                            ('slave-1', 'slave', '1.1.1.3')):
+        data = deepcopy(node)
+        data.update(name=name, node_group=group)
+        data['addresses']['public'][0]['addr'] = ip
+        nodes.append(data)
+
+    def run_on_host(username, host, command, ssh_command=None, timeout=None):
+        assert command == 'uptime'
+        assert timeout == 5
+        if host == '1.1.1.3':
+            raise OSError('ssh not found')
+        return util.SSHResult(1 if host == '1.1.1.2' else 0,
+                              six.b('output ') + six.b(host), False)
+
+    with patch.object(lavaclient, '_request') as request, \
+            patch('lavaclient.api.clusters.run_on_host', run_on_host):
+        request.side_effect = [cluster_response, {'nodes': nodes}] * 2
+
+        results = lavaclient.clusters.ssh_execute_all('cluster_id', 'uptime',
+                                                      timeout=5)
+        assert [result.node for result in results] == [
+            'master-1', 'slave-1', 'slave-2']
+        assert [result.returncode for result in results] == [0, None, 1]
+        assert [result.succeeded for result in results] == [
+            True, False, False]
+        assert results[0].output == u'output 1.1.1.1'
+        assert 'ssh not found' in results[1].output
+
+        results = lavaclient.clusters.ssh_execute_all(
+            'cluster_id', 'uptime', node_group='slave', timeout=5,
+            node_filter=lambda node: node.name.endswith('2'))
+        assert [result.node for result in results] == ['slave-2']
+
+
+def test_run_on_host_timeout():
+    with patch('subprocess.Popen') as popen:
+        proc = popen.return_value
+        proc.returncode = -9
+
+        def communicate():
+            time.sleep(0.2)
+            return six.b(''), None
+
+        proc.communicate.side_effect = communicate
+
+        result = util.run_on_host('user', 'host', 'sleep 10', timeout=0.01)
+        assert result.timed_out
+        assert result.returncode == -9
+        assert proc.kill.called
+        assert popen.call_args[0][0] == [
+            'ssh', '-n', '-o', 'BatchMode=yes', 'user@host', 'sleep 10']
+
+
+def test_api_ssh_execute_output(lavaclient, cluster_response, nodes_response):
+    with patch.object(lavaclient, '_request') as request, \
+            patch('lavaclient.api.response.stream_from_host') as stream:
+        request.side_effect = [cluster_response, nodes_response]
+        stream.return_value = iter([six.b('line 1\n'), six.b('line 2\n')])
+
+        output = six.BytesIO()
+        assert lavaclient.clusters.ssh_execute(
+            'cluster_id', 'NODENAME', 'hdfs dfs -cat file',
+            output=output) is None
+        assert output.getvalue() == six.b('line 1\nline 2\n')
+        assert stream.call_args[0][1:] == ('1.2.3.4', 'hdfs dfs -cat file')
+
+
+@pytest.fixture
+def three_nodes(node):
+    nodes = []
+    for index, (name, group) in enumerate((('slave-2', 'slave'),
+                                           ('gateway-1', 'gateway'),
+                                           ('slave-1', 'slave'))):
+        data = deepcopy(node)
+        data.update(name=name, node_group=group)
+        data['addresses']['public'][0]['addr'] = '1.1.1.{0}'.format(index)
+        data['addresses']['private'][0]['addr'] = '10.0.0.{0}'.format(index)
+        nodes.append(data)
+
+    return {'nodes': nodes}
+
+
+@pytest.mark.parametrize('relay', [None, 'gateway-1'])
+def test_api_distribute(lavaclient, cluster_response, three_nodes, tmpdir,
+                        relay):
+    local = tmpdir.join('app.jar')
+    local.write('contents')
+    checksum = util.file_checksum(str(local))
+
+    commands = []
+    uploads = []
+
+    def run_on_host(username, host, command, ssh_command=None, timeout=None):
+        commands.append((host, command))
+        if command.startswith('sha256sum'):
+            # slave-1 is already up to date
+            if host == '1.1.1.2':
+                return util.SSHResult(0, six.b(checksum + '  /app.jar\n'),
+                                      False)
+            return util.SSHResult(1, six.b(''), False)
+        elif '10.0.0.0' in command:
+            return util.SSHResult(1, six.b('Permission denied'), False)
+        return util.SSHResult(0, six.b(''), False)
+
+    def scp_to_host(username, host, local_path, remote_path, **kwargs):
+        uploads.append(host)
+        assert (local_path, remote_path) == (str(local), '/app.jar')
+        return util.SSHResult(0, six.b(''), False)
+
+    with patch.object(lavaclient, '_request') as request, \
+            patch('lavaclient.api.clusters.run_on_host', run_on_host), \
+            patch('lavaclient.api.clusters.scp_to_host', scp_to_host):
+        request.side_effect = [cluster_response, three_nodes]
+
+        results = lavaclient.clusters.distribute(
+            'cluster_id', str(local), '/app.jar', relay=relay)
+
+    assert [(result.node, result.status) for result in results] == [
+        ('gateway-1', 'copied'),
+        ('slave-1', 'skipped'),
+        ('slave-2', 'failed' if relay else 'copied')]
+
+    if relay:
+        # Uploaded once, then copied over the private network
+        assert uploads == ['1.1.1.1']
+        assert ('1.1.1.1', "scp -q -o BatchMode=yes -- /app.jar "
+                "username@10.0.0.0:/app.jar") in commands
+        assert results[2].output == 'Permission denied'
+    else:
+        assert sorted(uploads) == ['1.1.1.0', '1.1.1.1']
+
+
+def test_api_distribute_relay_failed(lavaclient, cluster_response,
+                                     three_nodes, tmpdir):
+    local = tmpdir.join('app.jar')
+    local.write('contents')
+    checksum = util.file_checksum(str(local))
+
+    def run_on_host(username, host, command, ssh_command=None, timeout=None):
+        # slave-1 is already up to date
+        if host == '1.1.1.2':
+            return util.SSHResult(0, six.b(checksum + '  /app.jar\n'), False)
+        return util.SSHResult(1, six.b(''), False)
+
+    with patch.object(lavaclient, '_request') as request, \
+            patch('lavaclient.api.clusters.run_on_host', run_on_host), \
+            patch('lavaclient.api.clusters.scp_to_host') as scp_to_host:
+        request.side_effect = [cluster_response, three_nodes]
+        scp_to_host.return_value = util.SSHResult(1, six.b('No space'),
+                                                  False)
+
+        results = lavaclient.clusters.distribute(
+            'cluster_id', str(local), '/app.jar', relay='gateway-1')
+
+    assert scp_to_host.call_count == 1
+    assert [(result.node, result.status, result.output)
+            for result in results] == [
+        ('gateway-1', 'failed', 'No space'),
+        ('slave-1', 'skipped', None),
+        ('slave-2', 'failed', 'No space')]
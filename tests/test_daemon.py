@@ -0,0 +1,125 @@
+import json
+import os
+import pytest
+import six
+from threading import Thread
+from mock import patch, MagicMock
+
+from lavaclient import daemon
+from lavaclient.client import Lava
+from lavaclient.cli import main
+
+
+ENDPOINT = 'http://dfw.bigdata.api.rackspacecloud.com/v2/12345'
+
+
+@pytest.fixture
+def daemon_socket(request, tmpdir):
+    path = str(tmpdir.join('daemon.sock'))
+    server = daemon.Daemon(path, idle_timeout=30)
+    thread = Thread(target=server.serve)
+    thread.daemon = True
+    thread.start()
+
+    def stop():
+        daemon.stop(path)
+        thread.join(5)
+
+    request.addfinalizer(stop)
+    return path
+
+
+@pytest.fixture
+def create_client(request, flavors_response):
+    def create(args):
+        client = Lava('username', endpoint=args.endpoint, token=args.token,
+                      _cli_args=args)
+        client._request = MagicMock(return_value=flavors_response)
+        return client
+
+    patcher = patch('lavaclient.cli.create_client', side_effect=create)
+    request.addfinalizer(patcher.stop)
+    return patcher.start()
+
+
+def forward(path, command):
+    stdout, stderr = six.BytesIO(), six.BytesIO()
+    argv = command.split() + ['--token', 'token', '--endpoint', ENDPOINT]
+    status = daemon.forward(argv, path=path, stdout=stdout, stderr=stderr)
+    return status, stdout.getvalue(), stderr.getvalue()
+
+
+def test_forward_not_running(tmpdir):
+    path = str(tmpdir.join('daemon.sock'))
+    assert daemon.forward(['flavors', 'list'], path=path) is None
+    assert daemon.status(path) is None
+    assert not daemon.stop(path)
+
+
+def test_daemon(daemon_socket, create_client):
+    for _ in range(2):
+        status, stdout, stderr = forward(daemon_socket,
+                                         'flavors list --output ndjson')
+        assert status == 0
+        assert json.loads(stdout.decode('utf8'))['id'] == 'hadoop1-15'
+        assert not stderr
+
+    # The client is created once and reused
+    assert create_client.call_count == 1
+    state = daemon.status(daemon_socket)
+    assert state['pid'] == os.getpid()
+    assert state['clients'] == 1
+    assert state['commands'] == 2
+
+
+def test_daemon_errors(daemon_socket, create_client):
+    status, stdout, stderr = forward(daemon_socket, 'flavors nosuchcommand')
+    assert status == 2
+    assert six.b('usage: lava flavors') in stderr
+
+    status, stdout, stderr = forward(daemon_socket, 'clusters get')
+    assert status == 2
+
+    create_client.side_effect = [SystemExit(1)]
+    status, stdout, stderr = forward(daemon_socket, 'flavors list')
+    assert status == 1
+
+
+@pytest.mark.parametrize('argv', [
+    ['shell', '--token', 'token', '--endpoint', ENDPOINT],
+    ['--debug', 'flavors', 'list', '--token', 'token'],
+    # Without credentials, the password is prompted for locally
+    ['flavors', 'list'],
+    # Commands that prompt or run until interrupted use the terminal
+    ['clusters', 'delete', 'cluster_id', '--token', 'token', '--endpoint',
+     ENDPOINT],
+    ['credentials', 'create_ambari', 'username', '--token', 'token',
+     '--endpoint', ENDPOINT],
+    ['clusters', 'ssh_proxy', 'cluster_id', '--token', 'token',
+     '--endpoint', ENDPOINT],
+])
+def test_daemon_fallback(daemon_socket, create_client, argv):
+    with patch.dict('os.environ', clear=True):
+        assert daemon.forward(argv, path=daemon_socket) is None
+    assert not create_client.called
+
+
+@pytest.mark.parametrize('environ,forwarded', [
+    ({}, True),
+    ({'LAVA_NO_DAEMON': '1'}, False),
+])
+def test_main_forward(environ, forwarded):
+    with patch('sys.argv', ['lava', 'flavors', 'list']), \
+            patch.dict('os.environ', environ), \
+            patch('lavaclient.daemon.forward', return_value=3) as forward, \
+            patch('lavaclient.cli.parse_argv',
+                  side_effect=RuntimeError('not forwarded')):
+        if forwarded:
+            with pytest.raises(SystemExit) as exc:
+                main()
+            assert exc.value.code == 3
+            forward.assert_called_once_with(['flavors', 'list'])
+        else:
+            with pytest.raises(RuntimeError):
+                main()
+            assert not forward.called
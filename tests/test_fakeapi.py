@@ -0,0 +1,152 @@
+import pytest
+import time
+
+from lavaclient import error
+from lavaclient.fakeapi import FakeApi, FakeServer
+
+
+@pytest.fixture
+def server(request):
+    server = FakeServer(clusters=3, nodes=2, build_time=60).start()
+    request.addfinalizer(server.stop)
+    return server
+
+
+def statuses(api):
+    return [(request.method, request.path.split('/', 3)[-1], request.status)
+            for request in api.log]
+
+
+def test_resources(server):
+    lava = server.client()
+    assert lava.endpoint == server.endpoint
+
+    clusters = lava.clusters.list()
+    assert [cluster.id for cluster in clusters] == server.api.cluster_ids
+    assert set(cluster.status for cluster in clusters) == set(['ACTIVE'])
+
+    cluster = lava.clusters.get(clusters[0].id)
+    assert sum(group.count for group in cluster.node_groups) == 3
+    assert len(lava.nodes.list(cluster.id)) == 3
+
+    assert len(lava.flavors.list()) == 5
+    assert len(lava.distros.list()) == 2
+    assert lava.distros.get('HDP2.2').services
+    assert len(lava.stacks.list()) == 5
+    assert lava.stacks.get(server.api.stack_ids[0]).node_groups
+    assert len(lava.scripts.list()) == 5
+    assert len(lava.credentials.list_ssh_keys()) == 2
+    assert lava.limits.get().node_count.remaining == 1000 - 9
+
+
+def test_state_transitions(server):
+    lava = server.client()
+    cluster = lava.clusters.create('new', server.api.stack_ids[0],
+                                   ssh_keys=['ssh000'], username='username')
+    assert cluster.status == 'BUILDING'
+    assert lava.clusters.get(cluster.id).status == 'BUILDING'
+    assert set(node.status for node in lava.nodes.list(cluster.id)) == \
+        set(['BUILDING'])
+
+    server.api.transition()
+    assert lava.clusters.get(cluster.id).status == 'ACTIVE'
+
+    lava.clusters.delete(cluster.id)
+    assert lava.clusters.get(cluster.id).status == 'DELETING'
+    server.api.transition()
+    with pytest.raises(error.RequestError) as exc:
+        lava.clusters.get(cluster.id)
+    assert exc.value.code == 404
+
+
+def test_build_time(server):
+    server.api.build_time = 0.05
+    lava = server.client()
+    cluster = lava.clusters.create('new', server.api.stack_ids[0],
+                                   ssh_keys=['ssh000'], username='username')
+    time.sleep(0.1)
+    assert lava.clusters.get(cluster.id).status == 'ACTIVE'
+
+
+def test_token_expiry(server):
+    lava = server.client()
+    lava.flavors.list()
+
+    # The client reauthenticates through the fake Keystone and retries
+    server.api.expire_tokens()
+    lava.flavors.list()
+    assert statuses(server.api)[-4:] == [
+        ('GET', 'flavors', 200),
+        ('GET', 'flavors', 401),
+        ('POST', 'tokens', 200),
+        ('GET', 'flavors', 200),
+    ]
+
+    token_client = server.client(token=server.api.issue_token())
+    server.api.expire_tokens()
+    pytest.raises(error.AuthenticationError, token_client.flavors.list)
+
+
+def test_token_ttl():
+    api = FakeApi(clusters=0, token_ttl=0.01)
+    headers = {'X-Auth-Token': api.issue_token()}
+    assert api.handle('GET', '/v2/12345/flavors', headers)[0] == 200
+    time.sleep(0.02)
+    assert api.handle('GET', '/v2/12345/flavors', headers)[0] == 401
+
+
+def test_failures(server):
+    lava = server.client()
+    server.api.fail(503, method='GET', path='clusters/*', count=2)
+    for _ in range(2):
+        with pytest.raises(error.RequestError) as exc:
+            lava.clusters.get(server.api.cluster_ids[0])
+        assert exc.value.code == 503
+
+    lava.flavors.list()
+    lava.clusters.get(server.api.cluster_ids[0])
+
+    server.api.error_rate = 1
+    with pytest.raises(error.RequestError) as exc:
+        lava.flavors.list()
+    assert exc.value.code == 500
+
+
+def test_quota(server):
+    server.api.node_quota = 10
+    lava = server.client()
+    with pytest.raises(error.RequestError) as exc:
+        lava.clusters.create('new', server.api.stack_ids[0],
+                             ssh_keys=['ssh000'], username='username')
+    assert exc.value.code == 413
+
+
+def test_latency():
+    api = FakeApi(clusters=0,
+                  latency=lambda method, path: 0.05 * path.endswith('limits'))
+    headers = {'X-Auth-Token': api.issue_token()}
+
+    start = time.time()
+    api.handle('GET', '/v2/12345/flavors', headers)
+    assert time.time() - start < 0.05
+
+    start = time.time()
+    api.handle('GET', '/v2/12345/limits', headers)
+    assert time.time() - start >= 0.05
+
+
+@pytest.mark.parametrize('method,path,headers,status', [
+    ('GET', '/v2/12345/flavors', {}, 401),
+    ('GET', '/v2/other/flavors', None, 404),
+    ('GET', '/v2/12345/nosuchpath', None, 404),
+    ('GET', '/v2/12345/clusters/nosuchcluster', None, 404),
+    ('GET', '/v2.0/tokens', {}, 405),
+])
+def test_errors(method, path, headers, status):
+    api = FakeApi(clusters=0)
+    if headers is None:
+        headers = {'X-Auth-Token': api.issue_token()}
+
+    code, data = api.handle(method, path, headers)
+    assert code == status
+    assert data['fault']['code'] == status
@@ -0,0 +1,203 @@
+import itertools
+import pytest
+from copy import deepcopy
+from mock import patch, MagicMock
+
+from lavaclient import error, fleet
+
+
+@pytest.fixture
+def fleet_api(cluster, cluster_detail):
+    """Fake API with three live clusters: `keep` and `grow`, which are in the
+    desired fleet, and `old`, which is not"""
+    live = {}
+    for name, count in (('keep', 1), ('grow', 1), ('old', 1)):
+        detail = deepcopy(cluster_detail)
+        detail.update(id=name + '_id', name=name)
+        detail['node_groups'][0]['count'] = count
+        live[detail['id']] = detail
+
+    calls = []
+
+    def request(method, path, **kwargs):
+        calls.append((method, path, kwargs.get('json')))
+        if path == 'clusters' and method == 'GET':
+            return {'clusters': [
+                dict((key, value) for key, value in data.items()
+                     if key in cluster)
+                for data in live.values()]}
+
+        cluster_id = path.split('/')[-1]
+        if method == 'DELETE':
+            del live[cluster_id]
+        elif method == 'PUT':
+            group = kwargs['json']['cluster']['node_groups'][0]
+            live[cluster_id]['node_groups'][0]['count'] = group['count']
+
+        return {'cluster': live.get(cluster_id)}
+
+    return live, calls, request
+
+
+@pytest.fixture
+def desired():
+    return [
+        {'name': 'keep', 'stack_id': 'stack_id',
+         'node_groups': [{'id': 'id', 'count': 1}]},
+        {'name': 'grow', 'stack_id': 'stack_id',
+         'node_groups': {'id': {'count': 3}}},
+        {'name': 'new', 'stack_id': 'stack_id'},
+    ]
+
+
+def test_plan(lavaclient, fleet_api, desired):
+    live, calls, request = fleet_api
+
+    with patch.object(lavaclient, '_request', side_effect=request):
+        plan = lavaclient.clusters.plan(desired)
+        assert [(action.kind, action.name) for action in plan.actions] == [
+            ('resize', 'grow'), ('create', 'new')]
+        assert plan.resizes[0].spec == [{'id': 'id', 'count': 3, 'from': 1}]
+        assert not plan.conflicts
+
+        plan = lavaclient.clusters.plan(desired, prune=True)
+        assert [(action.kind, action.cluster_id)
+                for action in plan.deletes] == [('delete', 'old_id')]
+
+        desired[0]['stack_id'] = 'other_stack'
+        plan = lavaclient.clusters.plan(desired)
+        assert len(plan.conflicts) == 1
+        assert 'must be recreated' in plan.conflicts[0]
+
+        plan = lavaclient.clusters.plan(desired, replace=True)
+        assert [(action.kind, action.name) for action in plan.actions] == [
+            ('delete', 'keep'), ('create', 'keep'), ('resize', 'grow'),
+            ('create', 'new')]
+
+    assert all(method == 'GET' for method, _, _ in calls)
+
+
+@patch('time.sleep', MagicMock())
+def test_reconcile(lavaclient, fleet_api, desired, cluster_response):
+    live, calls, request = fleet_api
+    created = []
+
+    def create_many(specs, **kwargs):
+        created.extend(spec['name'] for spec in specs)
+        return [fleet.ActionResult(None, MagicMock(), None) for _ in specs]
+
+    with patch.object(lavaclient, '_request', side_effect=request), \
+            patch.object(lavaclient.clusters, 'create_many', create_many):
+        report = lavaclient.clusters.reconcile(desired, prune=True)
+
+    assert report.succeeded
+    assert [result.action.kind for result in report.results] == [
+        'resize', 'create', 'delete']
+    assert created == ['new']
+    assert sorted(live) == ['grow_id', 'keep_id']
+    assert live['grow_id']['node_groups'][0]['count'] == 3
+
+
+def test_reconcile_dry_run(lavaclient, fleet_api, desired):
+    live, calls, request = fleet_api
+
+    with patch.object(lavaclient, '_request', side_effect=request):
+        report = lavaclient.clusters.reconcile(desired, prune=True,
+                                               dry_run=True)
+
+    assert len(report.plan) == 3
+    assert not report.results
+    assert all(method == 'GET' for method, _, _ in calls)
+
+
+@patch('time.sleep', MagicMock())
+def test_reconcile_create_many(lavaclient, fleet_api, create_many_api,
+                               desired):
+    live, calls, fleet_request = fleet_api
+
+    def request(method, path, **kwargs):
+        if path in ('/flavors', 'stacks', 'stacks/stack_id', 'scripts',
+                    'credentials', '/limits'):
+            return create_many_api(method, path)
+        elif method == 'POST' and path == 'clusters':
+            detail = deepcopy(live['keep_id'])
+            detail.update(id='new_id', name=kwargs['json']['cluster']['name'],
+                          status='BUILDING')
+            live['new_id'] = detail
+            return {'cluster': detail}
+
+        response = fleet_request(method, path, **kwargs)
+        if method == 'GET' and path == 'clusters':
+            # Clusters finish building by the next poll
+            for detail in live.values():
+                detail['status'] = 'ACTIVE'
+        return response
+
+    desired[2].update(username='user', ssh_keys=['mykey'])
+    with patch.object(lavaclient, '_request', side_effect=request):
+        report = lavaclient.clusters.reconcile(desired, prune=True)
+
+    assert report.succeeded, report.to_dict()
+    assert [(result.action.kind, result.cluster and result.cluster.id)
+            for result in report.results] == [
+        ('resize', 'grow_id'), ('create', 'new_id'), ('delete', None)]
+    assert sorted(live) == ['grow_id', 'keep_id', 'new_id']
+
+
+@pytest.mark.parametrize('desired,message', [
+    ([{'stack_id': 'stack_id'}], 'missing name'),
+    ({'new': {'node_groups': []}}, 'new is missing stack_id'),
+])
+def test_plan_invalid(lavaclient, desired, message):
+    with patch.object(lavaclient, '_request') as request:
+        with pytest.raises(error.InvalidError) as exc:
+            lavaclient.clusters.plan(desired)
+        assert message in str(exc.value)
+        assert not request.called
+
+
+@patch('time.sleep', MagicMock())
+def test_wait_many(lavaclient, cluster, cluster_detail):
+    polls = [
+        {'a': 'BUILDING', 'b': 'BUILDING', 'c': 'BUILDING'},
+        {'a': 'ACTIVE', 'b': 'ERROR', 'c': 'BUILDING'},
+    ]
+
+    def request(method, path, **kwargs):
+        if path == 'clusters':
+            statuses = polls.pop(0) if len(polls) > 1 else polls[0]
+            return {'clusters': [dict(cluster, id=cluster_id, status=status)
+                                 for cluster_id, status in
+                                 sorted(statuses.items())]}
+        return {'cluster': dict(cluster_detail, id=path.split('/')[-1])}
+
+    with patch.object(lavaclient, '_request', side_effect=request):
+        with patch('lavaclient.timeouts.time') as clock:
+            # Third poll happens after the timeout has expired
+            clock.time.side_effect = itertools.chain([0, 0, 0],
+                                                     itertools.repeat(3600))
+            results = lavaclient.clusters.wait_many(
+                ['a', 'b', 'c', 'gone'], timeout=30)
+
+    assert results[0][0].id == 'a' and results[0][1] is None
+    assert isinstance(results[1][1], error.FailedError)
+    assert isinstance(results[2][1], error.TimeoutError)
+    assert results[2][0] is None
+    assert 'was deleted' in str(results[3][1])
+
+
+@patch('time.sleep', MagicMock())
+def test_wait_many_deleted(lavaclient, cluster):
+    polls = [{'a': 'DELETING', 'b': 'ERROR'}, {}]
+
+    def request(method, path, **kwargs):
+        statuses = polls.pop(0)
+        return {'clusters': [dict(cluster, id=cluster_id, status=status)
+                             for cluster_id, status in statuses.items()]}
+
+    with patch.object(lavaclient, '_request', side_effect=request):
+        results = lavaclient.clusters.wait_many(['a', 'b'], deleted=True)
+
+    assert results[0] == (None, None)
+    assert isinstance(results[1][1], error.FailedError)
+    assert not polls
@@ -0,0 +1,108 @@
+import itertools
+import pytest
+import threading
+import time
+
+from lavaclient import error
+from lavaclient.fakeapi import FakeServer
+from lavaclient.hedging import Hedging
+from lavaclient.metrics import Metrics
+
+
+@pytest.fixture
+def server(request):
+    server = FakeServer(clusters=3).start()
+    request.addfinalizer(server.stop)
+    return server
+
+
+def slow_first(seconds):
+    """Fake API latency that delays the first request to /flavors"""
+    counter = itertools.count()
+    lock = threading.Lock()
+
+    def latency(method, path):
+        if not path.endswith('/flavors'):
+            return 0
+        with lock:
+            number = next(counter)
+        return seconds if number == 0 else 0
+
+    return latency
+
+
+def test_hedge_wins(server):
+    lava = server.client(hedge=Hedging(delay=0.05, budget=1))
+    try:
+        server.api.latency = slow_first(1)
+
+        start = time.time()
+        assert lava.flavors.list()
+        assert time.time() - start < 0.5
+
+        assert lava.metrics.counters['hedges'] == 1
+        assert lava.metrics.counters['hedge_wins'] == 1
+    finally:
+        lava.close()
+
+
+def test_hedge_budget(server):
+    lava = server.client(hedge=Hedging(delay=0.05, budget=0.5))
+    try:
+        # The first GET earns only half a hedge
+        server.api.latency = slow_first(0.2)
+        assert lava.flavors.list()
+        assert lava.metrics.counters['hedges_skipped'] == 1
+        assert 'hedges' not in lava.metrics.counters
+
+        server.api.latency = slow_first(1)
+        assert lava.flavors.list()
+        assert lava.metrics.counters['hedges'] == 1
+    finally:
+        lava.close()
+
+
+def test_hedge_not_get(server):
+    lava = server.client(hedge=Hedging(delay=0, budget=1))
+    try:
+        server.api.latency = 0.05
+        lava.clusters.create('name', server.api.stack_ids[0],
+                             ssh_keys=['ssh000'], username='username')
+        assert 'hedges' not in lava.metrics.counters
+    finally:
+        lava.close()
+
+
+def test_percentile_delay():
+    hedging = Hedging(min_samples=3, percentile=50)
+    metrics = Metrics()
+    assert hedging._delay(metrics) is None
+
+    for latency in (0.1, 0.2, 0.3):
+        metrics.record_request('GET', '/flavors', 200, latency)
+    hedging._requests = 0
+    assert hedging._delay(metrics) == pytest.approx(0.2)
+
+    assert Hedging(delay=0.5)._delay(metrics) == 0.5
+    assert Hedging(min_samples=3, min_delay=1)._delay(metrics) == 1
+
+
+def test_first_attempt_fails():
+    hedging = Hedging(delay=0.01, budget=1)
+    metrics = Metrics()
+
+    def send(attempt):
+        if attempt == 0:
+            time.sleep(0.05)
+            raise error.RequestError('Failed')
+        time.sleep(0.1)
+        return 'response'
+
+    assert hedging.call(send, metrics) == 'response'
+    assert metrics.counters['hedge_wins'] == 1
+
+    def fail(attempt):
+        raise error.RequestError('Failed {0}'.format(attempt))
+
+    with pytest.raises(error.RequestError):
+        Hedging(delay=0.01, budget=1).call(fail, metrics)
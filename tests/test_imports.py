@@ -0,0 +1,49 @@
+import json
+import os
+import pytest
+import subprocess
+import sys
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules that should only be imported when they are used
+DEFERRED_MODULES = ('keystoneclient', 'requests', 'socks', 'sockshandler',
+                    'prettytable')
+
+# Seconds allowed for `import lavaclient`; importing keystoneclient and
+# requests alone takes longer than this
+IMPORT_BUDGET = float(os.environ.get('LAVA_IMPORT_BUDGET', 0.25))
+
+SCRIPT = """
+import json, sys, time
+start = time.time()
+{0}
+elapsed = time.time() - start
+print(json.dumps(dict(elapsed=elapsed,
+                      modules=sorted(set(name.split('.')[0]
+                                         for name in sys.modules)))))
+"""
+
+
+def run(code):
+    output = subprocess.check_output([sys.executable, '-c',
+                                      SCRIPT.format(code)], cwd=ROOT)
+    return json.loads(output.decode('utf8'))
+
+
+@pytest.mark.parametrize('code', [
+    'import lavaclient',
+    'import lavaclient.cli; lavaclient.cli.parse_argv(["clusters", "list"])',
+    "from lavaclient import Lava; "
+    "Lava('user', token='token', endpoint='http://localhost/v2/tenant')",
+])
+def test_deferred_imports(code):
+    modules = run(code)['modules']
+    assert 'lavaclient' in modules
+    assert not set(DEFERRED_MODULES) & set(modules)
+
+
+def test_import_budget():
+    elapsed = min(run('import lavaclient')['elapsed'] for _ in range(3))
+    assert elapsed < IMPORT_BUDGET
@@ -0,0 +1,98 @@
+import pytest
+import six
+import time
+from mock import patch
+
+from lavaclient import metrics
+
+
+@pytest.fixture
+def profiler(request):
+    request.addfinalizer(metrics.stop_profiling)
+    return metrics.start_profiling()
+
+
+@pytest.mark.parametrize('pct,expected', [
+    (0, 1),
+    (50, 5),
+    (95, 10),
+    (99, 10),
+    (100, 10),
+])
+def test_percentile(pct, expected):
+    assert metrics.percentile(list(range(10, 0, -1)), pct) == expected
+
+
+def test_percentile_empty():
+    assert metrics.percentile([], 50) is None
+    assert metrics.Metrics().percentile(50) is None
+
+
+def test_metrics():
+    stats = metrics.Metrics(max_requests=3)
+    for index in range(4):
+        stats.record_request('get', 'clusters', 200, float(index))
+    stats.record_request('POST', 'clusters', None, 10.0)
+    stats.increment('hedges')
+
+    assert stats.latencies() == [2.0, 3.0, 10.0]
+    assert stats.latencies('GET') == [2.0, 3.0]
+    assert stats.percentile(50, method='get') == 2.0
+    assert stats.to_dict() == {
+        'counters': {'requests': 5, 'hedges': 1},
+        'latency': {'p50': 3.0, 'p95': 10.0, 'p99': 10.0},
+    }
+
+
+def test_phase_disabled():
+    assert metrics._profiler is None
+    with metrics.phase('http'):
+        pass
+
+
+def test_profiler(profiler):
+    times = iter([0.0, 1.0, 3.0, 6.0, 6.5, 7.0, 20.0])
+    with patch('time.time', lambda: next(times)):
+        with metrics.phase('command'):
+            with metrics.phase('http'):
+                pass
+            with metrics.phase('http'):
+                pass
+        metrics.Metrics().record_request('get', '/flavors', 200, 0.25)
+        profiler.started = 0.0
+        lines = profiler.summary()
+
+    # Time of nested phases is excluded from the outer one
+    assert profiler.totals == {'command': 4.5, 'http': 2.5}
+    assert profiler.order == ['http', 'command']
+    assert lines == [
+        'Profile (wall time):',
+        '  http                2500.0ms  (2 calls)',
+        '  command             4500.0ms',
+        '  total              20000.0ms',
+        'Requests:',
+        '      250.0ms  200 GET /flavors',
+    ]
+
+    out = six.StringIO()
+    profiler.print_summary(file=out)
+    assert out.getvalue().splitlines()[0] == 'Profile (wall time):'
+
+
+def test_profiler_same_phase(profiler):
+    times = iter([0.0, 2.0])
+    with patch('time.time', lambda: next(times)):
+        with metrics.phase('render'):
+            with metrics.phase('render'):
+                pass
+
+    # A phase nested in one of the same name is part of it
+    assert profiler.totals == {'render': 2.0}
+    assert profiler.counts == {'render': 1}
+
+
+def test_process_started():
+    started = metrics.process_started()
+    if started is None:
+        pytest.skip('/proc is not available')
+    assert 0 <= time.time() - started < 24 * 3600
@@ -0,0 +1,192 @@
+import gc
+import os
+import pytest
+import weakref
+from mock import patch, MagicMock
+
+from lavaclient import error, ssh
+
+
+def test_multiplexer_command():
+    multiplexer = ssh.Multiplexer(idle_timeout=60)
+    try:
+        command = multiplexer.command('user', 'host', 'ssh -F config')
+        assert command[:3] == ['ssh', '-F', 'config']
+        assert 'ControlMaster=auto' in command
+        assert 'ControlPersist=60' in command
+
+        path = [opt for opt in command if opt.startswith('ControlPath=')][0]
+        assert os.path.dirname(path.split('=', 1)[1]) == \
+            multiplexer._control_dir
+
+        # One control socket per user and host
+        assert multiplexer.command('user', 'host', 'ssh -F config') == command
+        assert multiplexer.command('other', 'host', 'ssh -F config') != \
+            command
+        assert multiplexer.command('user', 'host2', 'ssh -F config') != \
+            command
+    finally:
+        multiplexer.close()
+
+
+def test_multiplexer_close():
+    multiplexer = ssh.Multiplexer()
+    command = multiplexer.command('user', 'host')
+    control_dir = multiplexer._control_dir
+    path = [opt for opt in command
+            if opt.startswith('ControlPath=')][0].split('=', 1)[1]
+
+    # Pretend the master connection was established
+    open(path, 'w').close()
+    multiplexer.command('user', 'other')
+
+    with patch('subprocess.call') as call:
+        multiplexer.close()
+
+    assert call.call_count == 1
+    args = call.call_args[0][0]
+    assert args[0] == 'ssh'
+    assert args[-3:] == ['-O', 'exit', 'user@host']
+    assert not os.path.exists(control_dir)
+
+
+def test_multiplexer_collected():
+    multiplexer = ssh.Multiplexer()
+    command = multiplexer.command('user', 'host')
+    control_dir = multiplexer._control_dir
+    path = [opt for opt in command
+            if opt.startswith('ControlPath=')][0].split('=', 1)[1]
+    open(path, 'w').close()
+
+    # A multiplexer that is never closed shuts down its masters once it is
+    # garbage collected
+    ref = weakref.ref(multiplexer)
+    with patch('subprocess.call') as call:
+        del multiplexer
+        gc.collect()
+
+    assert ref() is None
+    assert call.call_args[0][0][-3:] == ['-O', 'exit', 'user@host']
+    assert not os.path.exists(control_dir)
+
+
+def test_ssh_execute_multiplexed(lavaclient, cluster_response,
+                                 nodes_response):
+    lavaclient.ssh_multiplexer = ssh.Multiplexer()
+    with patch.object(lavaclient, '_request') as request, \
+            patch('lavaclient.api.response.ssh_to_host') as ssh_to_host:
+        request.side_effect = [cluster_response, nodes_response]
+        ssh_to_host.return_value = 'output'
+
+        assert lavaclient.clusters.ssh_execute(
+            'cluster_id', 'NODENAME', 'uptime') == 'output'
+
+        ssh_command = ssh_to_host.call_args[1]['ssh_command']
+        assert ssh_command[0] == 'ssh'
+        assert 'ControlMaster=auto' in ssh_command
+
+        with patch.object(lavaclient.ssh_multiplexer, 'close') as close:
+            with lavaclient:
+                pass
+            close.assert_called_once_with()
+
+    lavaclient.close()
+    assert lavaclient.ssh_multiplexer._control_dir is None
+
+
+def test_tunnel_pool(lavaclient, cluster_response, nodes_response):
+    processes = []
+
+    def create_ssh_tunnel(username, node, local_port, remote_port,
+                          ssh_command=None):
+        process = MagicMock()
+        process.poll.return_value = None
+        processes.append((local_port, process))
+        return process
+
+    with patch.object(lavaclient, '_request') as request, \
+            patch('lavaclient.ssh.create_ssh_tunnel', create_ssh_tunnel):
+        request.side_effect = [cluster_response, nodes_response] * 2 + [{}]
+
+        tunnel = lavaclient.tunnels.tunnel('cluster_id', 10000,
+                                           component='component_name')
+        assert tunnel.alive
+        assert tunnel.node.name == 'NODENAME'
+        assert tunnel.local_port == processes[0][0]
+
+        # Healthy tunnels are reused
+        assert lavaclient.tunnels.tunnel(
+            'cluster_id', 10000, component='Component_Name') is tunnel
+        assert len(processes) == 1
+
+        # Dead tunnels are restarted on the same port
+        processes[0][1].poll.return_value = 1
+        restarted = lavaclient.tunnels.tunnel('cluster_id', 10000,
+                                              component='component_name')
+        assert restarted.alive
+        assert len(processes) == 2
+        assert restarted.local_port == tunnel.local_port
+
+        lavaclient.clusters.delete('cluster_id')
+        assert processes[1][1].kill.called
+        assert lavaclient.tunnels.tunnels() == []
+
+
+def test_tunnel_pool_close(lavaclient, cluster_response, nodes_response):
+    with patch.object(lavaclient, '_request') as request, \
+            patch('lavaclient.ssh.create_socks_proxy') as create_socks_proxy:
+        request.side_effect = [cluster_response, nodes_response]
+        create_socks_proxy.return_value.poll.return_value = None
+
+        proxy = lavaclient.tunnels.proxy('cluster_id')
+        assert create_socks_proxy.call_args[0][:3] == (
+            'username', '1.2.3.4', proxy.local_port)
+        assert create_socks_proxy.call_args[1]['test_url'] == 'http://host'
+
+        lavaclient.close()
+        assert create_socks_proxy.return_value.kill.called
+
+
+def test_tunnel_pool_collected():
+    client = MagicMock()
+    pool = ssh.TunnelPool(client)
+    process = MagicMock()
+    process.poll.return_value = None
+
+    # The tunnel's node refers to the client, which refers to the pool
+    node = MagicMock(client=client)
+    client.tunnels = pool
+    tunnel = pool._get(('cluster_id', 'node', 22),
+                       lambda local_port, node=node: (process, node))
+    assert tunnel.alive
+
+    ref = weakref.ref(pool)
+    del client, pool, tunnel, node
+    gc.collect()
+
+    assert ref() is None
+    assert process.kill.called
+
+
+def test_tunnel_pool_proxies(lavaclient):
+    def proxy(cluster_id, wait=False):
+        if cluster_id == 'bad':
+            raise error.ProxyError('Failed to establish SOCKS proxy')
+        return cluster_id
+
+    with patch.object(lavaclient.tunnels, 'proxy', side_effect=proxy):
+        results = lavaclient.tunnels.proxies(['one', 'bad', 'two'])
+
+    assert [result for result, _ in results] == ['one', None, 'two']
+    assert isinstance(results[1][1], error.ProxyError)
+
+
+@pytest.mark.parametrize('kwargs', [
+    {},
+    {'node_name': 'NODENAME', 'component': 'component_name'},
+])
+def test_tunnel_pool_invalid(lavaclient, kwargs):
+    with patch.object(lavaclient, '_request') as request:
+        with pytest.raises(error.InvalidError):
+            lavaclient.tunnels.tunnel('cluster_id', 80, **kwargs)
+        assert not request.called
@@ -0,0 +1,163 @@
+import pytest
+import six
+import sys
+import threading
+import time
+from mock import patch
+
+from lavaclient import error, timeouts, util
+from lavaclient.fakeapi import FakeServer
+
+
+@pytest.fixture
+def server(request):
+    server = FakeServer(clusters=3, build_time=60).start()
+    request.addfinalizer(server.stop)
+    return server
+
+
+def test_deadline_nesting():
+    assert timeouts.current_deadline() is None
+
+    with timeouts.deadline(10) as outer:
+        assert timeouts.current_deadline() is outer
+        assert 9 < outer.remaining() <= 10
+
+        # An earlier enclosing deadline still applies
+        with timeouts.deadline(60) as inner:
+            assert inner is outer
+        with timeouts.deadline(None) as inner:
+            assert inner is outer
+        with timeouts.deadline(1) as inner:
+            assert inner is not outer
+            assert timeouts.remaining() <= 1
+            assert timeouts.remaining(0.5) == 0.5
+
+        assert timeouts.current_deadline() is outer
+
+    assert timeouts.current_deadline() is None
+    assert timeouts.remaining() is None
+    assert timeouts.remaining(5) == 5
+
+
+def test_request_timeout():
+    default = timeouts.normalize(30)
+    assert default == (30, 30)
+    assert timeouts.request_timeout(default, 'GET /') == (30, 30)
+
+    with timeouts.timeout((1, None)):
+        assert timeouts.request_timeout(default, 'GET /') == (1, None)
+        with timeouts.timeout(None):
+            assert timeouts.request_timeout(default, 'GET /') is None
+        with timeouts.deadline(5):
+            connect, read = timeouts.request_timeout(default, 'GET /')
+            assert connect == 1 and 4 < read <= 5
+
+    assert timeouts.request_timeout(default, 'GET /') == (30, 30)
+
+    with timeouts.deadline(0):
+        with pytest.raises(error.TimeoutError) as exc:
+            timeouts.request_timeout(default, 'GET /clusters')
+        assert str(exc.value) == 'GET /clusters: Deadline exceeded'
+
+
+def test_propagate():
+    seen = []
+
+    def record(item):
+        seen.append((item, timeouts.current_deadline()))
+        return threading.current_thread()
+
+    with timeouts.deadline(10) as limit:
+        threads = [thread for thread, _ in
+                   util.parallel_map(record, range(4), concurrency=4)]
+
+    assert set(deadline for _, deadline in seen) == set([limit])
+    assert threading.current_thread() not in threads
+    assert timeouts.current_deadline() is None
+
+
+@pytest.mark.parametrize('transport', [
+    'requests', 'urllib3',
+    pytest.param('asyncio', marks=pytest.mark.skipif(
+        sys.version_info < (3, 4), reason='Requires asyncio'))])
+def test_client_timeout(server, transport):
+    lava = server.client(transport=transport, timeout=0.1)
+    try:
+        server.api.latency = 0.5
+        with pytest.raises(error.TimeoutError) as exc:
+            lava.flavors.list()
+        assert str(exc.value) == 'GET /flavors: Timed out'
+        assert lava.metrics.counters['timeouts'] == 1
+
+        with timeouts.timeout(5):
+            assert lava.flavors.list()
+
+        # The deadline shortens the client's timeout
+        with timeouts.timeout(5), timeouts.deadline(0.1):
+            pytest.raises(error.TimeoutError, lava.flavors.list)
+        assert lava.metrics.counters['timeouts'] == 2
+    finally:
+        lava.close()
+
+
+def test_wait_deadline(server):
+    lava = server.client()
+    cluster = lava.clusters.create('name', server.api.stack_ids[0],
+                                   ssh_keys=['ssh000'], username='username')
+
+    start = time.time()
+    with timeouts.deadline(0.5):
+        pytest.raises(error.TimeoutError, lava.clusters.wait, cluster.id,
+                      timeout=60)
+        results = lava.clusters.wait_many([cluster.id], timeout=60)
+    assert time.time() - start < 1
+    assert isinstance(results[0][1], error.TimeoutError)
+
+    with timeouts.deadline(0):
+        pytest.raises(error.TimeoutError, lava.clusters.get, cluster.id)
+
+
+def test_ssh_deadline():
+    with patch('subprocess.Popen') as popen:
+        proc = popen.return_value
+        proc.returncode = -9
+
+        def communicate():
+            time.sleep(0.2)
+            return six.b(''), None
+
+        proc.communicate.side_effect = communicate
+
+        with timeouts.deadline(0.01):
+            result = util.run_on_host('user', 'host', 'sleep 10', timeout=60)
+            assert result.timed_out
+            assert proc.kill.called
+
+            pytest.raises(error.TimeoutError, util.ssh_to_host, 'user',
+                          'host', command='sleep 10')
+
+
+def test_wait_request_timeout(server):
+    lava = server.client(timeout=0.1)
+    cluster = lava.clusters.create('name', server.api.stack_ids[0],
+                                   ssh_keys=['ssh000'], username='username')
+
+    # A slow request is not mistaken for the end of the wait
+    server.api.latency = 0.5
+    with pytest.raises(error.TimeoutError) as exc:
+        lava.clusters.wait_many([cluster.id], timeout=None)
+    assert str(exc.value) == 'GET /clusters: Timed out'
+
+    with pytest.raises(error.TimeoutError) as exc:
+        lava.clusters.wait_many([cluster.id], timeout=60)
+    assert str(exc.value) == 'GET /clusters: Timed out'
+
+    server.api.latency = lambda method, path: \
+        0.5 if method == 'GET' and path.endswith('/clusters') else 0
+    spec = dict(name='other', stack_id=server.api.stack_ids[0],
+                ssh_keys=['key000'], username='username')
+    with pytest.raises(error.TimeoutError) as exc, \
+            patch('lavaclient.api.clusters.MIN_INTERVAL', 0):
+        lava.clusters.create_many([spec], interval=0)
+    assert str(exc.value) == 'GET /clusters: Timed out'
@@ -0,0 +1,142 @@
+import json
+import pytest
+import socket
+import sys
+from mock import patch
+
+from lavaclient import error
+from lavaclient.transport import (get_transport, Response, TransportError,
+                                  RequestsTransport, Urllib3Transport)
+
+
+TRANSPORTS = ['requests', 'urllib3',
+              pytest.param('asyncio', marks=pytest.mark.skipif(
+                  sys.version_info < (3, 4), reason='Requires asyncio'))]
+
+
+@pytest.fixture
+def server(request):
+    from lavaclient.fakeapi import FakeServer
+
+    server = FakeServer(clusters=3).start()
+    request.addfinalizer(server.stop)
+    return server
+
+
+@pytest.fixture(params=TRANSPORTS)
+def transport(request):
+    transport = get_transport(request.param)
+    request.addfinalizer(transport.close)
+    return transport
+
+
+def unused_url():
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return 'http://127.0.0.1:{0}/v2/12345/clusters'.format(port)
+
+
+def test_send(server, transport):
+    headers = {'X-Auth-Token': server.api.issue_token()}
+    resp = transport.send('GET', server.endpoint + '/clusters',
+                          headers=headers)
+    assert resp.status == 200
+    assert resp.headers['content-type'] == 'application/json'
+    assert len(resp.json()['clusters']) == 3
+
+    # Connections are reused
+    for _ in range(3):
+        assert transport.send('GET', server.endpoint + '/flavors',
+                              headers=headers).status == 200
+
+    body = json.dumps({'ssh_keys': {'key_name': 'key',
+                                    'public_key': 'ssh-rsa'}})
+    headers['Content-Type'] = 'application/json'
+    resp = transport.send('POST', server.endpoint + '/credentials/ssh_keys',
+                          headers=headers, body=body.encode('utf8'))
+    assert resp.status == 200
+    assert resp.json()['credentials']['ssh_keys']['key_name'] == 'key'
+
+    resp = transport.send('GET', server.endpoint + '/clusters/missing',
+                          headers=headers)
+    assert resp.status == 404
+    assert resp.json()['fault']['message']
+
+
+def test_send_error(transport):
+    pytest.raises(TransportError, transport.send, 'GET', unused_url())
+
+
+def test_client(server, transport):
+    lava = server.client(transport=transport)
+    assert lava.transport is transport
+    assert len(lava.clusters.list()) == 3
+
+    # Expired tokens are renewed
+    server.api.expire_tokens()
+    assert len(lava.clusters.list()) == 3
+
+    server.api.fail(503, path='flavors', message='Try again')
+    with pytest.raises(error.RequestError) as exc:
+        lava.flavors.list()
+    assert exc.value.code == 503
+    assert str(exc.value) == 'Try again'
+
+    lava._endpoint = unused_url().rsplit('/', 1)[0]
+    with pytest.raises(error.RequestError) as exc:
+        lava.clusters.list()
+    assert 'Error encountered during request' in str(exc.value)
+
+
+@pytest.mark.skipif(sys.version_info < (3, 4), reason='Requires asyncio')
+def test_asyncio_concurrent(server):
+    transport = get_transport('asyncio')
+    try:
+        headers = {'X-Auth-Token': server.api.issue_token()}
+        futures = [transport.submit('GET', server.endpoint + '/clusters',
+                                    headers=headers)
+                   for _ in range(20)]
+        assert [future.result().status for future in futures] == [200] * 20
+    finally:
+        transport.close()
+
+
+@pytest.mark.skipif(sys.version_info < (3, 4), reason='Requires asyncio')
+def test_asyncio_chunked():
+    from lavaclient.aiotransport import _HttpProtocol
+
+    assert _HttpProtocol._chunked(b'4\r\nWiki\r\n5;x=1\r\npedia\r\n0\r\n'
+                                  b'\r\n') == b'Wikipedia'
+    assert _HttpProtocol._chunked(b'4\r\nWiki\r\n5\r\nped') is None
+
+
+def test_verify():
+    with patch('requests.request') as request:
+        request.return_value.configure_mock(status_code=200, headers={},
+                                            content=b'')
+        RequestsTransport().send('GET', 'https://example.com')
+        assert 'verify' not in request.call_args[1]
+        RequestsTransport().send('GET', 'https://example.com', verify=False)
+        assert request.call_args[1]['verify'] is False
+
+    transport = Urllib3Transport()
+    assert transport._manager(False).connection_pool_kw['cert_reqs'] == \
+        'CERT_NONE'
+    assert transport._manager(None) is transport._manager(True)
+    assert transport._manager('ca.pem').connection_pool_kw['ca_certs'] == \
+        'ca.pem'
+
+
+def test_response():
+    resp = Response(200, {}, b'{"key": "\xe2\x98\x83"}')
+    assert resp.json() == {'key': u'\u2603'}
+    pytest.raises(ValueError, Response(500, {}, b'Oops').json)
+
+
+def test_get_transport():
+    transport = Urllib3Transport()
+    assert get_transport(transport) is transport
+    assert isinstance(get_transport(None), RequestsTransport)
+    pytest.raises(error.InvalidError, get_transport, 'carrier-pigeon')
@@ -1,9 +1,12 @@
 import pytest
 import six
-from mock import patch
+import socket
+import socks
+import time
+from mock import patch, MagicMock
 from figgis import Config, Field, ListField
 
-from lavaclient import util
+from lavaclient import util, error, ssh
 
 
 def test_b64encode():
@@ -153,3 +156,132 @@ def test_inject_client():
     assert all(item.foo._client is client for item in conf.two)
     assert all(all(subitem._client is client for subitem in item.bar)
                for item in conf.two)
+
+
+# Runs the remote command locally in place of ssh
+FAKE_SSH = ['sh', '-c', 'eval "$1"']
+
+
+def test_stream_from_host():
+    chunks = util.stream_from_host('user', 'host', "printf 'a\\nb\\nc'",
+                                   ssh_command=FAKE_SSH)
+    assert list(chunks) == [six.b('a\n'), six.b('b\n'), six.b('c')]
+
+    chunks = util.stream_from_host('user', 'host', "printf 'abcdef'",
+                                   ssh_command=FAKE_SSH, chunk_size=4)
+    assert six.b('').join(chunks) == six.b('abcdef')
+
+    chunks = util.stream_from_host('user', 'host', "printf 'a\\nb\\nc'",
+                                   ssh_command=FAKE_SSH, lines=False)
+    assert six.b('').join(chunks) == six.b('a\nb\nc')
+
+
+def test_stream_from_host_failure():
+    chunks = util.stream_from_host('user', 'host', 'echo out; exit 3',
+                                   ssh_command=FAKE_SSH)
+    assert next(chunks) == six.b('out\n')
+    with pytest.raises(error.FailedError) as exc:
+        next(chunks)
+    assert 'status code 3' in str(exc.value)
+
+
+def test_write_stream():
+    output = six.BytesIO()
+    util.write_stream(util.stream_from_host('user', 'host', 'seq 3',
+                                            ssh_command=FAKE_SSH), output)
+    assert output.getvalue() == six.b('1\n2\n3\n')
+
+
+def test_wait_for_port():
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.bind(('127.0.0.1', 0))
+    server.listen(1)
+    port = server.getsockname()[1]
+    try:
+        process = MagicMock(poll=MagicMock(return_value=None))
+        assert util.wait_for_port('127.0.0.1', port, 1, process=process)
+
+        # A listener that isn't ours doesn't count once the process is gone
+        process.poll.return_value = 1
+        assert not util.wait_for_port('127.0.0.1', port, 1, process=process)
+    finally:
+        server.close()
+
+
+def test_wait_for_port_timeout():
+    port = ssh.free_port()
+    start = time.time()
+    assert not util.wait_for_port('127.0.0.1', port, 0.2, interval=0.01)
+    assert 0.2 <= time.time() - start < 2
+
+
+def test_wait_for_port_process_exits():
+    port = ssh.free_port()
+    process = MagicMock(poll=MagicMock(side_effect=[None, None, 255]))
+    start = time.time()
+    assert not util.wait_for_port('127.0.0.1', port, 10, interval=0.01,
+                                  process=process)
+    assert time.time() - start < 2
+    assert process.poll.call_count == 3
+
+
+@patch('subprocess.Popen')
+@patch('lavaclient.util.wait_for_port', MagicMock(return_value=False))
+def test_create_socks_proxy_timeout(popen):
+    popen.return_value.poll.return_value = None
+    with pytest.raises(error.TimeoutError):
+        util.create_socks_proxy('user', 'host', 12345, timeout=0.1)
+    assert popen.return_value.kill.called
+
+
+@patch('subprocess.Popen')
+@patch('lavaclient.util.wait_for_port', MagicMock(return_value=True))
+@patch('lavaclient.util.test_socks_connection')
+def test_create_socks_proxy_probe(test_connection, popen):
+    popen.return_value.poll.return_value = None
+
+    # The end-to-end probe is made exactly once
+    test_connection.side_effect = [socks.ProxyConnectionError('failed'), 200]
+    with pytest.raises(error.ProxyError):
+        util.create_socks_proxy('user', 'host', 12345, test_url='http://host')
+    assert test_connection.call_count == 1
+    assert popen.return_value.kill.called
+
+
+@pytest.mark.parametrize('data,header', [
+    ([[1, 'ab', 1.5], [22, 'abcdef', 10.256]], ['N', 'Name', 'Float value']),
+    ([], ['foo', 'bar']),
+    ([['a\nbb', 3], ['', 10 ** 6]], ['Multi', 'Line']),
+    ([[1, 'x'], ['y', 2.5]], ['Mixed', 'Types']),
+    ([[True, u'caf\xe9'], [False, u'中文']], ['Bool', 'Unicode']),
+])
+@pytest.mark.parametrize('title', [None, 'Title', 'A much longer title'])
+def test_render_table_matches_prettytable(data, header, title):
+    strio = six.StringIO()
+    with patch('sys.stdout', strio):
+        util.print_titled(util.create_table(data, header), title=title)
+
+    assert '\n'.join(util.render_table(data, header, title=title)) + '\n' \
+        == strio.getvalue()
+
+
+@pytest.mark.parametrize('ordered', [True, False])
+def test_parallel_imap(ordered):
+    def func(item):
+        if item == 'fail':
+            raise ValueError(item)
+        time.sleep(item)
+        return item
+
+    outcomes = list(util.parallel_imap(func, [0.2, 'fail', 0],
+                                       concurrency=3, ordered=ordered))
+    indexes = [index for index, _, _ in outcomes]
+    if ordered:
+        assert indexes == [0, 1, 2]
+    else:
+        assert indexes[-1] == 0 and sorted(indexes) == [0, 1, 2]
+
+    outcomes = dict((index, (result, exc)) for index, result, exc in outcomes)
+    assert outcomes[0] == (0.2, None)
+    assert isinstance(outcomes[1][1], ValueError)
+    assert outcomes[2] == (0, None)